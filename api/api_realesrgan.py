@@ -6,9 +6,10 @@ import logging
 import asyncio
 import threading
 import time
+from urllib.parse import quote
 from logging.handlers import TimedRotatingFileHandler
 from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
 # ----------------- 日志配置 -----------------
 LOG_DIR = "logs"
@@ -76,14 +77,9 @@ def run_realesrgan_image(input_path: str, output_dir: str, model_name="RealESRGA
 
     return result
 
-def run_realesrgan_video(input_path: str, output_dir: str, model_name="realesr-animevideov3", suffix: str | None = None):
-    # 检查输入文件
-    if not os.path.exists(input_path):
-        raise RuntimeError(f"输入文件不存在: {input_path}")
-
-    file_size = os.path.getsize(input_path)
-    logger.info(f"输入文件大小: {file_size / 1024 / 1024:.2f} MB")
-
+def build_video_cmd(input_path: str, output_dir: str, model_name="realesr-animevideov3", suffix: str | None = None,
+                    fragmented: bool = False):
+    """构造视频超分命令及其环境变量（只使用一张 GPU）"""
     cmd = [
         "python",
         "inference/inference_realesrgan_video.py",
@@ -94,7 +90,8 @@ def run_realesrgan_video(input_path: str, output_dir: str, model_name="realesr-a
     if suffix:
         cmd.extend(["--suffix", suffix])
     cmd.extend(["--num_process_per_gpu", "1"])
-    logger.info(f"执行命令: {' '.join(cmd)}")
+    if fragmented:
+        cmd.append("--fragmented")
 
     env = os.environ.copy()
     if "CUDA_VISIBLE_DEVICES" in env:
@@ -102,6 +99,20 @@ def run_realesrgan_video(input_path: str, output_dir: str, model_name="realesr-a
     else:
         env["CUDA_VISIBLE_DEVICES"] = "0"
 
+    return cmd, env
+
+def run_realesrgan_video(input_path: str, output_dir: str, model_name="realesr-animevideov3",
+                         suffix: str | None = None):
+    # 检查输入文件
+    if not os.path.exists(input_path):
+        raise RuntimeError(f"输入文件不存在: {input_path}")
+
+    file_size = os.path.getsize(input_path)
+    logger.info(f"输入文件大小: {file_size / 1024 / 1024:.2f} MB")
+
+    cmd, env = build_video_cmd(input_path, output_dir, model_name, suffix)
+    logger.info(f"执行命令: {' '.join(cmd)}")
+
     result = subprocess.run(cmd, capture_output=True, text=True, env=env)
 
     # 记录详细的输出信息
@@ -135,6 +146,129 @@ def run_realesrgan_video(input_path: str, output_dir: str, model_name="realesr-a
 
     return result
 
+def read_log(log_path: str) -> str:
+    """读取推理进程的日志"""
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+async def start_realesrgan_video_stream(input_path: str, output_dir: str, output_path: str,
+                                        poll_interval: float = 0.2):
+    """启动流式推理进程，并等待输出文件生成
+
+    在发送响应头之前等待第一个输出，这样进程在输出之前失败时可以返回错误状态码，
+    而不是返回一个空的 200 响应。
+
+    Returns:
+        asyncio.subprocess.Process: 推理进程
+    """
+    cmd, env = build_video_cmd(input_path, output_dir, fragmented=True)
+    logger.info(f"执行命令（流式）: {' '.join(cmd)}")
+
+    # 子进程输出写入日志文件，避免管道写满阻塞
+    log_path = os.path.join(output_dir, "inference.log")
+    with open(log_path, "w") as log_file:
+        # 子进程持有自己的文件描述符，父进程的文件在启动后即可关闭
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=log_file, stderr=subprocess.STDOUT, env=env)
+
+    try:
+        # 等待输出文件生成
+        while not os.path.exists(output_path) and proc.returncode is None:
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        if proc.returncode is not None and (proc.returncode != 0 or not os.path.exists(output_path)):
+            log = read_log(log_path)
+            raise RuntimeError(f"RealESRGAN 视频流式处理失败 (返回码: {proc.returncode})\n输出: {log}")
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    return proc
+
+class RealESRGANVideoStream:
+    """流式推理的进程及其临时文件
+
+    响应体由 stream_realesrgan_video 发送，结束或客户端中途断开时在其 finally 中清理。
+    如果客户端在响应体开始发送之前断开，生成器不会被执行，finally 也不会运行，
+    因此由看门狗任务在 start_timeout 秒内仍未开始发送时终止进程并清理文件。
+    """
+
+    def __init__(self, proc: asyncio.subprocess.Process, input_path: str, output_dir: str, output_path: str,
+                 start_timeout: float = 30.0):
+        self.proc = proc
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.output_path = output_path
+        self.started = False
+        self.closed = False
+        self.watchdog = asyncio.get_running_loop().create_task(self.close_if_not_started(start_timeout))
+
+    async def close_if_not_started(self, timeout: float):
+        await asyncio.sleep(timeout)
+        if not self.started:
+            logger.info("响应体未开始发送（客户端可能已断开），终止推理进程")
+            await self.close()
+
+    async def close(self):
+        """终止仍在运行的推理进程并清理临时文件，可重复调用"""
+        if self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        if not self.closed:
+            self.closed = True
+            cleanup_files_delayed(self.input_path, self.output_dir, delay=0)
+
+async def stream_realesrgan_video(video_stream: RealESRGANVideoStream, chunk_size: int = 1 << 20,
+                                  poll_interval: float = 0.2):
+    """边处理边返回分片 MP4（fragmented MP4）
+
+    推理脚本以 --fragmented 模式运行，每个分片编码完成后立即追加到输出文件，
+    这里持续读取该文件的新增内容并发送给客户端，首字节时间只取决于第一个分片。
+    进程由 start_realesrgan_video_stream 启动。
+    """
+    video_stream.started = True
+    video_stream.watchdog.cancel()
+    proc = video_stream.proc
+    try:
+        with open(video_stream.output_path, "rb") as f:
+            while True:
+                # 在线程中读取文件，避免阻塞事件循环
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if chunk:
+                    yield chunk
+                    continue
+                if proc.returncode is not None:
+                    # 进程已结束，发送剩余内容后退出
+                    chunk = await asyncio.to_thread(f.read)
+                    if chunk:
+                        yield chunk
+                    break
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        await proc.wait()
+        logger.info(f"命令返回码: {proc.returncode}")
+        if proc.returncode != 0:
+            log = await asyncio.to_thread(read_log, os.path.join(video_stream.output_dir, "inference.log"))
+            error_msg = f"RealESRGAN 视频流式处理失败 (返回码: {proc.returncode})\n输出: {log}"
+            logger.error(error_msg)
+            # 响应头已发送，无法再修改状态码。抛出异常会中断连接（不发送结束分块），
+            # 客户端会得到传输不完整的错误，而不是一个被静默截断的 MP4
+            raise RuntimeError(error_msg)
+        logger.info(f"流式处理完成: {video_stream.output_path}")
+    finally:
+        if proc.returncode is None:
+            # 客户端提前断开连接时终止推理进程
+            logger.info("客户端断开连接，终止推理进程")
+        await video_stream.close()
+
 def cleanup_files_delayed(input_path: str, output_dir: str, delay: int = 10):
     """延迟清理文件，给文件传输留出时间"""
     def cleanup():
@@ -264,7 +398,7 @@ async def superres_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"图片处理失败: {str(e)}")
 
 @app.post("/superres-video")
-async def superres_video(file: UploadFile = File(...)):
+async def superres_video(file: UploadFile = File(...), stream: bool = False):
     unique_id = get_unique_name()
     ext = os.path.splitext(file.filename)[1].lower()
     original_name = os.path.splitext(file.filename)[0]
@@ -287,6 +421,20 @@ async def superres_video(file: UploadFile = File(...)):
             content = await file.read()
             f.write(content)
 
+        if stream:
+            # 流式返回分片 MP4，输出文件名由推理脚本决定: {输入文件名}_out.mp4
+            video_name = os.path.splitext(input_filename)[0]
+            output_path = os.path.join(output_dir, f"{video_name}_out.mp4")
+            final_filename = f"{original_name}_enhanced.mp4"
+            # 在发送响应头之前启动推理，尽早报告失败
+            proc = await start_realesrgan_video_stream(input_path, output_dir, output_path)
+            video_stream = RealESRGANVideoStream(proc, input_path, output_dir, output_path)
+            return StreamingResponse(
+                stream_realesrgan_video(video_stream),
+                media_type="video/mp4",
+                headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(final_filename)}"}
+            )
+
         # 执行 RealESRGAN
         run_realesrgan_video(input_path, output_dir)
 
@@ -41,24 +41,39 @@ class BasicVSR(nn.Module):
         # activation functions
         self.lrelu = nn.LeakyReLU(negative_slope=0.1, inplace=True)
 
-    def get_flow(self, x):
+    def get_flow(self, x, flow_cache=None, frame_keys=None):
         b, n, c, h, w = x.size()
 
         x_1 = x[:, :-1, :, :, :].reshape(-1, c, h, w)
         x_2 = x[:, 1:, :, :, :].reshape(-1, c, h, w)
 
-        flows_backward = self.spynet(x_1, x_2).view(b, n - 1, 2, h, w)
-        flows_forward = self.spynet(x_2, x_1).view(b, n - 1, 2, h, w)
+        if flow_cache is None:
+            flows_backward = self.spynet(x_1, x_2).view(b, n - 1, 2, h, w)
+            flows_forward = self.spynet(x_2, x_1).view(b, n - 1, 2, h, w)
+        else:
+            assert b == 1, 'The flow cache only supports batch size 1.'
+            keys_1, keys_2 = frame_keys[:-1], frame_keys[1:]
+            flows_backward = flow_cache.compute(self.spynet, x_1, x_2, keys_1, keys_2).view(b, n - 1, 2, h, w)
+            flows_forward = flow_cache.compute(self.spynet, x_2, x_1, keys_2, keys_1).view(b, n - 1, 2, h, w)
 
         return flows_forward, flows_backward
 
-    def forward(self, x):
+    def forward(self, x, forward_state=None, return_state_idx=None, flow_cache=None, frame_keys=None):
         """Forward function of BasicVSR.
 
         Args:
             x: Input frames with shape (b, n, c, h, w). n is the temporal dimension / number of frames.
+            forward_state (dict, optional): Hidden state of the forward branch carried over from the frame preceding
+                ``x[:, 0]``, with keys ``frame`` (b, c, h, w) and ``feat`` (b, num_feat, h, w). It is used to process
+                long videos chunk by chunk. Default: None.
+            return_state_idx (int, optional): If given, the forward state at this frame index is returned together
+                with the output, so that it can be passed as ``forward_state`` of the chunk starting at frame
+                ``return_state_idx + 1``. Default: None.
+            flow_cache (FlowCache, optional): Cache of the optical flows. Default: None.
+            frame_keys (list[str], optional): Keys of the n frames in the flow cache, in the form of ``clip/frame``.
+                Only batch size 1 is supported with the flow cache. Default: None.
         """
-        flows_forward, flows_backward = self.get_flow(x)
+        flows_forward, flows_backward = self.get_flow(x, flow_cache, frame_keys)
         b, n, _, h, w = x.size()
 
         # backward branch
@@ -74,7 +89,12 @@ class BasicVSR(nn.Module):
             out_l.insert(0, feat_prop)
 
         # forward branch
-        feat_prop = torch.zeros_like(feat_prop)
+        if forward_state is None:
+            feat_prop = torch.zeros_like(feat_prop)
+        else:
+            flow = self.spynet(x[:, 0, :, :, :], forward_state['frame'])
+            feat_prop = flow_warp(forward_state['feat'], flow.permute(0, 2, 3, 1))
+        state = None
         for i in range(0, n):
             x_i = x[:, i, :, :, :]
             if i > 0:
@@ -83,6 +103,8 @@ class BasicVSR(nn.Module):
 
             feat_prop = torch.cat([x_i, feat_prop], dim=1)
             feat_prop = self.forward_trunk(feat_prop)
+            if i == return_state_idx:
+                state = dict(frame=x_i, feat=feat_prop)
 
             # upsample
             out = torch.cat([out_l[i], feat_prop], dim=1)
@@ -95,9 +117,97 @@ class BasicVSR(nn.Module):
             out += base
             out_l[i] = out
 
+        if return_state_idx is not None:
+            return torch.stack(out_l, dim=1), state
         return torch.stack(out_l, dim=1)
 
 
+def temporal_chunk_forward(net, x, chunk_size, overlap=2, carry_state=False, output_device=None):
+    """Run a recurrent video SR network over a long sequence chunk by chunk.
+
+    The sequence is split into overlapping temporal windows of ``chunk_size`` frames, so the memory does not grow
+    with the number of frames. In the overlapped frames, the output of the later chunk is used for the second half
+    and the earlier one for the first half, so that every kept frame has propagation context from both sides.
+
+    If ``carry_state`` is True, the hidden state of the forward branch is carried across chunk boundaries and the
+    forward propagation is the same as processing the whole sequence at once. In this case, all the overlapped
+    frames are taken from the later chunk. Only :class:`BasicVSR` supports it. The propagation of
+    :class:`BasicVSRPlusPlus` interleaves backward and forward branches, so only the overlap is used for it.
+
+    Args:
+        net (nn.Module): Recurrent video SR network taking input with shape (b, n, c, h, w).
+        x (Tensor): Input frames with shape (b, n, c, h, w). It can stay on CPU; each chunk is moved to the
+            device of ``net``.
+        chunk_size (int): Number of frames in each chunk.
+        overlap (int): Number of frames shared by neighbouring chunks. Default: 2.
+        carry_state (bool): Whether to carry the forward hidden state across chunks. Default: False.
+        output_device (torch.device, optional): Device of the stitched output. Default: None, the device of ``x``.
+
+    Returns:
+        Tensor: Output frames with shape (b, n, c, h', w').
+    """
+    if output_device is None:
+        output_device = x.device
+    outputs = [
+        out.to(output_device) for _, out in iter_temporal_chunks(net, x, chunk_size, overlap, carry_state=carry_state)
+    ]
+    return torch.cat(outputs, dim=1)
+
+
+def iter_temporal_chunks(net, x, chunk_size, overlap=2, carry_state=False, num_frames=None):
+    """Generator version of :func:`temporal_chunk_forward`.
+
+    The stitched outputs are yielded as soon as each chunk is processed, so that they can be saved without keeping
+    the whole output sequence in memory. If ``x`` is a function reading the frames, the inputs are also read chunk by
+    chunk, and the host memory does not grow with the number of frames either.
+
+    Args:
+        net (nn.Module): Recurrent video SR network taking input with shape (b, n, c, h, w).
+        x (Tensor | callable): Input frames with shape (b, n, c, h, w), or a function ``x(start, end)`` returning
+            the frames in [start, end) with shape (b, end - start, c, h, w).
+        chunk_size (int): Number of frames in each chunk.
+        overlap (int): Number of frames shared by neighbouring chunks. Default: 2.
+        carry_state (bool): Whether to carry the forward hidden state across chunks. Default: False.
+        num_frames (int, optional): Number of frames. Required if ``x`` is a function. Default: None.
+
+    Yields:
+        tuple[int, Tensor]: Index of the first frame and the output frames with shape (b, m, c, h', w').
+    """
+    assert 0 <= overlap < chunk_size, f'overlap ({overlap}) should be in [0, chunk_size ({chunk_size})).'
+    device = next(net.parameters()).device
+    if callable(x):
+        assert num_frames is not None, 'num_frames is required when reading frames with a function.'
+        read_frames = x
+    else:
+        num_frames = x.size(1)
+
+        def read_frames(start, end):
+            return x[:, start:end]
+
+    n = num_frames
+    stride = chunk_size - overlap
+    # frames of the overlap taken from the earlier chunk
+    num_keep_prev = 0 if carry_state else overlap // 2
+
+    starts = list(range(0, max(n - overlap, 1), stride))
+    state = None
+    for i, start in enumerate(starts):
+        end = min(start + chunk_size, n)
+        x_chunk = read_frames(start, end).to(device)
+        is_last = i == len(starts) - 1
+        if carry_state and not is_last:
+            # the next chunk starts right after frame (starts[i + 1] - 1)
+            out, state = net(x_chunk, forward_state=state, return_state_idx=starts[i + 1] - 1 - start)
+        elif carry_state:
+            out = net(x_chunk, forward_state=state)
+        else:
+            out = net(x_chunk)
+
+        keep_start = 0 if i == 0 else num_keep_prev
+        keep_end = end - start if is_last else starts[i + 1] + num_keep_prev - start
+        yield start + keep_start, out[:, keep_start:keep_end]
+
+
 class ConvResidualBlocks(nn.Module):
     """Conv and residual block used in BasicVSR.
 
@@ -189,14 +299,20 @@ class IconVSR(nn.Module):
 
         return x.view(n, t, c, h + pad_h, w + pad_w)
 
-    def get_flow(self, x):
+    def get_flow(self, x, flow_cache=None, frame_keys=None):
         b, n, c, h, w = x.size()
 
         x_1 = x[:, :-1, :, :, :].reshape(-1, c, h, w)
         x_2 = x[:, 1:, :, :, :].reshape(-1, c, h, w)
 
-        flows_backward = self.spynet(x_1, x_2).view(b, n - 1, 2, h, w)
-        flows_forward = self.spynet(x_2, x_1).view(b, n - 1, 2, h, w)
+        if flow_cache is None:
+            flows_backward = self.spynet(x_1, x_2).view(b, n - 1, 2, h, w)
+            flows_forward = self.spynet(x_2, x_1).view(b, n - 1, 2, h, w)
+        else:
+            assert b == 1, 'The flow cache only supports batch size 1.'
+            keys_1, keys_2 = frame_keys[:-1], frame_keys[1:]
+            flows_backward = flow_cache.compute(self.spynet, x_1, x_2, keys_1, keys_2).view(b, n - 1, 2, h, w)
+            flows_forward = flow_cache.compute(self.spynet, x_2, x_1, keys_2, keys_1).view(b, n - 1, 2, h, w)
 
         return flows_forward, flows_backward
 
@@ -213,7 +329,18 @@ class IconVSR(nn.Module):
             feats_keyframe[i] = self.edvr(x[:, i:i + num_frames].contiguous())
         return feats_keyframe
 
-    def forward(self, x):
+    def forward(self, x, flow_cache=None, frame_keys=None):
+        """Forward function of IconVSR.
+
+        Args:
+            x (Tensor): Input frames with shape (b, n, c, h, w).
+            flow_cache (FlowCache, optional): Cache of the optical flows. Default: None.
+            frame_keys (list[str], optional): Keys of the n frames in the flow cache, in the form of ``clip/frame``.
+                Only batch size 1 is supported with the flow cache. Default: None.
+
+        Returns:
+            Tensor: Output frames with shape (b, n, c, 4h, 4w).
+        """
         b, n, _, h_input, w_input = x.size()
 
         x = self.pad_spatial(x)
@@ -224,7 +351,7 @@ class IconVSR(nn.Module):
             keyframe_idx.append(n - 1)  # last frame is a keyframe
 
         # compute flow and keyframe features
-        flows_forward, flows_backward = self.get_flow(x)
+        flows_forward, flows_backward = self.get_flow(x, flow_cache, frame_keys)
         feats_keyframe = self.get_keyframe_feature(x, keyframe_idx)
 
         # backward branch
@@ -120,7 +120,7 @@ class BasicVSRPlusPlus(nn.Module):
             if torch.norm(lqs_1 - lqs_2.flip(1)) == 0:
                 self.is_mirror_extended = True
 
-    def compute_flow(self, lqs):
+    def compute_flow(self, lqs, flow_cache=None, frame_keys=None):
         """Compute optical flow using SPyNet for feature alignment.
 
         Note that if the input is an mirror-extended sequence, 'flows_forward'
@@ -129,6 +129,10 @@ class BasicVSRPlusPlus(nn.Module):
         Args:
             lqs (tensor): Input low quality (LQ) sequence with
                 shape (n, t, c, h, w).
+            flow_cache (FlowCache, optional): Cache of the optical flows.
+                Default: None.
+            frame_keys (list[str], optional): Keys of the t frames in the flow
+                cache. Default: None.
 
         Return:
             tuple(Tensor): Optical flow. 'flows_forward' corresponds to the flows used for forward-time propagation \
@@ -140,12 +144,19 @@ class BasicVSRPlusPlus(nn.Module):
         lqs_1 = lqs[:, :-1, :, :, :].reshape(-1, c, h, w)
         lqs_2 = lqs[:, 1:, :, :, :].reshape(-1, c, h, w)
 
-        flows_backward = self.spynet(lqs_1, lqs_2).view(n, t - 1, 2, h, w)
+        if flow_cache is None:
+            flows_backward = self.spynet(lqs_1, lqs_2).view(n, t - 1, 2, h, w)
+        else:
+            assert n == 1, 'The flow cache only supports batch size 1.'
+            keys_1, keys_2 = frame_keys[:-1], frame_keys[1:]
+            flows_backward = flow_cache.compute(self.spynet, lqs_1, lqs_2, keys_1, keys_2).view(n, t - 1, 2, h, w)
 
         if self.is_mirror_extended:  # flows_forward = flows_backward.flip(1)
             flows_forward = flows_backward.flip(1)
-        else:
+        elif flow_cache is None:
             flows_forward = self.spynet(lqs_2, lqs_1).view(n, t - 1, 2, h, w)
+        else:
+            flows_forward = flow_cache.compute(self.spynet, lqs_2, lqs_1, keys_2, keys_1).view(n, t - 1, 2, h, w)
 
         if self.cpu_cache:
             flows_backward = flows_backward.cpu()
@@ -277,12 +288,17 @@ class BasicVSRPlusPlus(nn.Module):
 
         return torch.stack(outputs, dim=1)
 
-    def forward(self, lqs):
+    def forward(self, lqs, flow_cache=None, frame_keys=None):
         """Forward function for BasicVSR++.
 
         Args:
             lqs (tensor): Input low quality (LQ) sequence with
                 shape (n, t, c, h, w).
+            flow_cache (FlowCache, optional): Cache of the optical flows.
+                Default: None.
+            frame_keys (list[str], optional): Keys of the t frames in the flow
+                cache, in the form of ``clip/frame``. Only batch size 1 is
+                supported with the flow cache. Default: None.
 
         Returns:
             Tensor: Output HR sequence with shape (n, t, c, 4h, 4w).
@@ -320,7 +336,7 @@ class BasicVSRPlusPlus(nn.Module):
         assert lqs_downsample.size(3) >= 64 and lqs_downsample.size(4) >= 64, (
             'The height and width of low-res inputs must be at least 64, '
             f'but got {h} and {w}.')
-        flows_forward, flows_backward = self.compute_flow(lqs_downsample)
+        flows_forward, flows_backward = self.compute_flow(lqs_downsample, flow_cache, frame_keys)
 
         # feature propgation
         for iter_ in [1, 2]:
@@ -5,7 +5,10 @@
 import math
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.utils.checkpoint as checkpoint
+import warnings
+from collections import OrderedDict
 
 from basicsr.utils.registry import ARCH_REGISTRY
 from .arch_util import to_2tuple, trunc_normal_
@@ -75,6 +78,64 @@ def window_partition(x, window_size):
     return windows
 
 
+def calculate_mask(x_size, window_size, shift_size):
+    """Calculate the attention mask for SW-MSA.
+
+    Args:
+        x_size (tuple[int]): Height and width of the feature.
+        window_size (int): Window size.
+        shift_size (int): Shift size.
+
+    Returns:
+        Tensor: (0/-100) mask with shape (num_windows, window_size*window_size, window_size*window_size).
+    """
+    h, w = x_size
+    # region index of each row/column after the cyclic shift: 0 for [0, -window_size), 1 for
+    # [-window_size, -shift_size) and 2 for [-shift_size, end)
+    h_region = (torch.arange(h) >= h - window_size).long() + (torch.arange(h) >= h - shift_size).long()
+    w_region = (torch.arange(w) >= w - window_size).long() + (torch.arange(w) >= w - shift_size).long()
+    img_mask = (h_region.view(h, 1) * 3 + w_region.view(1, w)).float().view(1, h, w, 1)  # 1 h w 1
+
+    mask_windows = window_partition(img_mask, window_size)  # nw, window_size, window_size, 1
+    mask_windows = mask_windows.view(-1, window_size * window_size)
+    attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
+    attn_mask = attn_mask.masked_fill(attn_mask != 0, float(-100.0)).masked_fill(attn_mask == 0, float(0.0))
+
+    return attn_mask
+
+
+_attn_mask_cache = OrderedDict()
+
+
+def get_attn_mask(x_size, window_size, shift_size, device, max_cache_size=16):
+    """Get the attention mask for SW-MSA from a cache shared by all the blocks.
+
+    The masks only depend on (h, w, window_size, shift_size), so they are computed once for each input size,
+    instead of once per block and per forward pass. The least recently used masks are dropped when there are more
+    than ``max_cache_size`` of them.
+
+    Args:
+        x_size (tuple[int]): Height and width of the feature.
+        window_size (int): Window size.
+        shift_size (int): Shift size.
+        device (torch.device): Device of the mask.
+        max_cache_size (int): Maximum number of cached masks. Default: 16.
+
+    Returns:
+        Tensor | None: Attention mask. None if shift_size is 0, which is equivalent to an all-zero mask.
+    """
+    if shift_size == 0:
+        return None
+    key = (tuple(x_size), window_size, shift_size, str(device))
+    if key in _attn_mask_cache:
+        _attn_mask_cache.move_to_end(key)
+    else:
+        _attn_mask_cache[key] = calculate_mask(x_size, window_size, shift_size).to(device)
+        if len(_attn_mask_cache) > max_cache_size:
+            _attn_mask_cache.popitem(last=False)
+    return _attn_mask_cache[key]
+
+
 def window_reverse(windows, window_size, h, w):
     """
     Args:
@@ -104,9 +165,20 @@ class WindowAttention(nn.Module):
         qk_scale (float | None, optional): Override default qk scale of head_dim ** -0.5 if set
         attn_drop (float, optional): Dropout ratio of attention weight. Default: 0.0
         proj_drop (float, optional): Dropout ratio of output. Default: 0.0
+        fused_attn (bool, optional): If True, compute the attention with the fused
+            ``torch.nn.functional.scaled_dot_product_attention`` (PyTorch >= 2.0), which does not materialize the
+            attention matrices when a memory-efficient kernel is available. Default: False
     """
 
-    def __init__(self, dim, window_size, num_heads, qkv_bias=True, qk_scale=None, attn_drop=0., proj_drop=0.):
+    def __init__(self,
+                 dim,
+                 window_size,
+                 num_heads,
+                 qkv_bias=True,
+                 qk_scale=None,
+                 attn_drop=0.,
+                 proj_drop=0.,
+                 fused_attn=False):
 
         super().__init__()
         self.dim = dim
@@ -114,6 +186,10 @@ class WindowAttention(nn.Module):
         self.num_heads = num_heads
         head_dim = dim // num_heads
         self.scale = qk_scale or head_dim**-0.5
+        self.fused_attn = fused_attn
+        if fused_attn and not hasattr(F, 'scaled_dot_product_attention'):
+            self.fused_attn = False
+            warnings.warn('scaled_dot_product_attention requires PyTorch >= 2.0. Fall back to the default attention.')
 
         # define a parameter table of relative position bias
         self.relative_position_bias_table = nn.Parameter(
@@ -141,22 +217,62 @@ class WindowAttention(nn.Module):
         trunc_normal_(self.relative_position_bias_table, std=.02)
         self.softmax = nn.Softmax(dim=-1)
 
+        # relative position bias materialized in eval mode, reset when training or loading weights, and rebuilt when
+        # the table is modified in place (tracked by its version counter)
+        self.cached_relative_position_bias = None
+        self.cached_table_version = None
+
+    def train(self, mode=True):
+        if mode:
+            self.cached_relative_position_bias = None
+        return super().train(mode)
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self.cached_relative_position_bias = None
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def get_relative_position_bias(self):
+        """Get the relative position bias with shape (nH, Wh*Ww, Wh*Ww).
+
+        In eval mode without gradients, the bias is gathered from the table only once and reused in the following
+        forward passes, until the table is modified.
+        """
+        use_cache = not self.training and not torch.is_grad_enabled()
+        bias = self.cached_relative_position_bias
+        table = self.relative_position_bias_table
+        if (use_cache and bias is not None and bias.device == table.device and bias.dtype == table.dtype
+                and self.cached_table_version == table._version):
+            return bias
+
+        relative_position_bias = self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
+            self.window_size[0] * self.window_size[1], self.window_size[0] * self.window_size[1], -1)  # Wh*Ww,Wh*Ww,nH
+        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+        if use_cache:
+            self.cached_relative_position_bias = relative_position_bias
+            self.cached_table_version = table._version
+        return relative_position_bias
+
     def forward(self, x, mask=None):
         """
         Args:
             x: input features with shape of (num_windows*b, n, c)
-            mask: (0/-inf) mask with shape of (num_windows, Wh*Ww, Wh*Ww) or None
+            mask: (0/-100) mask with shape of (num_windows, Wh*Ww, Wh*Ww) or None
         """
         b_, n, c = x.shape
         qkv = self.qkv(x).reshape(b_, n, 3, self.num_heads, c // self.num_heads).permute(2, 0, 3, 1, 4)
         q, k, v = qkv[0], qkv[1], qkv[2]  # make torchscript happy (cannot use tensor as tuple)
 
+        if self.fused_attn:
+            x = self.forward_fused(q, k, v, mask)
+            x = x.transpose(1, 2).reshape(b_, n, c)
+            x = self.proj(x)
+            x = self.proj_drop(x)
+            return x
+
         q = q * self.scale
         attn = (q @ k.transpose(-2, -1))
 
-        relative_position_bias = self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
-            self.window_size[0] * self.window_size[1], self.window_size[0] * self.window_size[1], -1)  # Wh*Ww,Wh*Ww,nH
-        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+        relative_position_bias = self.get_relative_position_bias()  # nH, Wh*Ww, Wh*Ww
         attn = attn + relative_position_bias.unsqueeze(0)
 
         if mask is not None:
@@ -174,6 +290,32 @@ class WindowAttention(nn.Module):
         x = self.proj_drop(x)
         return x
 
+    def forward_fused(self, q, k, v, mask=None):
+        """Attention with scaled_dot_product_attention.
+
+        The relative position bias and the shift mask are added together and passed as the attention bias.
+
+        Args:
+            q, k, v: query, key and value with shape of (num_windows*b, nH, n, head_dim)
+            mask: (0/-100) mask with shape of (num_windows, Wh*Ww, Wh*Ww) or None
+
+        Returns:
+            Tensor: Output with shape of (num_windows*b, nH, n, head_dim).
+        """
+        b_, num_heads, n, head_dim = q.shape
+        attn_bias = self.get_relative_position_bias().unsqueeze(0).to(q.dtype)  # 1, nH, Wh*Ww, Wh*Ww
+        if mask is not None:
+            # repeat the mask over the batch, as the memory-efficient kernel only supports 4-D inputs
+            nw = mask.shape[0]
+            attn_bias = attn_bias + mask.unsqueeze(1).to(q.dtype)  # nw, nH, Wh*Ww, Wh*Ww
+            attn_bias = attn_bias.repeat(b_ // nw, 1, 1, 1)  # num_windows*b, nH, Wh*Ww, Wh*Ww
+        # the default scale of scaled_dot_product_attention is head_dim**-0.5 (the scale argument requires
+        # PyTorch >= 2.1), so q is rescaled to use self.scale
+        if self.scale != head_dim**-0.5:
+            q = q * (self.scale * head_dim**0.5)
+        return F.scaled_dot_product_attention(
+            q, k, v, attn_mask=attn_bias, dropout_p=self.attn_drop.p if self.training else 0.)
+
     def extra_repr(self) -> str:
         return f'dim={self.dim}, window_size={self.window_size}, num_heads={self.num_heads}'
 
@@ -208,6 +350,7 @@ class SwinTransformerBlock(nn.Module):
         drop_path (float, optional): Stochastic depth rate. Default: 0.0
         act_layer (nn.Module, optional): Activation layer. Default: nn.GELU
         norm_layer (nn.Module, optional): Normalization layer.  Default: nn.LayerNorm
+        fused_attn (bool, optional): If True, use scaled_dot_product_attention in W-MSA/SW-MSA. Default: False
     """
 
     def __init__(self,
@@ -223,7 +366,8 @@ class SwinTransformerBlock(nn.Module):
                  attn_drop=0.,
                  drop_path=0.,
                  act_layer=nn.GELU,
-                 norm_layer=nn.LayerNorm):
+                 norm_layer=nn.LayerNorm,
+                 fused_attn=False):
         super().__init__()
         self.dim = dim
         self.input_resolution = input_resolution
@@ -245,7 +389,8 @@ class SwinTransformerBlock(nn.Module):
             qkv_bias=qkv_bias,
             qk_scale=qk_scale,
             attn_drop=attn_drop,
-            proj_drop=drop)
+            proj_drop=drop,
+            fused_attn=fused_attn)
 
         self.drop_path = DropPath(drop_path) if drop_path > 0. else nn.Identity()
         self.norm2 = norm_layer(dim)
@@ -261,24 +406,7 @@ class SwinTransformerBlock(nn.Module):
 
     def calculate_mask(self, x_size):
         # calculate attention mask for SW-MSA
-        h, w = x_size
-        img_mask = torch.zeros((1, h, w, 1))  # 1 h w 1
-        h_slices = (slice(0, -self.window_size), slice(-self.window_size,
-                                                       -self.shift_size), slice(-self.shift_size, None))
-        w_slices = (slice(0, -self.window_size), slice(-self.window_size,
-                                                       -self.shift_size), slice(-self.shift_size, None))
-        cnt = 0
-        for h in h_slices:
-            for w in w_slices:
-                img_mask[:, h, w, :] = cnt
-                cnt += 1
-
-        mask_windows = window_partition(img_mask, self.window_size)  # nw, window_size, window_size, 1
-        mask_windows = mask_windows.view(-1, self.window_size * self.window_size)
-        attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
-        attn_mask = attn_mask.masked_fill(attn_mask != 0, float(-100.0)).masked_fill(attn_mask == 0, float(0.0))
-
-        return attn_mask
+        return calculate_mask(x_size, self.window_size, self.shift_size)
 
     def forward(self, x, x_size):
         h, w = x_size
@@ -303,7 +431,7 @@ class SwinTransformerBlock(nn.Module):
         if self.input_resolution == x_size:
             attn_windows = self.attn(x_windows, mask=self.attn_mask)  # nw*b, window_size*window_size, c
         else:
-            attn_windows = self.attn(x_windows, mask=self.calculate_mask(x_size).to(x.device))
+            attn_windows = self.attn(x_windows, mask=get_attn_mask(x_size, self.window_size, self.shift_size, x.device))
 
         # merge windows
         attn_windows = attn_windows.view(-1, self.window_size, self.window_size, c)
@@ -408,6 +536,7 @@ class BasicLayer(nn.Module):
         norm_layer (nn.Module, optional): Normalization layer. Default: nn.LayerNorm
         downsample (nn.Module | None, optional): Downsample layer at the end of the layer. Default: None
         use_checkpoint (bool): Whether to use checkpointing to save memory. Default: False.
+        fused_attn (bool): Whether to use scaled_dot_product_attention in attention. Default: False.
     """
 
     def __init__(self,
@@ -424,7 +553,8 @@ class BasicLayer(nn.Module):
                  drop_path=0.,
                  norm_layer=nn.LayerNorm,
                  downsample=None,
-                 use_checkpoint=False):
+                 use_checkpoint=False,
+                 fused_attn=False):
 
         super().__init__()
         self.dim = dim
@@ -446,7 +576,8 @@ class BasicLayer(nn.Module):
                 drop=drop,
                 attn_drop=attn_drop,
                 drop_path=drop_path[i] if isinstance(drop_path, list) else drop_path,
-                norm_layer=norm_layer) for i in range(depth)
+                norm_layer=norm_layer,
+                fused_attn=fused_attn) for i in range(depth)
         ])
 
         # patch merging layer
@@ -498,6 +629,7 @@ class RSTB(nn.Module):
         img_size: Input image size.
         patch_size: Patch size.
         resi_connection: The convolutional block before residual connection.
+        fused_attn (bool): Whether to use scaled_dot_product_attention in attention. Default: False.
     """
 
     def __init__(self,
@@ -517,7 +649,8 @@ class RSTB(nn.Module):
                  use_checkpoint=False,
                  img_size=224,
                  patch_size=4,
-                 resi_connection='1conv'):
+                 resi_connection='1conv',
+                 fused_attn=False):
         super(RSTB, self).__init__()
 
         self.dim = dim
@@ -537,7 +670,8 @@ class RSTB(nn.Module):
             drop_path=drop_path,
             norm_layer=norm_layer,
             downsample=downsample,
-            use_checkpoint=use_checkpoint)
+            use_checkpoint=use_checkpoint,
+            fused_attn=fused_attn)
 
         if resi_connection == '1conv':
             self.conv = nn.Conv2d(dim, dim, 3, 1, 1)
@@ -717,6 +851,8 @@ class SwinIR(nn.Module):
         img_range: Image range. 1. or 255.
         upsampler: The reconstruction reconstruction module. 'pixelshuffle'/'pixelshuffledirect'/'nearest+conv'/None
         resi_connection: The convolutional block before residual connection. '1conv'/'3conv'
+        fused_attn (bool): If True, compute the window attention with scaled_dot_product_attention (PyTorch >= 2.0)
+            to reduce the peak memory and latency. Default: False
     """
 
     def __init__(self,
@@ -741,6 +877,7 @@ class SwinIR(nn.Module):
                  img_range=1.,
                  upsampler='',
                  resi_connection='1conv',
+                 fused_attn=False,
                  **kwargs):
         super(SwinIR, self).__init__()
         num_in_ch = in_chans
@@ -815,7 +952,8 @@ class SwinIR(nn.Module):
                 use_checkpoint=use_checkpoint,
                 img_size=img_size,
                 patch_size=patch_size,
-                resi_connection=resi_connection)
+                resi_connection=resi_connection,
+                fused_attn=fused_attn)
             self.layers.append(layer)
         self.norm = norm_layer(self.num_features)
 
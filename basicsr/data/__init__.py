@@ -10,6 +10,7 @@ from os import path as osp
 from basicsr.data.prefetch_dataloader import PrefetchDataLoader
 from basicsr.utils import get_root_logger, scandir
 from basicsr.utils.dist_util import get_dist_info
+from basicsr.utils.file_client import remove_decoded_caches_at_exit
 from basicsr.utils.registry import DATASET_REGISTRY
 
 __all__ = ['build_dataset', 'build_dataloader']
@@ -32,6 +33,8 @@ def build_dataset(dataset_opt):
     """
     dataset_opt = deepcopy(dataset_opt)
     dataset = DATASET_REGISTRY.get(dataset_opt['type'])(dataset_opt)
+    # the decoded caches are created in the dataloader workers, which do not run the exit handlers
+    remove_decoded_caches_at_exit(dataset_opt.get('io_backend', {}))
     logger = get_root_logger()
     logger.info(f'Dataset [{dataset.__class__.__name__}] - {dataset_opt["name"]} is built.')
     return dataset
@@ -70,8 +73,11 @@ def build_dataloader(dataset, dataset_opt, num_gpu=1, dist=False, sampler=None,
             num_workers=num_workers,
             sampler=sampler,
             drop_last=True)
-        if sampler is None:
+        if sampler is None and not isinstance(dataset, torch.utils.data.IterableDataset):
             dataloader_args['shuffle'] = True
+        if hasattr(dataset, 'set_batch_size'):
+            # iterable datasets yield whole batches in each worker, which are not dropped by drop_last
+            dataset.set_batch_size(batch_size)
         dataloader_args['worker_init_fn'] = partial(
             worker_init_fn, num_workers=num_workers, rank=rank, seed=seed) if seed is not None else None
     elif phase in ['val', 'test']:  # validation
@@ -81,6 +87,9 @@ def build_dataloader(dataset, dataset_opt, num_gpu=1, dist=False, sampler=None,
 
     dataloader_args['pin_memory'] = dataset_opt.get('pin_memory', False)
     dataloader_args['persistent_workers'] = dataset_opt.get('persistent_workers', False)
+    if dataloader_args['num_workers'] > 0 and 'prefetch_factor' in dataset_opt:
+        # number of batches loaded in advance by each worker
+        dataloader_args['prefetch_factor'] = dataset_opt['prefetch_factor']
 
     prefetch_mode = dataset_opt.get('prefetch_mode')
     if prefetch_mode == 'cpu':  # CPUPrefetcher
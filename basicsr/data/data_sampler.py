@@ -1,7 +1,62 @@
 import math
-import torch
 from torch.utils.data.sampler import Sampler
 
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+    """Mix the bits of a 64-bit integer (the finalizer of splitmix64)."""
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+
+class FeistelPermutation():
+    """Seeded bijective permutation of range(size), evaluated lazily for each element.
+
+    A balanced Feistel network permutes the integers of the smallest even
+    number of bits covering size, and cycle walking maps the results back into
+    range(size). No index list is materialized.
+
+    Args:
+        size (int): Size of the permuted range.
+        seed (int): Random seed.
+        rounds (int): Number of Feistel rounds. Default: 6.
+    """
+
+    def __init__(self, size, seed, rounds=6):
+        self.size = size
+        self.half_bits = max(1, math.ceil(math.log2(max(size, 2)) / 2))
+        self.half_mask = (1 << self.half_bits) - 1
+        self.keys = [_mix64((seed * rounds + i) & _MASK64) for i in range(rounds)]
+
+    def _round(self, x, key):
+        return _mix64((x ^ key) & _MASK64) & self.half_mask
+
+    def _encrypt(self, x):
+        left, right = x >> self.half_bits, x & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, x):
+        left, right = x >> self.half_bits, x & self.half_mask
+        for key in reversed(self.keys):
+            left, right = right ^ self._round(left, key), left
+        return (left << self.half_bits) | right
+
+    def __call__(self, x):
+        x = self._encrypt(x)
+        while x >= self.size:  # cycle walking
+            x = self._encrypt(x)
+        return x
+
+    def inverse(self, x):
+        x = self._decrypt(x)
+        while x >= self.size:
+            x = self._decrypt(x)
+        return x
+
 
 class EnlargedSampler(Sampler):
     """Sampler that restricts data loading to a subset of the dataset.
@@ -10,39 +65,72 @@ class EnlargedSampler(Sampler):
     Support enlarging the dataset for iteration-based training, for saving
     time when restart the dataloader after each epoch
 
+    The indices are generated lazily from a seeded bijective permutation
+    (see :class:`FeistelPermutation`), so that no index list of the enlarged
+    dataset is built, and an epoch can start from any position when resuming.
+
+    With block_size > 1, consecutive dataset indices are grouped into blocks,
+    and the blocks are shuffled instead of the samples, so that the reads
+    from the storage stay sequential within a block. Each rank then takes a
+    contiguous part of the shuffled sequence.
+
     Args:
         dataset (torch.utils.data.Dataset): Dataset used for sampling.
         num_replicas (int | None): Number of processes participating in
             the training. It is usually the world_size.
         rank (int | None): Rank of the current process within num_replicas.
         ratio (int): Enlarging ratio. Default: 1.
+        block_size (int): Number of consecutive samples shuffled together.
+            Default: 1.
+        seed (int): Random seed. Default: 0.
     """
 
-    def __init__(self, dataset, num_replicas, rank, ratio=1):
+    def __init__(self, dataset, num_replicas, rank, ratio=1, block_size=1, seed=0):
         self.dataset = dataset
         self.num_replicas = num_replicas
         self.rank = rank
+        self.block_size = block_size
+        self.seed = seed
         self.epoch = 0
+        self.start = 0
         self.num_samples = math.ceil(len(self.dataset) * ratio / self.num_replicas)
         self.total_size = self.num_samples * self.num_replicas
+        self.num_blocks = math.ceil(self.total_size / block_size)
+        # the last block may be shorter than the others
+        self.last_block_size = self.total_size - (self.num_blocks - 1) * block_size
+
+    def _block_position(self, pos, last_slot):
+        """Get the (slot, offset) of a position in the sequence of shuffled blocks."""
+        last_start = last_slot * self.block_size
+        if pos < last_start:
+            return divmod(pos, self.block_size)
+        if pos < last_start + self.last_block_size:
+            return last_slot, pos - last_start
+        slot, offset = divmod(pos - last_start - self.last_block_size, self.block_size)
+        return last_slot + 1 + slot, offset
 
     def __iter__(self):
         # deterministically shuffle based on epoch
-        g = torch.Generator()
-        g.manual_seed(self.epoch)
-        indices = torch.randperm(self.total_size, generator=g).tolist()
-
+        perm_seed = _mix64(self.seed * 1000003 + self.epoch)
         dataset_size = len(self.dataset)
-        indices = [v % dataset_size for v in indices]
-
-        # subsample
-        indices = indices[self.rank:self.total_size:self.num_replicas]
-        assert len(indices) == self.num_samples
+        if self.block_size == 1:
+            perm = FeistelPermutation(self.total_size, perm_seed)
+            for i in range(self.start, self.num_samples):
+                # subsample
+                yield perm(self.rank + i * self.num_replicas) % dataset_size
+            return
 
-        return iter(indices)
+        perm = FeistelPermutation(self.num_blocks, perm_seed)
+        last_slot = perm.inverse(self.num_blocks - 1)
+        for i in range(self.start, self.num_samples):
+            slot, offset = self._block_position(self.rank * self.num_samples + i, last_slot)
+            yield (perm(slot) * self.block_size + offset) % dataset_size
 
     def __len__(self):
-        return self.num_samples
+        return self.num_samples - self.start
 
-    def set_epoch(self, epoch):
+    def set_epoch(self, epoch, start=0):
+        """Set the epoch, and the number of samples of this rank to skip in this epoch, e.g., for resuming
+        training from the middle of an epoch."""
         self.epoch = epoch
+        self.start = start
@@ -1,14 +1,76 @@
 import cv2
+import hashlib
+import json
 import numpy as np
+import os
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from os import path as osp
 from torch.nn import functional as F
 
 from basicsr.data.transforms import mod_crop
-from basicsr.utils import img2tensor, scandir
+from basicsr.utils import atomic_open, img2tensor, scandir
 
 
-def read_img_seq(path, require_mod_crop=False, scale=1, return_imgname=False):
+# thread pools for decoding images, shared by the calls in each process (threads do not survive forking)
+_decode_pools = {}
+
+
+def _decode_imgs(img_paths, num_threads=1):
+    if num_threads > 1 and len(img_paths) > 1:
+        # cv2 releases the GIL when decoding, so the images are decoded in parallel
+        key = (os.getpid(), num_threads)
+        if key not in _decode_pools:
+            _decode_pools[key] = ThreadPoolExecutor(num_threads)
+        return list(_decode_pools[key].map(cv2.imread, img_paths))
+    return [cv2.imread(v) for v in img_paths]
+
+
+def decode_img_seq(img_paths, num_threads=1, cache=None):
+    """Decode a sequence of images to uint8 BGR arrays, with an optional decoded clip cache.
+
+    With `cache`, the decoded sequence is saved as one clip, keyed by the
+    image paths, sizes and modification times, so the images are decoded
+    only once across repeated validations, and modified images are decoded
+    again. Sequences of images with different shapes are not cached.
+
+    Args:
+        img_paths (list[str]): Image paths.
+        num_threads (int): Number of threads for decoding. Default: 1.
+        cache (:obj:`DecodedClipCache` | None): Decoded clip cache, see
+            :class:`basicsr.utils.file_client.DecodedClipCache`. Default: None.
+
+    Returns:
+        ndarray | list[ndarray]: Decoded images, as a (read-only memmap)
+            array with shape (t, h, w, c) if cached.
+    """
+    if cache is None:
+        return _decode_imgs(img_paths, num_threads)
+
+    stats = [os.stat(v) for v in img_paths]
+    key = '\n'.join(f'{osp.abspath(v)}:{stat.st_size}:{stat.st_mtime_ns}' for v, stat in zip(img_paths, stats))
+    imgs = cache.get(key)
+    if imgs is not None:
+        return imgs
+    locked = cache.try_lock(key)  # otherwise, decoded by another process now
+    try:
+        imgs = _decode_imgs(img_paths, num_threads)
+        if locked and len({img.shape for img in imgs}) == 1:
+            imgs = np.stack(imgs)
+            cache.put(key, imgs)
+    finally:
+        if locked:
+            cache.unlock(key)
+    return imgs
+
+
+def read_img_seq(path,
+                 require_mod_crop=False,
+                 scale=1,
+                 return_imgname=False,
+                 indices=None,
+                 num_threads=1,
+                 cache=None):
     """Read a sequence of images from a given folder path.
 
     Args:
@@ -17,6 +79,13 @@ def read_img_seq(path, require_mod_crop=False, scale=1, return_imgname=False):
             Default: False.
         scale (int): Scale factor for mod_crop. Default: 1.
         return_imgname(bool): Whether return image names. Default False.
+        indices (list[int] | None): Indices of the images to read in the
+            sequence. With `cache`, the whole sequence is decoded and cached,
+            so that reading other indices later is cheap. None for all the
+            images. Default: None.
+        num_threads (int): Number of threads for decoding. Default: 1.
+        cache (:obj:`DecodedClipCache` | None): Decoded clip cache, see
+            :func:`decode_img_seq`. Default: None.
 
     Returns:
         Tensor: size (t, c, h, w), RGB, [0, 1].
@@ -26,7 +95,13 @@ def read_img_seq(path, require_mod_crop=False, scale=1, return_imgname=False):
         img_paths = path
     else:
         img_paths = sorted(list(scandir(path, full_path=True)))
-    imgs = [cv2.imread(v).astype(np.float32) / 255. for v in img_paths]
+    if indices is None:
+        indices = list(range(len(img_paths)))
+    elif cache is None:  # only decode the required images
+        img_paths = [img_paths[i] for i in indices]
+        indices = list(range(len(img_paths)))
+    imgs = decode_img_seq(img_paths, num_threads=num_threads, cache=cache)
+    imgs = [imgs[i].astype(np.float32) / 255. for i in indices]
 
     if require_mod_crop:
         imgs = [mod_crop(img, scale) for img in imgs]
@@ -34,7 +109,7 @@ def read_img_seq(path, require_mod_crop=False, scale=1, return_imgname=False):
     imgs = torch.stack(imgs, dim=0)
 
     if return_imgname:
-        imgnames = [osp.splitext(osp.basename(path))[0] for path in img_paths]
+        imgnames = [osp.splitext(osp.basename(img_paths[i]))[0] for i in indices]
         return imgs, imgnames
     else:
         return imgs
@@ -119,6 +194,9 @@ def paired_paths_from_lmdb(folders, keys):
     We use the image name without extension as the lmdb key.
     Note that we use the same key for the corresponding lq and gt images.
 
+    Shard databases (``*.shard``) share the same meta_info.txt and keys, see
+    :func:`basicsr.utils.lmdb_util.make_shard_from_imgs`.
+
     Args:
         folders (list[str]): A list of folder path. The order of list should
             be [input_folder, gt_folder].
@@ -135,8 +213,8 @@ def paired_paths_from_lmdb(folders, keys):
     input_folder, gt_folder = folders
     input_key, gt_key = keys
 
-    if not (input_folder.endswith('.lmdb') and gt_folder.endswith('.lmdb')):
-        raise ValueError(f'{input_key} folder and {gt_key} folder should both in lmdb '
+    if not (input_folder.endswith(('.lmdb', '.shard')) and gt_folder.endswith(('.lmdb', '.shard'))):
+        raise ValueError(f'{input_key} folder and {gt_key} folder should both in lmdb or shard '
                          f'formats. But received {input_key}: {input_folder}; '
                          f'{gt_key}: {gt_folder}')
     # ensure that the two meta_info files are the same
@@ -197,9 +275,99 @@ def paired_paths_from_meta_info_file(folders, keys, meta_info_file, filename_tmp
     return paths
 
 
-def paired_paths_from_folder(folders, keys, filename_tmpl):
+def _read_img_shape(img_path):
+    from PIL import Image  # only reads the image header
+
+    with Image.open(img_path) as img:
+        return img.height, img.width, len(img.getbands())
+
+
+def _folder_info(folder):
+    """Folder path, mtime and number of entries, to validate the path indexes.
+
+    The mtime of a folder changes when files are added, removed or renamed in
+    it, but not when files are modified in place. Counting the entries only
+    reads the folder listing, without stat calls.
+    """
+    with os.scandir(folder) as entries:
+        num_entries = sum(1 for _ in entries)
+    return {'folder': folder, 'mtime_ns': os.stat(folder).st_mtime_ns, 'num_entries': num_entries}
+
+
+def _load_path_index(index_path, meta_info):
+    """Load the arrays of a path index with mmap. None if it does not exist or its meta info differs."""
+    try:
+        with open(f'{index_path}.json') as f:
+            if json.load(f) != meta_info:
+                return None
+        return {key: np.load(f'{index_path}.{key}.npy', mmap_mode='r') for key in meta_info['arrays']}
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_path_index(index_path, meta_info, arrays):
+    os.makedirs(osp.dirname(index_path), exist_ok=True)
+    # the meta info is written at last, so that the index is only valid when all the arrays are written
+    for key, array in arrays.items():
+        with atomic_open(f'{index_path}.{key}.npy') as f:
+            np.save(f, array)
+    with atomic_open(f'{index_path}.json', 'w') as f:
+        json.dump(meta_info, f)
+
+
+def _encode_names(names):
+    return np.array([v.encode('utf-8') for v in names], dtype=bytes)
+
+
+class IndexedPaths(object):
+    """Path list loaded from a memory-mapped path index.
+
+    The file names are kept as fixed-width byte arrays and are only decoded
+    when accessed, so loading the index takes constant time.
+
+    Args:
+        folders (list[str]): Folders of the file names.
+        names (list[ndarray]): File names of each folder.
+        keys (list[str] | None): Keys of the folders. If None, the items are
+            paths in the first folder. Otherwise, the items are dicts with
+            `{key}_path`, like :func:`paired_paths_from_folder`. Default: None.
+        shapes (dict[str, ndarray] | None): Image shapes (h, w, c) of the
+            folders with the given keys, returned as `{key}_shape` in the
+            items. Default: None.
+    """
+
+    def __init__(self, folders, names, keys=None, shapes=None):
+        self.folders = folders
+        self.names = names
+        self.keys = keys
+        self.shapes = shapes or {}
+
+    def __len__(self):
+        return self.names[0].shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.keys is None:
+            return osp.join(self.folders[0], self.names[0][index].decode('utf-8'))
+        item = {
+            f'{key}_path': osp.join(folder, names[index].decode('utf-8'))
+            for key, folder, names in zip(self.keys, self.folders, self.names)
+        }
+        for key, shapes in self.shapes.items():
+            item[f'{key}_shape'] = tuple(int(v) for v in shapes[index])
+        return item
+
+
+def paired_paths_from_folder(folders, keys, filename_tmpl, index_dir=None):
     """Generate paired paths from folders.
 
+    Scanning folders with millions of files is slow, especially on network
+    file systems. With `index_dir`, the paired file names and the image shapes
+    of the input folder (read from the image headers) are saved in an index
+    there, named by the folders, and loaded with mmap. The index is rebuilt
+    if the mtime or the number of entries of a folder differs.
+
     Args:
         folders (list[str]): A list of folder path. The order of list should
             be [input_folder, gt_folder].
@@ -208,9 +376,12 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
         filename_tmpl (str): Template for each filename. Note that the
             template excludes the file extension. Usually the filename_tmpl is
             for files in the input folder.
+        index_dir (str | None): Folder of the cached path indexes. Default:
+            None.
 
     Returns:
-        list[str]: Returned path list.
+        list[dict] | IndexedPaths: Returned path list. With `index_dir`, the
+            items also contain the input image shapes as `{input_key}_shape`.
     """
     assert len(folders) == 2, ('The len of folders should be 2 with [input_folder, gt_folder]. '
                                f'But got {len(folders)}')
@@ -218,7 +389,34 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
     input_folder, gt_folder = folders
     input_key, gt_key = keys
 
-    input_paths = list(scandir(input_folder))
+    if index_dir is not None:
+        folders = [osp.abspath(v) for v in folders]
+        meta_info = {
+            'folders': [_folder_info(v) for v in folders],
+            'keys': list(keys),
+            'filename_tmpl': filename_tmpl,
+            'arrays': [f'{input_key}_names', f'{gt_key}_names', f'{input_key}_shapes']
+        }
+        index_path = osp.join(
+            osp.expanduser(index_dir),
+            hashlib.sha1(json.dumps([folders, list(keys), filename_tmpl]).encode('utf-8')).hexdigest())
+        arrays = _load_path_index(index_path, meta_info)
+        if arrays is None:
+            paths = paired_paths_from_folder(folders, keys, filename_tmpl)
+            input_paths = [v[f'{input_key}_path'] for v in paths]
+            arrays = {
+                f'{input_key}_names': _encode_names(osp.basename(v) for v in input_paths),
+                f'{gt_key}_names': _encode_names(osp.basename(v[f'{gt_key}_path']) for v in paths),
+                f'{input_key}_shapes': np.array([_read_img_shape(v) for v in input_paths], dtype=np.int32).reshape(
+                    -1, 3)
+            }
+            _save_path_index(index_path, meta_info, arrays)
+        return IndexedPaths(
+            folders, [arrays[f'{input_key}_names'], arrays[f'{gt_key}_names']],
+            keys=keys,
+            shapes={input_key: arrays[f'{input_key}_shapes']})
+
+    input_paths = set(scandir(input_folder))
     gt_paths = list(scandir(gt_folder))
     assert len(input_paths) == len(gt_paths), (f'{input_key} and {gt_key} datasets have different number of images: '
                                                f'{len(input_paths)}, {len(gt_paths)}.')
@@ -233,15 +431,27 @@ def paired_paths_from_folder(folders, keys, filename_tmpl):
     return paths
 
 
-def paths_from_folder(folder):
+def paths_from_folder(folder, index_dir=None):
     """Generate paths from folder.
 
     Args:
         folder (str): Folder path.
+        index_dir (str | None): Folder of the cached path indexes, see
+            :func:`paired_paths_from_folder`. The paths are sorted in the
+            index. Default: None.
 
     Returns:
-        list[str]: Returned path list.
+        list[str] | IndexedPaths: Returned path list.
     """
+    if index_dir is not None:
+        folder = osp.abspath(folder)
+        meta_info = {'folders': [_folder_info(folder)], 'arrays': ['names']}
+        index_path = osp.join(osp.expanduser(index_dir), hashlib.sha1(folder.encode('utf-8')).hexdigest())
+        arrays = _load_path_index(index_path, meta_info)
+        if arrays is None:
+            arrays = {'names': _encode_names(sorted(scandir(folder)))}
+            _save_path_index(index_path, meta_info, arrays)
+        return IndexedPaths([folder], [arrays['names']])
 
     paths = list(scandir(folder))
     paths = [osp.join(folder, path) for path in paths]
@@ -249,7 +459,7 @@ def paths_from_folder(folder):
 
 
 def paths_from_lmdb(folder):
-    """Generate paths from lmdb.
+    """Generate paths from lmdb or shard databases.
 
     Args:
         folder (str): Folder path.
@@ -257,8 +467,8 @@ def paths_from_lmdb(folder):
     Returns:
         list[str]: Returned path list.
     """
-    if not folder.endswith('.lmdb'):
-        raise ValueError(f'Folder {folder}folder should in lmdb format.')
+    if not folder.endswith(('.lmdb', '.shard')):
+        raise ValueError(f'Folder {folder}folder should in lmdb or shard format.')
     with open(osp.join(folder, 'meta_info.txt')) as fin:
         paths = [line.split('.')[0] for line in fin]
     return paths
@@ -5,8 +5,11 @@ import random
 import torch
 from scipy import special
 from scipy.stats import multivariate_normal
+from torch.nn import functional as F
 from torchvision.transforms.functional import rgb_to_grayscale
 
+from basicsr.utils.img_process_util import filter2D
+
 # -------------------------------------------------------------------- #
 # --------------------------- blur kernels --------------------------- #
 # -------------------------------------------------------------------- #
@@ -409,6 +412,190 @@ def circular_lowpass_kernel(cutoff, kernel_size, pad_to=0):
     return kernel
 
 
+# ----------------------- batched kernels (PyTorch version) ----------------------- #
+def _uniform_pt(low, high, size, device=None):
+    return torch.rand(size, device=device) * (high - low) + low
+
+
+def _bessel_j1_pt(x):
+    if hasattr(torch.special, 'bessel_j1'):
+        return torch.special.bessel_j1(x)
+    return torch.from_numpy(special.j1(x.cpu().numpy())).to(x)
+
+
+def mesh_grid_pt(kernel_size, device=None):
+    """Generate the mesh grid, centering at zero (PyTorch version).
+
+    Args:
+        kernel_size (int):
+        device (torch.device, optional): Default: None.
+
+    Returns:
+        xx (Tensor): with the shape (kernel_size, kernel_size)
+        yy (Tensor): with the shape (kernel_size, kernel_size)
+    """
+    ax = torch.arange(-kernel_size // 2 + 1., kernel_size // 2 + 1., device=device)
+    xx = ax.view(1, -1).expand(kernel_size, kernel_size)
+    yy = ax.view(-1, 1).expand(kernel_size, kernel_size)
+    return xx, yy
+
+
+def _kernel_size_mask(kernel_sizes, pad_to):
+    """Masks of the centered (k, k) windows in (pad_to, pad_to) kernels, with the shape (b, pad_to, pad_to)."""
+    xx, yy = mesh_grid_pt(pad_to, device=kernel_sizes.device)
+    radius = ((kernel_sizes - 1) // 2).view(-1, 1, 1)
+    return (xx.abs() <= radius) & (yy.abs() <= radius)
+
+
+def bivariate_kernels_pt(kernel_sizes, sig_x, sig_y, theta, beta, plateau, pad_to=21):
+    """Generate a batch of bivariate Gaussian, generalized Gaussian or plateau kernels (PyTorch version).
+
+    Each kernel equals the one of :func:`bivariate_generalized_Gaussian` (or :func:`bivariate_plateau` where
+    `plateau` is True) with its kernel size, zero-padded to pad_to. Gaussian kernels are generalized Gaussian
+    kernels with beta = 1.
+
+    Args:
+        kernel_sizes (Tensor): Odd kernel sizes (<= pad_to) with the shape (b).
+        sig_x (Tensor): with the shape (b).
+        sig_y (Tensor): with the shape (b).
+        theta (Tensor): Radian measurement, with the shape (b).
+        beta (Tensor): Shape parameters, with the shape (b).
+        plateau (Tensor): Bool tensor with the shape (b), whether to generate plateau kernels.
+        pad_to (int): Padded kernel size. Default: 21.
+
+    Returns:
+        Tensor: Normalized kernels with the shape (b, pad_to, pad_to).
+    """
+    xx, yy = mesh_grid_pt(pad_to, device=sig_x.device)
+    # inverse of the rotated sigma matrix, see :func:`sigma_matrix2`
+    cos, sin = torch.cos(theta).view(-1, 1, 1), torch.sin(theta).view(-1, 1, 1)
+    inv_x, inv_y = 1. / sig_x.view(-1, 1, 1)**2, 1. / sig_y.view(-1, 1, 1)**2
+    inv_00 = cos**2 * inv_x + sin**2 * inv_y
+    inv_01 = cos * sin * (inv_x - inv_y)
+    inv_11 = sin**2 * inv_x + cos**2 * inv_y
+    dist = (inv_00 * xx**2 + 2 * inv_01 * xx * yy + inv_11 * yy**2)**beta.view(-1, 1, 1)
+    kernel = torch.where(plateau.view(-1, 1, 1), torch.reciprocal(dist + 1), torch.exp(-0.5 * dist))
+    kernel = kernel * _kernel_size_mask(kernel_sizes, pad_to)
+    return kernel / kernel.sum(dim=(1, 2), keepdim=True)
+
+
+def random_mixed_kernels_pt(kernel_list,
+                            kernel_prob,
+                            kernel_sizes,
+                            sigma_x_range=(0.6, 5),
+                            sigma_y_range=(0.6, 5),
+                            rotation_range=(-math.pi, math.pi),
+                            betag_range=(0.5, 8),
+                            betap_range=(0.5, 8),
+                            pad_to=21):
+    """Randomly generate a batch of mixed kernels (PyTorch version).
+
+    The kernel types and parameters of each kernel follow the same distributions as :func:`random_mixed_kernels`
+    (without multiplicative noise).
+
+    Args:
+        kernel_list (tuple): a list name of kernel types,
+            support ['iso', 'aniso', 'generalized_iso', 'generalized_aniso', 'plateau_iso', 'plateau_aniso']
+        kernel_prob (tuple): corresponding kernel probability for each kernel type
+        kernel_sizes (Tensor): Odd kernel sizes with the shape (b). Kernels are generated on its device.
+        sigma_x_range (tuple): [0.6, 5]
+        sigma_y_range (tuple): [0.6, 5]
+        rotation range (tuple): [-math.pi, math.pi]
+        betag_range (tuple): [0.5, 8]
+        betap_range (tuple): [0.5, 8]
+        pad_to (int): Padded kernel size. Default: 21.
+
+    Returns:
+        Tensor: Kernels with the shape (b, pad_to, pad_to).
+    """
+    b, device = kernel_sizes.size(0), kernel_sizes.device
+    types = torch.multinomial(torch.tensor(kernel_prob, dtype=torch.float32), b, replacement=True).to(device)
+    isotropic = torch.tensor([name in ['iso', 'generalized_iso', 'plateau_iso'] for name in kernel_list],
+                             device=device)[types]
+    generalized = torch.tensor([name.startswith('generalized') for name in kernel_list], device=device)[types]
+    plateau = torch.tensor([name.startswith('plateau') for name in kernel_list], device=device)[types]
+
+    sig_x = _uniform_pt(sigma_x_range[0], sigma_x_range[1], b, device)
+    sig_y = torch.where(isotropic, sig_x, _uniform_pt(sigma_y_range[0], sigma_y_range[1], b, device))
+    theta = torch.where(isotropic, torch.zeros_like(sig_x), _uniform_pt(rotation_range[0], rotation_range[1], b,
+                                                                        device))
+    # beta is in [beta_range[0], 1] or [1, beta_range[1]] with equal probabilities
+    below = torch.rand(b, device=device) < 0.5
+    betag = torch.where(below, _uniform_pt(betag_range[0], 1, b, device), _uniform_pt(1, betag_range[1], b, device))
+    betap = torch.where(below, _uniform_pt(betap_range[0], 1, b, device), _uniform_pt(1, betap_range[1], b, device))
+    beta = torch.where(plateau, betap, torch.where(generalized, betag, torch.ones_like(betag)))
+    return bivariate_kernels_pt(kernel_sizes, sig_x, sig_y, theta, beta, plateau, pad_to=pad_to)
+
+
+def circular_lowpass_kernel_pt(cutoff, kernel_sizes, pad_to=21):
+    """Generate a batch of 2D sinc filters (PyTorch version).
+
+    Each filter equals the one of :func:`circular_lowpass_kernel` with its cutoff and kernel size, zero-padded
+    to pad_to.
+
+    Args:
+        cutoff (Tensor): cutoff frequencies in radians (pi is max), with the shape (b).
+        kernel_sizes (Tensor): Odd kernel sizes (<= pad_to) with the shape (b).
+        pad_to (int): Padded kernel size, must be odd. Default: 21.
+
+    Returns:
+        Tensor: Filters with the shape (b, pad_to, pad_to).
+    """
+    xx, yy = mesh_grid_pt(pad_to, device=cutoff.device)
+    cutoff = cutoff.view(-1, 1, 1)
+    radius = torch.sqrt(xx**2 + yy**2)
+    kernel = cutoff * _bessel_j1_pt(cutoff * radius) / (2 * np.pi * radius)
+    kernel[:, pad_to // 2, pad_to // 2] = cutoff.view(-1)**2 / (4 * np.pi)
+    kernel = kernel * _kernel_size_mask(kernel_sizes, pad_to)
+    return kernel / kernel.sum(dim=(1, 2), keepdim=True)
+
+
+def random_degradation_kernels_pt(opt, batch_size, device=None, kernel_range=(7, 9, 11, 13, 15, 17, 19, 21)):
+    """Randomly generate the kernels of the Real-ESRGAN degradations for a batch (PyTorch version).
+
+    The kernels follow the same distributions as the ones generated in
+    :class:`basicsr.data.realesrgan_dataset.RealESRGANDataset`.
+
+    Args:
+        opt (dict): Dataset options with the kernel settings, e.g., kernel_list, sinc_prob and final_sinc_prob.
+        batch_size (int): Batch size.
+        device (torch.device, optional): Default: None.
+        kernel_range (tuple[int]): Kernel sizes. Default: (7, 9, ..., 21).
+
+    Returns:
+        tuple[Tensor]: kernel1, kernel2 and sinc_kernel with the shape (b, 21, 21).
+    """
+    kernel_range = torch.tensor(kernel_range, device=device)
+    pulse = torch.zeros(batch_size, 21, 21, device=device)  # convolving with pulse tensor brings no blurry effect
+    pulse[:, 10, 10] = 1
+
+    kernels = []
+    for suffix in ['', '2']:
+        kernel_sizes = kernel_range[torch.randint(len(kernel_range), (batch_size, ), device=device)]
+        kernel = random_mixed_kernels_pt(
+            opt[f'kernel_list{suffix}'],
+            opt[f'kernel_prob{suffix}'],
+            kernel_sizes,
+            opt[f'blur_sigma{suffix}'],
+            opt[f'blur_sigma{suffix}'], [-math.pi, math.pi],
+            opt[f'betag_range{suffix}'],
+            opt[f'betap_range{suffix}'],
+            pad_to=21)
+        # this sinc filter setting is for kernels ranging from [7, 21]
+        low = torch.full((batch_size, ), np.pi / 5, device=device)
+        low[kernel_sizes < 13] = np.pi / 3
+        sinc = circular_lowpass_kernel_pt(low + torch.rand(batch_size, device=device) * (np.pi - low), kernel_sizes)
+        use_sinc = torch.rand(batch_size, device=device) < opt[f'sinc_prob{suffix}']
+        kernels.append(torch.where(use_sinc.view(-1, 1, 1), sinc, kernel))
+
+    # the final sinc kernel
+    kernel_sizes = kernel_range[torch.randint(len(kernel_range), (batch_size, ), device=device)]
+    sinc = circular_lowpass_kernel_pt(_uniform_pt(np.pi / 3, np.pi, batch_size, device), kernel_sizes)
+    use_sinc = torch.rand(batch_size, device=device) < opt['final_sinc_prob']
+    kernels.append(torch.where(use_sinc.view(-1, 1, 1), sinc, pulse))
+    return tuple(kernels)
+
+
 # ------------------------------------------------------------- #
 # --------------------------- noise --------------------------- #
 # ------------------------------------------------------------- #
@@ -723,6 +910,40 @@ def random_add_poisson_noise_pt(img, scale_range=(0, 1.0), gray_prob=0, clip=Tru
     return out
 
 
+def random_add_noise_pt(img,
+                        gaussian_prob=0.5,
+                        sigma_range=(0, 10),
+                        scale_range=(0, 1.0),
+                        gray_prob=0,
+                        clip=True,
+                        rounds=False):
+    """Randomly add Gaussian noise or Poisson noise to each image in a batch (PyTorch version).
+
+    Each image independently gets Gaussian noise with the probability gaussian_prob, and Poisson noise otherwise.
+
+    Args:
+        img (Tensor): Shape (b, c, h, w), range[0, 1], float32.
+        gaussian_prob (float): Probability of Gaussian noise. Default: 0.5.
+        sigma_range (tuple): Sigma range of Gaussian noise. Default: (0, 10).
+        scale_range (tuple): Scale range of Poisson noise. Default: (0, 1.0).
+        gray_prob (float): Probability of gray noise. Default: 0.
+        clip (bool): Whether to clip the noisy images to [0, 1]. Default: True.
+        rounds (bool): Whether to round the noisy images to uint8 levels. Default: False.
+
+    Returns:
+        (Tensor): Returned noisy image, shape (b, c, h, w), range[0, 1], float32.
+    """
+    gaussian = torch.rand(img.size(0)) < gaussian_prob
+    if gaussian.all():
+        return random_add_gaussian_noise_pt(img, sigma_range, gray_prob, clip, rounds)
+    if not gaussian.any():
+        return random_add_poisson_noise_pt(img, scale_range, gray_prob, clip, rounds)
+    out = torch.empty_like(img)
+    out[gaussian] = random_add_gaussian_noise_pt(img[gaussian], sigma_range, gray_prob, clip, rounds)
+    out[~gaussian] = random_add_poisson_noise_pt(img[~gaussian], scale_range, gray_prob, clip, rounds)
+    return out
+
+
 # ------------------------------------------------------------------------ #
 # --------------------------- JPEG compression --------------------------- #
 # ------------------------------------------------------------------------ #
@@ -762,3 +983,122 @@ def random_add_jpg_compression(img, quality_range=(90, 100)):
     """
     quality = np.random.uniform(quality_range[0], quality_range[1])
     return add_jpg_compression(img, quality)
+
+
+# ---------------------------------------------------------------------------- #
+# --------------------------- Real-ESRGAN degradations ----------------------- #
+# ---------------------------------------------------------------------------- #
+
+
+def _degrade_group_pt(img, kernel1, kernel2, sinc_kernel, opt, jpeger):
+    """Add the two-order degradations to a group of images, which share the same resize scales and interpolation
+    modes."""
+    ori_h, ori_w = img.size()[2:4]
+
+    # ----------------------- The first degradation process ----------------------- #
+    # blur. The batch mixes separable and non-separable kernels, so skip the separability check, which
+    # synchronizes with the device
+    out = filter2D(img, kernel1, separable=False)
+    # random resize
+    updown_type = random.choices(['up', 'down', 'keep'], opt['resize_prob'])[0]
+    if updown_type == 'up':
+        scale = np.random.uniform(1, opt['resize_range'][1])
+    elif updown_type == 'down':
+        scale = np.random.uniform(opt['resize_range'][0], 1)
+    else:
+        scale = 1
+    mode = random.choice(['area', 'bilinear', 'bicubic'])
+    out = F.interpolate(out, scale_factor=scale, mode=mode)
+    # add Gaussian or Poisson noise, chosen for each sample
+    out = random_add_noise_pt(
+        out,
+        gaussian_prob=opt['gaussian_noise_prob'],
+        sigma_range=opt['noise_range'],
+        scale_range=opt['poisson_scale_range'],
+        gray_prob=opt['gray_noise_prob'],
+        clip=True,
+        rounds=False)
+    # JPEG compression
+    jpeg_p = out.new_zeros(out.size(0)).uniform_(*opt['jpeg_range'])
+    out = torch.clamp(out, 0, 1)  # clamp to [0, 1], otherwise JPEGer will result in unpleasant artifacts
+    out = jpeger(out, quality=jpeg_p)
+
+    # ----------------------- The second degradation process ----------------------- #
+    # blur
+    if np.random.uniform() < opt['second_blur_prob']:
+        out = filter2D(out, kernel2, separable=False)
+    # random resize
+    updown_type = random.choices(['up', 'down', 'keep'], opt['resize_prob2'])[0]
+    if updown_type == 'up':
+        scale = np.random.uniform(1, opt['resize_range2'][1])
+    elif updown_type == 'down':
+        scale = np.random.uniform(opt['resize_range2'][0], 1)
+    else:
+        scale = 1
+    mode = random.choice(['area', 'bilinear', 'bicubic'])
+    out = F.interpolate(
+        out, size=(int(ori_h / opt['scale'] * scale), int(ori_w / opt['scale'] * scale)), mode=mode)
+    # add Gaussian or Poisson noise, chosen for each sample
+    out = random_add_noise_pt(
+        out,
+        gaussian_prob=opt['gaussian_noise_prob2'],
+        sigma_range=opt['noise_range2'],
+        scale_range=opt['poisson_scale_range2'],
+        gray_prob=opt['gray_noise_prob2'],
+        clip=True,
+        rounds=False)
+
+    # JPEG compression + the final sinc filter
+    # We also need to resize images to desired sizes. We group [resize back + sinc filter] together
+    # as one operation.
+    # We consider two orders:
+    #   1. [resize back + sinc filter] + JPEG compression
+    #   2. JPEG compression + [resize back + sinc filter]
+    # Empirically, we find other combinations (sinc + JPEG + Resize) will introduce twisted lines.
+    if np.random.uniform() < 0.5:
+        # resize back + the final sinc filter
+        mode = random.choice(['area', 'bilinear', 'bicubic'])
+        out = F.interpolate(out, size=(ori_h // opt['scale'], ori_w // opt['scale']), mode=mode)
+        out = filter2D(out, sinc_kernel, separable=False)
+        # JPEG compression
+        jpeg_p = out.new_zeros(out.size(0)).uniform_(*opt['jpeg_range2'])
+        out = torch.clamp(out, 0, 1)
+        out = jpeger(out, quality=jpeg_p)
+    else:
+        # JPEG compression
+        jpeg_p = out.new_zeros(out.size(0)).uniform_(*opt['jpeg_range2'])
+        out = torch.clamp(out, 0, 1)
+        out = jpeger(out, quality=jpeg_p)
+        # resize back + the final sinc filter
+        mode = random.choice(['area', 'bilinear', 'bicubic'])
+        out = F.interpolate(out, size=(ori_h // opt['scale'], ori_w // opt['scale']), mode=mode)
+        out = filter2D(out, sinc_kernel, separable=False)
+
+    # clamp and round
+    return torch.clamp((out * 255.0).round(), 0, 255) / 255.
+
+
+def random_degradations_pt(img, kernel1, kernel2, sinc_kernel, opt, jpeger, num_groups=1):
+    """Add the two-order degradations of Real-ESRGAN to a batch (PyTorch version).
+
+    The batch is split into `num_groups` groups, which use different resize scales and interpolation modes. The blur
+    kernels, noises and JPEG qualities are different for each image.
+
+    Args:
+        img (Tensor): Images with shape (b, c, h, w), range [0, 1].
+        kernel1 (Tensor): Blur kernels of the first degradation with shape (b, 21, 21).
+        kernel2 (Tensor): Blur kernels of the second degradation with shape (b, 21, 21).
+        sinc_kernel (Tensor): The final sinc kernels with shape (b, 21, 21).
+        opt (dict): Model options with the degradation settings, e.g., resize_prob, noise_range, jpeg_range and
+            scale.
+        jpeger (:class:`basicsr.utils.DiffJPEG`): JPEG compressor.
+        num_groups (int): Number of groups. Default: 1.
+
+    Returns:
+        Tensor: LQ images with shape (b, c, h // scale, w // scale), rounded to uint8 levels.
+    """
+    return torch.cat([
+        _degrade_group_pt(*group, opt, jpeger)
+        for group in zip(img.chunk(num_groups), kernel1.chunk(num_groups), kernel2.chunk(num_groups),
+                         sinc_kernel.chunk(num_groups))
+    ])
@@ -5,7 +5,7 @@ from torch.utils import data as data
 from torchvision.transforms.functional import normalize
 
 from basicsr.data.transforms import augment
-from basicsr.utils import FileClient, get_root_logger, imfrombytes, img2tensor
+from basicsr.utils import FileClient, get_root_logger, img2tensor
 from basicsr.utils.registry import DATASET_REGISTRY
 
 
@@ -16,10 +16,13 @@ class FFHQDataset(data.Dataset):
     Args:
         opt (dict): Config for train datasets. It contains the following keys:
             dataroot_gt (str): Data root path for gt.
-            io_backend (dict): IO backend type and other kwarg.
+            io_backend (dict): IO backend type and other kwarg. Set `image_cache` to cache the decoded images,
+                see :class:`basicsr.utils.file_client.DecodedImageCache`.
             mean (list | tuple): Image mean.
             std (list | tuple): Image std.
             use_hflip (bool): Whether to horizontally flip.
+            uint8 (bool): Keep the images as uint8 tensors, which are converted to float32 and normalized by the
+                prefetchers (on GPU for CUDAPrefetcher). Default: False.
 
     """
 
@@ -33,11 +36,13 @@ class FFHQDataset(data.Dataset):
         self.gt_folder = opt['dataroot_gt']
         self.mean = opt['mean']
         self.std = opt['std']
+        # keep uint8 images in training, they are converted to float and normalized by the prefetchers on GPU
+        self.uint8 = opt.get('uint8', False) and opt['phase'] == 'train'
 
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.io_backend_opt['db_paths'] = self.gt_folder
-            if not self.gt_folder.endswith('.lmdb'):
-                raise ValueError("'dataroot_gt' should end with '.lmdb', but received {self.gt_folder}")
+            if not self.gt_folder.endswith(('.lmdb', '.shard')):
+                raise ValueError("'dataroot_gt' should end with '.lmdb' or '.shard', but received {self.gt_folder}")
             with open(osp.join(self.gt_folder, 'meta_info.txt')) as fin:
                 self.paths = [line.split('.')[0] for line in fin]
         else:
@@ -54,7 +59,7 @@ class FFHQDataset(data.Dataset):
         retry = 3
         while retry > 0:
             try:
-                img_bytes = self.file_client.get(gt_path)
+                img_gt = self.file_client.get_img(gt_path, float32=not self.uint8)
             except Exception as e:
                 logger = get_root_logger()
                 logger.warning(f'File client error: {e}, remaining retry times: {retry - 1}')
@@ -66,14 +71,14 @@ class FFHQDataset(data.Dataset):
                 break
             finally:
                 retry -= 1
-        img_gt = imfrombytes(img_bytes, float32=True)
 
         # random horizontal flip
         img_gt = augment(img_gt, hflip=self.opt['use_hflip'], rotation=False)
         # BGR to RGB, HWC to CHW, numpy to tensor
-        img_gt = img2tensor(img_gt, bgr2rgb=True, float32=True)
+        img_gt = img2tensor(img_gt, bgr2rgb=True, float32=not self.uint8)
         # normalize
-        normalize(img_gt, self.mean, self.std, inplace=True)
+        if not self.uint8:
+            normalize(img_gt, self.mean, self.std, inplace=True)
         return {'gt': img_gt, 'gt_path': gt_path}
 
     def __len__(self):
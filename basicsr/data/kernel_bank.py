@@ -0,0 +1,180 @@
+import json
+import math
+import numpy as np
+import os
+import random
+import torch
+from os import path as osp
+
+from basicsr.data.degradations import circular_lowpass_kernel, random_mixed_kernels
+from basicsr.utils import atomic_open, get_root_logger
+
+# kernel settings of the two degradations, the bank should be regenerated when they change
+_BLUR_KEYS = [
+    'blur_kernel_size', 'kernel_list', 'kernel_prob', 'blur_sigma', 'betag_range', 'betap_range', 'blur_kernel_size2',
+    'kernel_list2', 'kernel_prob2', 'blur_sigma2', 'betag_range2', 'betap_range2'
+]
+
+
+def generate_kernel_bank(bank_path, opt, kernel_range, num_kernels=2000, seed=0, pad_to=21):
+    """Generate a kernel bank for :class:`KernelBank`.
+
+    Contents of a kernel bank. The file structure is:
+
+    ::
+
+        example.kernel_bank
+        ├── blur1.npy
+        ├── blur2.npy
+        ├── sinc.npy
+        ├── final_sinc.npy
+        ├── meta_info.json
+
+    Each npy file is a float32 array with shape
+    (len(kernel_range), num_kernels, pad_to, pad_to), storing num_kernels
+    kernels of each kernel size (zero-padded to pad_to):
+
+    - blur1 / blur2: mixed kernels of the first / second degradation.
+    - sinc: sinc filters of the first and second degradations, whose cutoff
+      frequency is in [pi / 3, pi] for kernel sizes < 13, and in [pi / 5, pi]
+      otherwise.
+    - final_sinc: the final sinc filters, with the cutoff frequency in
+      [pi / 3, pi].
+
+    meta_info.json records the kernel settings and the shapes.
+
+    Args:
+        bank_path (str): Kernel bank folder.
+        opt (dict): Dataset options with the kernel settings, see
+            :class:`basicsr.data.realesrgan_dataset.RealESRGANDataset`.
+        kernel_range (list[int]): Kernel sizes.
+        num_kernels (int): Number of kernels of each kernel size in each
+            array. Default: 2000.
+        seed (int): Random seed. Default: 0.
+        pad_to (int): Padded kernel size. Default: 21.
+    """
+    # keep the global random states of the caller
+    py_state, np_state = random.getstate(), np.random.get_state()
+    random.seed(seed)
+    np.random.seed(seed)
+
+    blur1, blur2, sinc, final_sinc = [np.zeros((len(kernel_range), num_kernels, pad_to, pad_to), dtype=np.float32)
+                                      for _ in range(4)]
+    for i, kernel_size in enumerate(kernel_range):
+        pad_size = (pad_to - kernel_size) // 2
+        for j in range(num_kernels):
+            blur1[i, j, pad_size:pad_size + kernel_size, pad_size:pad_size + kernel_size] = random_mixed_kernels(
+                opt['kernel_list'],
+                opt['kernel_prob'],
+                kernel_size,
+                opt['blur_sigma'],
+                opt['blur_sigma'], [-math.pi, math.pi],
+                opt['betag_range'],
+                opt['betap_range'],
+                noise_range=None)
+            blur2[i, j, pad_size:pad_size + kernel_size, pad_size:pad_size + kernel_size] = random_mixed_kernels(
+                opt['kernel_list2'],
+                opt['kernel_prob2'],
+                kernel_size,
+                opt['blur_sigma2'],
+                opt['blur_sigma2'], [-math.pi, math.pi],
+                opt['betag_range2'],
+                opt['betap_range2'],
+                noise_range=None)
+            # this sinc filter setting is for kernels ranging from [7, 21]
+            omega_c = np.random.uniform(np.pi / 3 if kernel_size < 13 else np.pi / 5, np.pi)
+            sinc[i, j] = circular_lowpass_kernel(omega_c, kernel_size, pad_to=pad_to)
+            omega_c = np.random.uniform(np.pi / 3, np.pi)
+            final_sinc[i, j] = circular_lowpass_kernel(omega_c, kernel_size, pad_to=pad_to)
+    random.setstate(py_state)
+    np.random.set_state(np_state)
+
+    # meta_info.json is written at last, so that concurrent processes do not read incomplete banks. The banks
+    # generated by concurrent processes are the same.
+    os.makedirs(bank_path, exist_ok=True)
+    for name, kernels in zip(['blur1', 'blur2', 'sinc', 'final_sinc'], [blur1, blur2, sinc, final_sinc]):
+        with atomic_open(osp.join(bank_path, f'{name}.npy')) as f:
+            np.save(f, kernels)
+    meta_info = {key: opt[key] for key in _BLUR_KEYS}
+    meta_info.update(kernel_range=list(kernel_range), num_kernels=num_kernels, pad_to=pad_to)
+    with atomic_open(osp.join(bank_path, 'meta_info.json'), 'w') as f:
+        json.dump(meta_info, f)
+
+
+class KernelBank():
+    """Bank of pre-generated blur kernels and sinc filters for Real-ESRGAN degradations.
+
+    The kernels are generated once by :func:`generate_kernel_bank` (if the
+    bank does not exist) and memory-mapped, so that they are shared by all
+    the dataloader workers. Sampling draws a kernel size and a kernel type
+    with the same probabilities as
+    :class:`basicsr.data.realesrgan_dataset.RealESRGANDataset`, and then
+    picks a random kernel of them in the bank. With enough kernels, the
+    distribution approximates the one of generating kernels on the fly.
+
+    Args:
+        bank_path (str): Kernel bank folder.
+        opt (dict): Dataset options with the kernel settings. Its
+            `kernel_bank` dict may contain `num_kernels` and `seed` for
+            generating the bank, see :func:`generate_kernel_bank`.
+        kernel_range (list[int]): Kernel sizes.
+    """
+
+    def __init__(self, bank_path, opt, kernel_range):
+        self.bank_path = bank_path
+        self.opt = opt
+        self.kernel_range = kernel_range
+        bank_opt = opt['kernel_bank']
+        if not osp.exists(osp.join(bank_path, 'meta_info.json')):
+            logger = get_root_logger()
+            logger.info(f'Generate the kernel bank in {bank_path}.')
+            generate_kernel_bank(
+                bank_path,
+                opt,
+                kernel_range,
+                num_kernels=bank_opt.get('num_kernels', 2000),
+                seed=bank_opt.get('seed', 0))
+
+        with open(osp.join(bank_path, 'meta_info.json')) as f:
+            meta_info = json.load(f)
+        # compare through json to ignore the differences between tuples and lists
+        for key in _BLUR_KEYS:
+            if json.loads(json.dumps(opt[key])) != meta_info[key]:
+                raise ValueError(f'{key} of the kernel bank {bank_path} is {meta_info[key]}, but {opt[key]} in the '
+                                 'options. Please remove the kernel bank to regenerate it.')
+        if meta_info['kernel_range'] != list(kernel_range):
+            raise ValueError(f'The kernel bank {bank_path} has kernel sizes {meta_info["kernel_range"]}, '
+                             f'but {kernel_range} is required.')
+        # opened lazily in each process, so that the memory maps are not pickled
+        self.banks = None
+
+    def _get(self, name):
+        if self.banks is None:
+            self.banks = {
+                name: np.load(osp.join(self.bank_path, f'{name}.npy'), mmap_mode='r')
+                for name in ['blur1', 'blur2', 'sinc', 'final_sinc']
+            }
+        return self.banks[name]
+
+    def _sample(self, name, size_idx):
+        bank = self._get(name)
+        return torch.from_numpy(np.array(bank[size_idx, random.randrange(bank.shape[1])]))
+
+    def sample_kernel(self, order, sinc_prob):
+        """Sample a padded blur kernel of the first (order=1) or second (order=2) degradation.
+
+        Args:
+            order (int): 1 or 2.
+            sinc_prob (float): Probability of sinc filters.
+
+        Returns:
+            Tensor: Kernel with shape (21, 21).
+        """
+        size_idx = random.randrange(len(self.kernel_range))
+        if np.random.uniform() < sinc_prob:
+            return self._sample('sinc', size_idx)
+        return self._sample(f'blur{order}', size_idx)
+
+    def sample_final_sinc(self):
+        """Sample a final sinc filter with shape (21, 21)."""
+        return self._sample('final_sinc', random.randrange(len(self.kernel_range)))
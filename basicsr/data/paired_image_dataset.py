@@ -1,21 +1,71 @@
+import random
 from torch.utils import data as data
 from torchvision.transforms.functional import normalize
 
 from basicsr.data.data_util import paired_paths_from_folder, paired_paths_from_lmdb, paired_paths_from_meta_info_file
+from basicsr.data.tar_util import TarShardStream, get_sample_bytes, tar_shards_from_folder
 from basicsr.data.transforms import augment, paired_random_crop
 from basicsr.utils import FileClient, bgr2ycbcr, imfrombytes, img2tensor
+from basicsr.utils.dist_util import get_dist_info
 from basicsr.utils.registry import DATASET_REGISTRY
 
 
+class PairedImageProcessMixin():
+    """Augmentation, cropping and normalization of the gt and lq image pairs, shared by :class:`PairedImageDataset`
+    and :class:`PairedImageTarDataset`."""
+
+    def init_process_settings(self, opt):
+        self.mean = opt['mean'] if 'mean' in opt else None
+        self.std = opt['std'] if 'std' in opt else None
+        # keep uint8 images in training, they are converted to float and normalized by the prefetchers on GPU
+        self.gpu_augment = opt.get('gpu_augment', False) and opt['phase'] == 'train'
+        self.uint8 = (opt.get('uint8', False) or self.gpu_augment) and opt['phase'] == 'train'
+        self.crop_size = opt.get('gpu_augment_size', opt['gt_size']) if self.gpu_augment else opt.get('gt_size')
+
+    def process(self, img_gt, img_lq, gt_path, lq_path):
+        """Augment, crop and normalize a loaded gt and lq image pair."""
+        scale = self.opt['scale']
+
+        # augmentation for training
+        if self.opt['phase'] == 'train':
+            # random crop
+            img_gt, img_lq = paired_random_crop(img_gt, img_lq, self.crop_size, scale, gt_path)
+            # flip, rotation (on GPU for gpu_augment)
+            if not self.gpu_augment:
+                img_gt, img_lq = augment([img_gt, img_lq], self.opt['use_hflip'], self.opt['use_rot'])
+
+        # color space transform
+        if 'color' in self.opt and self.opt['color'] == 'y':
+            img_gt = bgr2ycbcr(img_gt, y_only=True)[..., None]
+            img_lq = bgr2ycbcr(img_lq, y_only=True)[..., None]
+
+        # crop the unmatched GT images during validation or testing, especially for SR benchmark datasets
+        # TODO: It is better to update the datasets, rather than force to crop
+        if self.opt['phase'] != 'train':
+            img_gt = img_gt[0:img_lq.shape[0] * scale, 0:img_lq.shape[1] * scale, :]
+
+        # BGR to RGB, HWC to CHW, numpy to tensor
+        img_gt, img_lq = img2tensor([img_gt, img_lq], bgr2rgb=True, float32=not self.uint8)
+        # normalize
+        if not self.uint8 and (self.mean is not None or self.std is not None):
+            normalize(img_lq, self.mean, self.std, inplace=True)
+            normalize(img_gt, self.mean, self.std, inplace=True)
+
+        if self.gpu_augment:
+            return {'lq': img_lq, 'gt': img_gt, 'lq_path': lq_path, 'gt_path': gt_path, 'gpu_augment': True}
+        return {'lq': img_lq, 'gt': img_gt, 'lq_path': lq_path, 'gt_path': gt_path}
+
+
 @DATASET_REGISTRY.register()
-class PairedImageDataset(data.Dataset):
+class PairedImageDataset(PairedImageProcessMixin, data.Dataset):
     """Paired image dataset for image restoration.
 
     Read LQ (Low Quality, e.g. LR (Low Resolution), blurry, noisy, etc) and GT image pairs.
 
     There are three modes:
 
-    1. **lmdb**: Use lmdb files. If opt['io_backend'] == lmdb.
+    1. **lmdb**: Use lmdb files. If opt['io_backend'] == lmdb. For shard databases with tiled images, training
+        crops only decode the tiles they cover.
     2. **meta_info_file**: Use meta information file to generate paths. \
         If opt['io_backend'] != lmdb and opt['meta_info_file'] is not None.
     3. **folder**: Scan folders to generate paths. The rest.
@@ -25,14 +75,24 @@ class PairedImageDataset(data.Dataset):
         dataroot_gt (str): Data root path for gt.
         dataroot_lq (str): Data root path for lq.
         meta_info_file (str): Path for meta information file.
-        io_backend (dict): IO backend type and other kwarg.
+        io_backend (dict): IO backend type and other kwarg. Set `image_cache` (e.g., dict(max_size=32 * 1024**3)) to
+            cache the decoded images, see :class:`basicsr.utils.file_client.DecodedImageCache`.
         filename_tmpl (str): Template for each filename. Note that the template excludes the file extension.
             Default: '{}'.
+        path_index_dir (str, optional): Folder to cache the scanned file names in the folder mode, see
+            :func:`basicsr.data.data_util.paired_paths_from_folder`.
         gt_size (int): Cropped patched size for gt patches.
         use_hflip (bool): Use horizontal flips.
         use_rot (bool): Use rotation (use vertical flip and transposing h and w for implementation).
         scale (bool): Scale, which will be added automatically.
         phase (str): 'train' or 'val'.
+        uint8 (bool): Keep the training images as uint8 tensors, which are converted to float32 and normalized by
+            the prefetchers (on GPU for CUDAPrefetcher). It reduces the data transferred from the dataloader workers
+            and to the GPU. Default: False.
+        gpu_augment (bool): Only crop uint8 regions of gpu_augment_size in the dataloader workers, and leave the
+            final random crop (of gt_size) and the flips and rotations of the batches to the model on GPU, see
+            :func:`basicsr.data.transforms.paired_random_crop_augment_pt`. Default: False.
+        gpu_augment_size (int): GT size of the regions for gpu_augment. Default: gt_size.
     """
 
     def __init__(self, opt):
@@ -41,8 +101,7 @@ class PairedImageDataset(data.Dataset):
         # file client (io backend)
         self.file_client = None
         self.io_backend_opt = opt['io_backend']
-        self.mean = opt['mean'] if 'mean' in opt else None
-        self.std = opt['std'] if 'std' in opt else None
+        self.init_process_settings(opt)
 
         self.gt_folder, self.lq_folder = opt['dataroot_gt'], opt['dataroot_lq']
         if 'filename_tmpl' in opt:
@@ -50,7 +109,7 @@ class PairedImageDataset(data.Dataset):
         else:
             self.filename_tmpl = '{}'
 
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.io_backend_opt['db_paths'] = [self.lq_folder, self.gt_folder]
             self.io_backend_opt['client_keys'] = ['lq', 'gt']
             self.paths = paired_paths_from_lmdb([self.lq_folder, self.gt_folder], ['lq', 'gt'])
@@ -58,49 +117,96 @@ class PairedImageDataset(data.Dataset):
             self.paths = paired_paths_from_meta_info_file([self.lq_folder, self.gt_folder], ['lq', 'gt'],
                                                           self.opt['meta_info_file'], self.filename_tmpl)
         else:
-            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl)
+            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl,
+                                                  opt.get('path_index_dir'))
 
     def __getitem__(self, index):
         if self.file_client is None:
             self.file_client = FileClient(self.io_backend_opt.pop('type'), **self.io_backend_opt)
 
-        scale = self.opt['scale']
-
         # Load gt and lq images. Dimension order: HWC; channel order: BGR;
-        # image range: [0, 1], float32.
-        gt_path = self.paths[index]['gt_path']
-        img_bytes = self.file_client.get(gt_path, 'gt')
-        img_gt = imfrombytes(img_bytes, float32=True)
-        lq_path = self.paths[index]['lq_path']
-        img_bytes = self.file_client.get(lq_path, 'lq')
-        img_lq = imfrombytes(img_bytes, float32=True)
+        # image range: [0, 1], float32 (or [0, 255], uint8 in the uint8 mode).
+        paths = self.paths[index]
+        gt_path = paths['gt_path']
+        lq_path = paths['lq_path']
+        # image shape from the path index or the shard database, without decoding the image
+        lq_shape = paths.get('lq_shape') if self.opt['phase'] == 'train' else None
+        if lq_shape is None and self.opt['phase'] == 'train':
+            lq_shape = self.file_client.get_img_shape(lq_path, 'lq')
+        if lq_shape is not None:
+            # choose the random crop from the image shape, and only decode (tiled shards) or convert the cropped
+            # regions
+            scale, gt_size = self.opt['scale'], self.crop_size
+            lq_patch_size = gt_size // scale
+            h_lq, w_lq = lq_shape[0:2]
+            top = random.randint(0, max(h_lq - lq_patch_size, 0))
+            left = random.randint(0, max(w_lq - lq_patch_size, 0))
+            img_gt = self.file_client.get_img_region(
+                gt_path, (top * scale, left * scale, gt_size, gt_size), 'gt', float32=not self.uint8)
+            img_lq = self.file_client.get_img_region(
+                lq_path, (top, left, lq_patch_size, lq_patch_size), 'lq', float32=not self.uint8)
+        else:
+            img_gt = self.file_client.get_img(gt_path, 'gt', float32=not self.uint8)
+            img_lq = self.file_client.get_img(lq_path, 'lq', float32=not self.uint8)
 
-        # augmentation for training
-        if self.opt['phase'] == 'train':
-            gt_size = self.opt['gt_size']
-            # random crop
-            img_gt, img_lq = paired_random_crop(img_gt, img_lq, gt_size, scale, gt_path)
-            # flip, rotation
-            img_gt, img_lq = augment([img_gt, img_lq], self.opt['use_hflip'], self.opt['use_rot'])
+        return self.process(img_gt, img_lq, gt_path, lq_path)
 
-        # color space transform
-        if 'color' in self.opt and self.opt['color'] == 'y':
-            img_gt = bgr2ycbcr(img_gt, y_only=True)[..., None]
-            img_lq = bgr2ycbcr(img_lq, y_only=True)[..., None]
+    def __len__(self):
+        return len(self.paths)
 
-        # crop the unmatched GT images during validation or testing, especially for SR benchmark datasets
-        # TODO: It is better to update the datasets, rather than force to crop
-        if self.opt['phase'] != 'train':
-            img_gt = img_gt[0:img_lq.shape[0] * scale, 0:img_lq.shape[1] * scale, :]
 
-        # BGR to RGB, HWC to CHW, numpy to tensor
-        img_gt, img_lq = img2tensor([img_gt, img_lq], bgr2rgb=True, float32=True)
-        # normalize
-        if self.mean is not None or self.std is not None:
-            normalize(img_lq, self.mean, self.std, inplace=True)
-            normalize(img_gt, self.mean, self.std, inplace=True)
+@DATASET_REGISTRY.register()
+class PairedImageTarDataset(PairedImageProcessMixin, data.IterableDataset):
+    """Iterable version of :class:`PairedImageDataset` streaming from tar shards.
 
-        return {'lq': img_lq, 'gt': img_gt, 'lq_path': lq_path, 'gt_path': gt_path}
+    Each sample in the tar shards contains `key.gt.*` and `key.lq.*`, e.g., `0001_s001.gt.png`, see
+    :func:`basicsr.data.tar_util.tar_shards_from_folder`. The shards are
+    shuffled and split across DDP ranks and dataloader workers, and the
+    samples are shuffled with an in-memory buffer. It reads large sequential
+    blocks, which is friendly to network file systems.
+
+    Args:
+        opt (dict): Config for train datasets. Besides the keys of
+            :class:`PairedImageDataset` (except dataroot_gt, dataroot_lq,
+            meta_info_file, io_backend and filename_tmpl), it contains:
+        dataroot_tar (str): Folder of tar shards.
+        shuffle (bool): Whether to shuffle shards and samples. Default: True.
+        shuffle_buffer_size (int): Size of the shuffle buffer. Default: 1000.
+        shuffle_seed (int): Seed for shuffling. Default: 0.
+        dataset_enlarge_ratio (int): Enlarging ratio. Default: 1.
+    """
+
+    def __init__(self, opt):
+        super(PairedImageTarDataset, self).__init__()
+        self.opt = opt
+        self.init_process_settings(opt)
+
+        shards, num_samples = tar_shards_from_folder(opt['dataroot_tar'])
+        rank, world_size = get_dist_info()
+        self.stream = TarShardStream(
+            shards,
+            num_samples,
+            rank,
+            world_size,
+            shuffle=opt.get('shuffle', True),
+            shuffle_buffer_size=opt.get('shuffle_buffer_size', 1000),
+            ratio=opt.get('dataset_enlarge_ratio', 1),
+            seed=opt.get('shuffle_seed', 0))
+
+    def set_epoch(self, epoch):
+        self.stream.set_epoch(epoch)
+
+    def set_batch_size(self, batch_size):
+        self.stream.set_batch_size(batch_size)
+
+    def __iter__(self):
+        worker_info = data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        for key, sample in self.stream.iter_samples(worker_id, num_workers):
+            img_gt = imfrombytes(get_sample_bytes(sample, 'gt'), float32=not self.uint8)
+            img_lq = imfrombytes(get_sample_bytes(sample, 'lq'), float32=not self.uint8)
+            yield self.process(img_gt, img_lq, key, key)
 
     def __len__(self):
-        return len(self.paths)
+        # number of samples of this rank, already enlarged
+        return len(self.stream)
@@ -1,7 +1,46 @@
+import collections
 import queue as Queue
 import threading
 import torch
 from torch.utils.data import DataLoader
+from torchvision.transforms.functional import normalize
+
+
+def batch_to_float(batch, mean=None, std=None):
+    """Convert the uint8 image tensors in a batch to float32 in [0, 1].
+
+    Datasets with the `uint8` option return uint8 images to reduce the data
+    transferred from the dataloader workers and to the GPU. CPUPrefetcher
+    converts them back with it, and CUDAPrefetcher converts them on the GPU.
+
+    Args:
+        batch (dict): A batch from the dataloader. It is modified in place.
+        mean (list | tuple | None): Mean for normalizing the images.
+            Default: None.
+        std (list | tuple | None): Std for normalizing the images.
+            Default: None.
+
+    Returns:
+        dict: The batch with float32 images.
+    """
+    for k, v in batch.items():
+        if torch.is_tensor(v) and v.dtype == torch.uint8:
+            v = v.float().div_(255.)
+            if mean is not None or std is not None:
+                normalize(v, mean, std, inplace=True)
+            batch[k] = v
+    return batch
+
+
+def pin_memory(data):
+    """Copy the tensors in (nested) dicts, lists and tuples to pinned memory."""
+    if torch.is_tensor(data):
+        return data.pin_memory()
+    if isinstance(data, dict):
+        return {k: pin_memory(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(pin_memory(v) for v in data)
+    return data
 
 
 class PrefetchGenerator(threading.Thread):
@@ -9,41 +48,90 @@ class PrefetchGenerator(threading.Thread):
 
     Reference: https://stackoverflow.com/questions/7323664/python-generator-pre-fetch
 
+    A producer thread iterates over the generator and keeps up to
+    num_prefetch_queue items in flight. Exceptions in the producer are raised
+    again in the consumer, and ``close()`` stops the producer, e.g., when an
+    epoch ends early.
+
     Args:
         generator: Python generator.
         num_prefetch_queue (int): Number of prefetch queue.
+        pin_memory (bool): Whether to copy the tensors to pinned memory in the
+            producer thread. Default: False.
     """
 
-    def __init__(self, generator, num_prefetch_queue):
+    _END = object()
+
+    def __init__(self, generator, num_prefetch_queue, pin_memory=False):
         threading.Thread.__init__(self)
         self.queue = Queue.Queue(num_prefetch_queue)
         self.generator = generator
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        # pin memory on the device of the current process, instead of the default cuda:0 in the new thread
+        self.device_id = torch.cuda.current_device() if self.pin_memory else None
+        self.stop_event = threading.Event()
         self.daemon = True
         self.start()
 
+    def _put(self, item):
+        # put with timeout, so that the producer stops soon after close()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
     def run(self):
-        for item in self.generator:
-            self.queue.put(item)
-        self.queue.put(None)
+        if self.device_id is not None:
+            torch.cuda.set_device(self.device_id)
+        try:
+            for item in self.generator:
+                if self.pin_memory:
+                    item = pin_memory(item)
+                if not self._put(item):
+                    return
+            self._put(self._END)
+        except Exception as error:  # raised again in the consumer
+            self._put(error)
+        finally:
+            # release the generator (e.g., a dataloader iterator and its workers) in the producer
+            self.generator = None
 
     def __next__(self):
+        if self.stop_event.is_set():
+            raise StopIteration
         next_item = self.queue.get()
-        if next_item is None:
+        if next_item is self._END:
+            self.stop_event.set()
             raise StopIteration
+        if isinstance(next_item, Exception):
+            self.close()
+            raise next_item
         return next_item
 
     def __iter__(self):
         return self
 
+    def close(self):
+        """Stop the producer thread and drop the prefetched items."""
+        self.stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
 
 class PrefetchDataLoader(DataLoader):
     """Prefetch version of dataloader.
 
     Reference: https://github.com/IgorSusmelj/pytorch-styleguide/issues/5#
 
-    TODO:
-    Need to test on single gpu and ddp (multi-gpu). There is a known issue in
-    ddp.
+    The batches are prefetched by a :class:`PrefetchGenerator` thread, which
+    also pins the memory if pin_memory is True. A new iterator stops the
+    producer of the previous one first, so that workers are never shared by
+    two producers and never leak when an epoch ends early.
 
     Args:
         num_prefetch_queue (int): Number of prefetch queue.
@@ -52,10 +140,16 @@ class PrefetchDataLoader(DataLoader):
 
     def __init__(self, num_prefetch_queue, **kwargs):
         self.num_prefetch_queue = num_prefetch_queue
+        # pin in the prefetch thread, instead of in another pin memory thread of the dataloader
+        self.pin_prefetch = kwargs.pop('pin_memory', False)
+        self.prefetch_generator = None
         super(PrefetchDataLoader, self).__init__(**kwargs)
 
     def __iter__(self):
-        return PrefetchGenerator(super().__iter__(), self.num_prefetch_queue)
+        if self.prefetch_generator is not None:
+            self.prefetch_generator.close()
+        self.prefetch_generator = PrefetchGenerator(super().__iter__(), self.num_prefetch_queue, self.pin_prefetch)
+        return self.prefetch_generator
 
 
 class CPUPrefetcher():
@@ -68,23 +162,41 @@ class CPUPrefetcher():
     def __init__(self, loader):
         self.ori_loader = loader
         self.loader = iter(loader)
+        self.mean = getattr(loader.dataset, 'mean', None)
+        self.std = getattr(loader.dataset, 'std', None)
 
     def next(self):
         try:
-            return next(self.loader)
+            return batch_to_float(next(self.loader), self.mean, self.std)
         except StopIteration:
             return None
 
     def reset(self):
+        self.close()
         self.loader = iter(self.ori_loader)
 
+    def close(self):
+        """Stop prefetching, e.g., when the training ends in the middle of an epoch."""
+        if hasattr(self.loader, 'close'):
+            self.loader.close()
+
 
 class CUDAPrefetcher():
     """CUDA prefetcher.
 
     Reference: https://github.com/NVIDIA/apex/issues/304#
 
-    It may consume more GPU memory.
+    Up to num_prefetch_queue batches (in the train dataset options) are copied
+    to the GPU in advance on a side stream, so that bursts of slow data
+    loading are absorbed. The batches are copied into a ring of preallocated
+    device buffers (one buffer for each tensor in a batch), and CUDA events
+    order the copies with the training on the current stream: a batch is used
+    only after its copy is done, and its buffers are refilled only after the
+    training steps queued before the following ``next()`` are done. As the
+    buffers are allocated on the current stream, the caching allocator never
+    reuses their memory while the side stream still writes to it.
+
+    It consumes GPU memory for num_prefetch_queue + 1 batches.
 
     Args:
         loader: Dataloader.
@@ -93,30 +205,93 @@ class CUDAPrefetcher():
 
     def __init__(self, loader, opt):
         self.ori_loader = loader
-        self.loader = iter(loader)
+        self.loader = None
         self.opt = opt
         self.stream = torch.cuda.Stream()
         self.device = torch.device('cuda' if opt['num_gpu'] != 0 else 'cpu')
-        self.preload()
+        self.mean = getattr(loader.dataset, 'mean', None)
+        self.std = getattr(loader.dataset, 'std', None)
+        self.num_prefetch_queue = max(1, opt['datasets']['train'].get('num_prefetch_queue', 1))
+        # num_prefetch_queue batches in flight and one batch in use
+        num_slots = self.num_prefetch_queue + 1
+        self.buffers = [{} for _ in range(num_slots)]
+        self.ready_events = [torch.cuda.Event() for _ in range(num_slots)]
+        self.free_events = [torch.cuda.Event() for _ in range(num_slots)]
+        self.next_slot = 0
+        self.in_use = None
+        self.pending = collections.deque()
+        self.reset()
+
+    def _get_buffer(self, slot, key, shape, dtype):
+        buffer = self.buffers[slot].get(key)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = torch.empty(shape, dtype=dtype, device=self.device)
+            self.buffers[slot][key] = buffer
+            self.allocated = True
+        return buffer
 
     def preload(self):
+        """Load a batch and copy it to the GPU asynchronously."""
         try:
-            self.batch = next(self.loader)  # self.batch is a dict
+            batch = next(self.loader)  # batch is a dict
         except StopIteration:
-            self.batch = None
-            return None
-        # put tensors to gpu
+            return False
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % len(self.buffers)
+
+        # allocate the buffers on the current stream
+        self.allocated = False
+        copies = []
+        for k, v in batch.items():
+            if torch.is_tensor(v):
+                buffer = self._get_buffer(slot, k, v.shape, v.dtype)
+                # uint8 images are converted to float on GPU
+                out = self._get_buffer(slot, f'{k}_float', v.shape, torch.float32) if v.dtype == torch.uint8 else None
+                copies.append((k, v, buffer, out))
+
+        # wait for the training steps that still read the buffers
+        self.stream.wait_event(self.free_events[slot])
+        if self.allocated:
+            # the new memory may be freed by the training steps queued after the event
+            self.stream.wait_stream(torch.cuda.current_stream())
         with torch.cuda.stream(self.stream):
-            for k, v in self.batch.items():
-                if torch.is_tensor(v):
-                    self.batch[k] = self.batch[k].to(device=self.device, non_blocking=True)
+            for k, v, buffer, out in copies:
+                buffer.copy_(v, non_blocking=True)
+                if out is not None:
+                    buffer = out.copy_(buffer).div_(255.)
+                    if self.mean is not None or self.std is not None:
+                        normalize(buffer, self.mean, self.std, inplace=True)
+                batch[k] = buffer
+        self.ready_events[slot].record(self.stream)
+        self.pending.append((slot, batch))
+        return True
+
+    def _release(self):
+        if self.in_use is not None:
+            # the buffers are free once the training steps queued until now are done
+            self.free_events[self.in_use].record(torch.cuda.current_stream())
+            self.in_use = None
 
     def next(self):
-        torch.cuda.current_stream().wait_stream(self.stream)
-        batch = self.batch
-        self.preload()
+        self._release()
+        if not self.pending:
+            return None
+        slot, batch = self.pending.popleft()
+        torch.cuda.current_stream().wait_event(self.ready_events[slot])
+        self.in_use = slot
+        # keep num_prefetch_queue batches in flight, reusing the buffers released above
+        while len(self.pending) < self.num_prefetch_queue and self.preload():
+            pass
         return batch
 
     def reset(self):
+        self._release()
+        self.close()
         self.loader = iter(self.ori_loader)
-        self.preload()
+        while len(self.pending) < self.num_prefetch_queue and self.preload():
+            pass
+
+    def close(self):
+        if hasattr(self.loader, 'close'):
+            self.loader.close()
+        self.pending.clear()
@@ -9,52 +9,22 @@ import torch
 from torch.utils import data as data
 
 from basicsr.data.degradations import circular_lowpass_kernel, random_mixed_kernels
+from basicsr.data.kernel_bank import KernelBank
+from basicsr.data.tar_util import TarShardStream, get_sample_bytes, tar_shards_from_folder
 from basicsr.data.transforms import augment
 from basicsr.utils import FileClient, get_root_logger, imfrombytes, img2tensor
+from basicsr.utils.dist_util import get_dist_info
 from basicsr.utils.registry import DATASET_REGISTRY
 
 
-@DATASET_REGISTRY.register(suffix='basicsr')
-class RealESRGANDataset(data.Dataset):
-    """Dataset used for Real-ESRGAN model:
-    Real-ESRGAN: Training Real-World Blind Super-Resolution with Pure Synthetic Data.
-
-    It loads gt (Ground-Truth) images, and augments them.
-    It also generates blur kernels and sinc kernels for generating low-quality images.
-    Note that the low-quality images are processed in tensors on GPUS for faster processing.
-
-    Args:
-        opt (dict): Config for train datasets. It contains the following keys:
-            dataroot_gt (str): Data root path for gt.
-            meta_info (str): Path for meta information file.
-            io_backend (dict): IO backend type and other kwarg.
-            use_hflip (bool): Use horizontal flips.
-            use_rot (bool): Use rotation (use vertical flip and transposing h and w for implementation).
-            Please see more options in the codes.
-    """
-
-    def __init__(self, opt):
-        super(RealESRGANDataset, self).__init__()
-        self.opt = opt
-        self.file_client = None
-        self.io_backend_opt = opt['io_backend']
-        self.gt_folder = opt['dataroot_gt']
+class RealESRGANProcessMixin():
+    """Augmentation and cropping of the gt images and generation of the kernels, shared by
+    :class:`RealESRGANDataset` and :class:`RealESRGANTarDataset`."""
 
-        # file client (lmdb io backend)
-        if self.io_backend_opt['type'] == 'lmdb':
-            self.io_backend_opt['db_paths'] = [self.gt_folder]
-            self.io_backend_opt['client_keys'] = ['gt']
-            if not self.gt_folder.endswith('.lmdb'):
-                raise ValueError(f"'dataroot_gt' should end with '.lmdb', but received {self.gt_folder}")
-            with open(osp.join(self.gt_folder, 'meta_info.txt')) as fin:
-                self.paths = [line.split('.')[0] for line in fin]
-        else:
-            # disk backend with meta_info
-            # Each line in the meta_info describes the relative path to an image
-            with open(self.opt['meta_info']) as fin:
-                paths = [line.strip().split(' ')[0] for line in fin]
-                self.paths = [os.path.join(self.gt_folder, v) for v in paths]
+    # TODO: 400 is hard-coded. You may change it accordingly
+    crop_pad_size = 400
 
+    def init_kernel_settings(self, opt):
         # blur settings for the first degradation
         self.blur_kernel_size = opt['blur_kernel_size']
         self.kernel_list = opt['kernel_list']
@@ -81,38 +51,24 @@ class RealESRGANDataset(data.Dataset):
         self.pulse_tensor = torch.zeros(21, 21).float()  # convolving with pulse tensor brings no blurry effect
         self.pulse_tensor[10, 10] = 1
 
-    def __getitem__(self, index):
-        if self.file_client is None:
-            self.file_client = FileClient(self.io_backend_opt.pop('type'), **self.io_backend_opt)
-
-        # -------------------------------- Load gt images -------------------------------- #
-        # Shape: (h, w, c); channel order: BGR; image range: [0, 1], float32.
-        gt_path = self.paths[index]
-        # avoid errors caused by high latency in reading files
-        retry = 3
-        while retry > 0:
-            try:
-                img_bytes = self.file_client.get(gt_path, 'gt')
-            except (IOError, OSError) as e:
-                logger = get_root_logger()
-                logger.warn(f'File client error: {e}, remaining retry times: {retry - 1}')
-                # change another file to read
-                index = random.randint(0, self.__len__())
-                gt_path = self.paths[index]
-                time.sleep(1)  # sleep 1s for occasional server congestion
-            else:
-                break
-            finally:
-                retry -= 1
-        img_gt = imfrombytes(img_bytes, float32=True)
+        # do not generate kernels, they are synthesized in batches on GPU by the model
+        self.gpu_kernels = opt.get('gpu_kernels', False)
+        # sample the kernels from a pre-generated kernel bank, instead of generating them for each sample
+        # (not used with gpu_kernels)
+        kernel_bank_opt = opt.get('kernel_bank')
+        if kernel_bank_opt and not self.gpu_kernels:
+            self.kernel_bank = KernelBank(kernel_bank_opt['path'], opt, self.kernel_range)
+        else:
+            self.kernel_bank = None
 
+    def process(self, img_gt, gt_path):
+        """Augment and crop a loaded gt image, and generate the kernels for it."""
         # -------------------- Do augmentation for training: flip, rotation -------------------- #
         img_gt = augment(img_gt, self.opt['use_hflip'], self.opt['use_rot'])
 
         # crop or pad to 400
-        # TODO: 400 is hard-coded. You may change it accordingly
         h, w = img_gt.shape[0:2]
-        crop_pad_size = 400
+        crop_pad_size = self.crop_pad_size
         # pad
         if h < crop_pad_size or w < crop_pad_size:
             pad_h = max(0, crop_pad_size - h)
@@ -126,6 +82,26 @@ class RealESRGANDataset(data.Dataset):
             left = random.randint(0, w - crop_pad_size)
             img_gt = img_gt[top:top + crop_pad_size, left:left + crop_pad_size, ...]
 
+        # BGR to RGB, HWC to CHW, numpy to tensor
+        img_gt = img2tensor([img_gt], bgr2rgb=True, float32=not self.uint8)[0]
+        if self.gpu_kernels:  # the kernels are synthesized by the model
+            return {'gt': img_gt, 'gt_path': gt_path}
+
+        # ---------------------- Generate kernels (used in the degradations on GPU) ---------------------- #
+        if self.kernel_bank is not None:
+            kernel, kernel2, sinc_kernel = self.sample_kernels()
+        else:
+            kernel, kernel2, sinc_kernel = self.generate_kernels()
+
+        return_d = {'gt': img_gt, 'kernel1': kernel, 'kernel2': kernel2, 'sinc_kernel': sinc_kernel, 'gt_path': gt_path}
+        return return_d
+
+    def generate_kernels(self):
+        """Generate the kernels of the two degradations and the final sinc kernel.
+
+        Returns:
+            tuple[Tensor]: kernel1, kernel2 and sinc_kernel with shape (21, 21).
+        """
         # ------------------------ Generate kernels (used in the first degradation) ------------------------ #
         kernel_size = random.choice(self.kernel_range)
         if np.random.uniform() < self.opt['sinc_prob']:
@@ -181,13 +157,165 @@ class RealESRGANDataset(data.Dataset):
         else:
             sinc_kernel = self.pulse_tensor
 
-        # BGR to RGB, HWC to CHW, numpy to tensor
-        img_gt = img2tensor([img_gt], bgr2rgb=True, float32=True)[0]
-        kernel = torch.FloatTensor(kernel)
-        kernel2 = torch.FloatTensor(kernel2)
+        return torch.FloatTensor(kernel), torch.FloatTensor(kernel2), sinc_kernel
 
-        return_d = {'gt': img_gt, 'kernel1': kernel, 'kernel2': kernel2, 'sinc_kernel': sinc_kernel, 'gt_path': gt_path}
-        return return_d
+    def sample_kernels(self):
+        """Sample the kernels from the kernel bank, with the same probabilities as :meth:`generate_kernels`."""
+        kernel = self.kernel_bank.sample_kernel(1, self.opt['sinc_prob'])
+        kernel2 = self.kernel_bank.sample_kernel(2, self.opt['sinc_prob2'])
+        if np.random.uniform() < self.opt['final_sinc_prob']:
+            sinc_kernel = self.kernel_bank.sample_final_sinc()
+        else:
+            sinc_kernel = self.pulse_tensor
+        return kernel, kernel2, sinc_kernel
+
+
+@DATASET_REGISTRY.register(suffix='basicsr')
+class RealESRGANDataset(RealESRGANProcessMixin, data.Dataset):
+    """Dataset used for Real-ESRGAN model:
+    Real-ESRGAN: Training Real-World Blind Super-Resolution with Pure Synthetic Data.
+
+    It loads gt (Ground-Truth) images, and augments them.
+    It also generates blur kernels and sinc kernels for generating low-quality images.
+    Note that the low-quality images are processed in tensors on GPUS for faster processing.
+
+    Args:
+        opt (dict): Config for train datasets. It contains the following keys:
+            dataroot_gt (str): Data root path for gt.
+            meta_info (str): Path for meta information file.
+            io_backend (dict): IO backend type and other kwarg. Set `image_cache` to cache the decoded images,
+                see :class:`basicsr.utils.file_client.DecodedImageCache`.
+            use_hflip (bool): Use horizontal flips.
+            use_rot (bool): Use rotation (use vertical flip and transposing h and w for implementation).
+            uint8 (bool): Keep the training images as uint8 tensors, which are converted to float32 by the
+                prefetchers (on GPU for CUDAPrefetcher). Default: False.
+            kernel_bank (dict): If set, sample the kernels from a memory-mapped kernel bank in `path`, which is
+                generated if it does not exist, see :class:`basicsr.data.kernel_bank.KernelBank`. It is ignored
+                with gpu_kernels. Default: None.
+            gpu_kernels (bool): Do not generate the kernels, and let RealESRGANModel synthesize them in batches on
+                GPU with :func:`basicsr.data.degradations.random_degradation_kernels_pt`. Default: False.
+            Please see more options in the codes.
+    """
+
+    def __init__(self, opt):
+        super(RealESRGANDataset, self).__init__()
+        self.opt = opt
+        self.file_client = None
+        self.io_backend_opt = opt['io_backend']
+        self.gt_folder = opt['dataroot_gt']
+        # keep uint8 images in training, they are converted to float by the prefetchers on GPU
+        self.uint8 = opt.get('uint8', False) and opt['phase'] == 'train'
+
+        # file client (lmdb io backend)
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
+            self.io_backend_opt['db_paths'] = [self.gt_folder]
+            self.io_backend_opt['client_keys'] = ['gt']
+            if not self.gt_folder.endswith(('.lmdb', '.shard')):
+                raise ValueError(f"'dataroot_gt' should end with '.lmdb' or '.shard', but received {self.gt_folder}")
+            with open(osp.join(self.gt_folder, 'meta_info.txt')) as fin:
+                self.paths = [line.split('.')[0] for line in fin]
+        else:
+            # disk backend with meta_info
+            # Each line in the meta_info describes the relative path to an image
+            with open(self.opt['meta_info']) as fin:
+                paths = [line.strip().split(' ')[0] for line in fin]
+                self.paths = [os.path.join(self.gt_folder, v) for v in paths]
+
+        self.init_kernel_settings(opt)
+
+    def __getitem__(self, index):
+        if self.file_client is None:
+            self.file_client = FileClient(self.io_backend_opt.pop('type'), **self.io_backend_opt)
+
+        # -------------------------------- Load gt images -------------------------------- #
+        # Shape: (h, w, c); channel order: BGR; image range: [0, 1], float32 (or [0, 255], uint8 in the uint8 mode).
+        gt_path = self.paths[index]
+        # avoid errors caused by high latency in reading files
+        retry = 3
+        while retry > 0:
+            try:
+                img_gt = self.read_gt(gt_path)
+            except (IOError, OSError) as e:
+                logger = get_root_logger()
+                logger.warn(f'File client error: {e}, remaining retry times: {retry - 1}')
+                # change another file to read
+                index = random.randint(0, self.__len__())
+                gt_path = self.paths[index]
+                time.sleep(1)  # sleep 1s for occasional server congestion
+            else:
+                break
+            finally:
+                retry -= 1
+
+        return self.process(img_gt, gt_path)
+
+    def read_gt(self, gt_path):
+        """Read a gt image. For tiled shard databases, the random crop to crop_pad_size is chosen from the image
+        shape, and only the cropped region is decoded."""
+        if not self.file_client.supports_region('gt'):
+            return self.file_client.get_img(gt_path, 'gt', float32=not self.uint8)
+        h, w = self.file_client.get_img_shape(gt_path, 'gt')[0:2]
+        top = random.randint(0, max(h - self.crop_pad_size, 0))
+        left = random.randint(0, max(w - self.crop_pad_size, 0))
+        return self.file_client.get_img_region(
+            gt_path, (top, left, self.crop_pad_size, self.crop_pad_size), 'gt', float32=not self.uint8)
 
     def __len__(self):
         return len(self.paths)
+
+
+@DATASET_REGISTRY.register(suffix='basicsr')
+class RealESRGANTarDataset(RealESRGANProcessMixin, data.IterableDataset):
+    """Iterable version of :class:`RealESRGANDataset` streaming from tar shards.
+
+    Each sample in the tar shards contains `key.gt.*`, e.g., `0001_s001.gt.png`, see
+    :func:`basicsr.data.tar_util.tar_shards_from_folder`. The shards are
+    shuffled and split across DDP ranks and dataloader workers, and the
+    samples are shuffled with an in-memory buffer.
+
+    Args:
+        opt (dict): Config for train datasets. Besides the keys of
+            :class:`RealESRGANDataset` (except dataroot_gt, meta_info and
+            io_backend), it contains:
+            dataroot_tar (str): Folder of tar shards.
+            shuffle (bool): Whether to shuffle shards and samples. Default: True.
+            shuffle_buffer_size (int): Size of the shuffle buffer. Default: 1000.
+            shuffle_seed (int): Seed for shuffling. Default: 0.
+            dataset_enlarge_ratio (int): Enlarging ratio. Default: 1.
+    """
+
+    def __init__(self, opt):
+        super(RealESRGANTarDataset, self).__init__()
+        self.opt = opt
+        self.uint8 = opt.get('uint8', False) and opt['phase'] == 'train'
+
+        shards, num_samples = tar_shards_from_folder(opt['dataroot_tar'])
+        rank, world_size = get_dist_info()
+        self.stream = TarShardStream(
+            shards,
+            num_samples,
+            rank,
+            world_size,
+            shuffle=opt.get('shuffle', True),
+            shuffle_buffer_size=opt.get('shuffle_buffer_size', 1000),
+            ratio=opt.get('dataset_enlarge_ratio', 1),
+            seed=opt.get('shuffle_seed', 0))
+
+        self.init_kernel_settings(opt)
+
+    def set_epoch(self, epoch):
+        self.stream.set_epoch(epoch)
+
+    def set_batch_size(self, batch_size):
+        self.stream.set_batch_size(batch_size)
+
+    def __iter__(self):
+        worker_info = data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        for key, sample in self.stream.iter_samples(worker_id, num_workers):
+            img_gt = imfrombytes(get_sample_bytes(sample, 'gt'), float32=not self.uint8)
+            yield self.process(img_gt, key)
+
+    def __len__(self):
+        # number of samples of this rank, already enlarged
+        return len(self.stream)
@@ -29,6 +29,8 @@ class RealESRGANPairedDataset(data.Dataset):
         io_backend (dict): IO backend type and other kwarg.
         filename_tmpl (str): Template for each filename. Note that the template excludes the file extension.
             Default: '{}'.
+        path_index_dir (str, optional): Folder to cache the scanned file names in the folder mode, see
+            :func:`basicsr.data.data_util.paired_paths_from_folder`.
         gt_size (int): Cropped patched size for gt patches.
         use_hflip (bool): Use horizontal flips.
         use_rot (bool): Use rotation (use vertical flip and transposing h and w for implementation).
@@ -49,7 +51,7 @@ class RealESRGANPairedDataset(data.Dataset):
         self.filename_tmpl = opt['filename_tmpl'] if 'filename_tmpl' in opt else '{}'
 
         # file client (lmdb io backend)
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.io_backend_opt['db_paths'] = [self.lq_folder, self.gt_folder]
             self.io_backend_opt['client_keys'] = ['lq', 'gt']
             self.paths = paired_paths_from_lmdb([self.lq_folder, self.gt_folder], ['lq', 'gt'])
@@ -68,7 +70,8 @@ class RealESRGANPairedDataset(data.Dataset):
             # disk backend
             # it will scan the whole folder to get meta info
             # it will be time-consuming for folders with too many files. It is recommended using an extra meta txt file
-            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl)
+            self.paths = paired_paths_from_folder([self.lq_folder, self.gt_folder], ['lq', 'gt'], self.filename_tmpl,
+                                                  opt.get('path_index_dir'))
 
     def __getitem__(self, index):
         if self.file_client is None:
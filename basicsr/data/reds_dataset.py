@@ -36,7 +36,9 @@ class REDSDataset(data.Dataset):
         dataroot_flow (str, optional): Data root path for flow.
         meta_info_file (str): Path for meta information file.
         val_partition (str): Validation partition types. 'REDS4' or 'official'.
-        io_backend (dict): IO backend type and other kwarg.
+        io_backend (dict): IO backend type and other kwarg. Set `clip_cache` to cache the decoded LQ clips,
+            see :class:`basicsr.utils.file_client.DecodedClipCache`. Only the center GT frames are read, and they
+            are cached with `image_cache`, see :class:`basicsr.utils.file_client.DecodedImageCache`.
         num_frame (int): Window size for input frames.
         gt_size (int): Cropped patched size for gt patches.
         interval_list (list): Interval list for temporal augmentation.
@@ -75,7 +77,7 @@ class REDSDataset(data.Dataset):
         self.file_client = None
         self.io_backend_opt = opt['io_backend']
         self.is_lmdb = False
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.is_lmdb = True
             if self.flow_root is not None:
                 self.io_backend_opt['db_paths'] = [self.lq_root, self.gt_root, self.flow_root]
@@ -121,46 +123,32 @@ class REDSDataset(data.Dataset):
 
         assert len(neighbor_list) == self.num_frame, (f'Wrong length of neighbor list: {len(neighbor_list)}')
 
-        # get the GT frame (as the center frame)
+        # paths of all the LQ frames in the clip, so that the whole clip can be cached
         if self.is_lmdb:
-            img_gt_path = f'{clip_name}/{frame_name}'
+            clip_lq_paths = [f'{clip_name}/{i:08d}' for i in range(100)]
+            img_gt_path = f'{clip_name}/{center_frame_idx:08d}'
         else:
-            img_gt_path = self.gt_root / clip_name / f'{frame_name}.png'
-        img_bytes = self.file_client.get(img_gt_path, 'gt')
-        img_gt = imfrombytes(img_bytes, float32=True)
+            clip_lq_paths = [self.lq_root / clip_name / f'{i:08d}.png' for i in range(100)]
+            img_gt_path = self.gt_root / clip_name / f'{center_frame_idx:08d}.png'
 
-        # get the neighboring LQ frames
-        img_lqs = []
-        for neighbor in neighbor_list:
-            if self.is_lmdb:
-                img_lq_path = f'{clip_name}/{neighbor:08d}'
-            else:
-                img_lq_path = self.lq_root / clip_name / f'{neighbor:08d}.png'
-            img_bytes = self.file_client.get(img_lq_path, 'lq')
-            img_lq = imfrombytes(img_bytes, float32=True)
-            img_lqs.append(img_lq)
+        # get the GT frame (as the center frame). Only this frame of the GT clip is used, so the GT clip is not
+        # cached in the clip cache
+        img_gt = self.file_client.get_img(img_gt_path, 'gt', float32=True)
+
+        # get the neighboring LQ frames (in one read for lmdb)
+        img_lqs = self.file_client.get_clip_imgs(clip_lq_paths, neighbor_list, 'lq', float32=True)
 
         # get flows
         if self.flow_root is not None:
+            # previous flows and next flows
+            flow_names = [f'{frame_name}_p{i}' for i in range(self.num_half_frames, 0, -1)]
+            flow_names += [f'{frame_name}_n{i}' for i in range(1, self.num_half_frames + 1)]
+            if self.is_lmdb:
+                flow_paths = [f'{clip_name}/{v}' for v in flow_names]
+            else:
+                flow_paths = [self.flow_root / clip_name / f'{v}.png' for v in flow_names]
             img_flows = []
-            # read previous flows
-            for i in range(self.num_half_frames, 0, -1):
-                if self.is_lmdb:
-                    flow_path = f'{clip_name}/{frame_name}_p{i}'
-                else:
-                    flow_path = (self.flow_root / clip_name / f'{frame_name}_p{i}.png')
-                img_bytes = self.file_client.get(flow_path, 'flow')
-                cat_flow = imfrombytes(img_bytes, flag='grayscale', float32=False)  # uint8, [0, 255]
-                dx, dy = np.split(cat_flow, 2, axis=0)
-                flow = dequantize_flow(dx, dy, max_val=20, denorm=False)  # we use max_val 20 here.
-                img_flows.append(flow)
-            # read next flows
-            for i in range(1, self.num_half_frames + 1):
-                if self.is_lmdb:
-                    flow_path = f'{clip_name}/{frame_name}_n{i}'
-                else:
-                    flow_path = (self.flow_root / clip_name / f'{frame_name}_n{i}.png')
-                img_bytes = self.file_client.get(flow_path, 'flow')
+            for img_bytes in self.file_client.get_many(flow_paths, 'flow'):
                 cat_flow = imfrombytes(img_bytes, flag='grayscale', float32=False)  # uint8, [0, 255]
                 dx, dy = np.split(cat_flow, 2, axis=0)
                 flow = dequantize_flow(dx, dy, max_val=20, denorm=False)  # we use max_val 20 here.
@@ -231,7 +219,8 @@ class REDSRecurrentDataset(data.Dataset):
         dataroot_flow (str, optional): Data root path for flow.
         meta_info_file (str): Path for meta information file.
         val_partition (str): Validation partition types. 'REDS4' or 'official'.
-        io_backend (dict): IO backend type and other kwarg.
+        io_backend (dict): IO backend type and other kwarg. Set `clip_cache` to cache the decoded clips,
+            see :class:`basicsr.utils.file_client.DecodedClipCache`.
         num_frame (int): Window size for input frames.
         gt_size (int): Cropped patched size for gt patches.
         interval_list (list): Interval list for temporal augmentation.
@@ -270,7 +259,7 @@ class REDSRecurrentDataset(data.Dataset):
         self.file_client = None
         self.io_backend_opt = opt['io_backend']
         self.is_lmdb = False
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.is_lmdb = True
             if hasattr(self, 'flow_root') and self.flow_root is not None:
                 self.io_backend_opt['db_paths'] = [self.lq_root, self.gt_root, self.flow_root]
@@ -311,26 +300,16 @@ class REDSRecurrentDataset(data.Dataset):
         if self.random_reverse and random.random() < 0.5:
             neighbor_list.reverse()
 
-        # get the neighboring LQ and GT frames
-        img_lqs = []
-        img_gts = []
-        for neighbor in neighbor_list:
-            if self.is_lmdb:
-                img_lq_path = f'{clip_name}/{neighbor:08d}'
-                img_gt_path = f'{clip_name}/{neighbor:08d}'
-            else:
-                img_lq_path = self.lq_root / clip_name / f'{neighbor:08d}.png'
-                img_gt_path = self.gt_root / clip_name / f'{neighbor:08d}.png'
-
-            # get LQ
-            img_bytes = self.file_client.get(img_lq_path, 'lq')
-            img_lq = imfrombytes(img_bytes, float32=True)
-            img_lqs.append(img_lq)
-
-            # get GT
-            img_bytes = self.file_client.get(img_gt_path, 'gt')
-            img_gt = imfrombytes(img_bytes, float32=True)
-            img_gts.append(img_gt)
+        # get the neighboring LQ and GT frames (in one read for each lmdb)
+        if self.is_lmdb:
+            clip_lq_paths = [f'{clip_name}/{i:08d}' for i in range(100)]
+            clip_gt_paths = [f'{clip_name}/{i:08d}' for i in range(100)]
+        else:
+            clip_lq_paths = [self.lq_root / clip_name / f'{i:08d}.png' for i in range(100)]
+            clip_gt_paths = [self.gt_root / clip_name / f'{i:08d}.png' for i in range(100)]
+        img_lqs = self.file_client.get_clip_imgs(clip_lq_paths, neighbor_list, 'lq', float32=True)
+        img_gts = self.file_client.get_clip_imgs(clip_gt_paths, neighbor_list, 'gt', float32=True)
+        img_gt_path = clip_gt_paths[neighbor_list[-1]]
 
         # randomly crop
         img_gts, img_lqs = paired_random_crop(img_gts, img_lqs, gt_size, scale, img_gt_path)
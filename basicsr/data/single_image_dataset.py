@@ -2,8 +2,8 @@ from os import path as osp
 from torch.utils import data as data
 from torchvision.transforms.functional import normalize
 
-from basicsr.data.data_util import paths_from_lmdb
-from basicsr.utils import FileClient, imfrombytes, img2tensor, rgb2ycbcr, scandir
+from basicsr.data.data_util import paths_from_folder, paths_from_lmdb
+from basicsr.utils import FileClient, imfrombytes, img2tensor, rgb2ycbcr
 from basicsr.utils.registry import DATASET_REGISTRY
 
 
@@ -22,6 +22,8 @@ class SingleImageDataset(data.Dataset):
             dataroot_lq (str): Data root path for lq.
             meta_info_file (str): Path for meta information file.
             io_backend (dict): IO backend type and other kwarg.
+            path_index_dir (str, optional): Folder to cache the scanned file names in the folder mode, see
+                :func:`basicsr.data.data_util.paths_from_folder`.
     """
 
     def __init__(self, opt):
@@ -34,7 +36,7 @@ class SingleImageDataset(data.Dataset):
         self.std = opt['std'] if 'std' in opt else None
         self.lq_folder = opt['dataroot_lq']
 
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.io_backend_opt['db_paths'] = [self.lq_folder]
             self.io_backend_opt['client_keys'] = ['lq']
             self.paths = paths_from_lmdb(self.lq_folder)
@@ -42,7 +44,8 @@ class SingleImageDataset(data.Dataset):
             with open(self.opt['meta_info_file'], 'r') as fin:
                 self.paths = [osp.join(self.lq_folder, line.rstrip().split(' ')[0]) for line in fin]
         else:
-            self.paths = sorted(list(scandir(self.lq_folder, full_path=True)))
+            paths = paths_from_folder(self.lq_folder, opt.get('path_index_dir'))
+            self.paths = paths if opt.get('path_index_dir') else sorted(paths)  # the index is sorted
 
     def __getitem__(self, index):
         if self.file_client is None:
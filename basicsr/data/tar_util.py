@@ -0,0 +1,224 @@
+import multiprocessing as mp
+import random
+import tarfile
+from os import path as osp
+
+from basicsr.utils import get_root_logger, scandir
+
+
+def tar_shards_from_folder(folder):
+    """Get the tar shards and the number of samples from a tar shard folder.
+
+    Contents of a tar shard folder. The file structure is:
+
+    ::
+
+        example_tar
+        ├── shard_00000.tar
+        ├── shard_00001.tar
+        ├── meta_info.txt
+
+    Each tar shard stores the samples one by one, in the WebDataset style:
+    files of one sample share the same key and are stored consecutively, e.g.,
+    `0001_s001.gt.png` and `0001_s001.lq.png`.
+    Each line in the meta_info.txt records the shard name and the sample key,
+    separated by a white space. Example: `shard_00000.tar 0001_s001`.
+    It is created by :func:`basicsr.utils.lmdb_util.make_tar_from_imgs`.
+
+    Args:
+        folder (str): Folder path.
+
+    Returns:
+        list[str]: Shard paths.
+        int: Number of samples.
+    """
+    shards = sorted(list(scandir(folder, suffix='.tar', full_path=True)))
+    if len(shards) == 0:
+        raise ValueError(f'No tar shards in {folder}.')
+    with open(osp.join(folder, 'meta_info.txt')) as fin:
+        num_samples = sum(1 for line in fin if line.strip())
+    return shards, num_samples
+
+
+def iter_tar_samples(tar_path, buffer_size=1024**2):
+    """Iterate over the samples of a tar shard with sequential reads.
+
+    Args:
+        tar_path (str): Tar shard path.
+        buffer_size (int): Read buffer size in bytes. Default: 1024 ** 2.
+
+    Yields:
+        tuple[str, dict]: Sample key and a dict mapping the extensions (e.g.,
+            'gt.png') to the file bytes.
+    """
+    key, sample = None, {}
+    with open(tar_path, 'rb', buffering=buffer_size) as f, tarfile.open(fileobj=f, mode='r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            dirname, basename = osp.split(member.name)
+            member_key, ext = basename.split('.', 1)
+            member_key = osp.join(dirname, member_key)
+            if member_key != key:
+                if key is not None:
+                    yield key, sample
+                key, sample = member_key, {}
+            sample[ext] = tar.extractfile(member).read()
+    if key is not None:
+        yield key, sample
+
+
+def get_sample_bytes(sample, name):
+    """Get the file bytes named `name` (e.g., 'gt' for 'gt.png') from a sample."""
+    for ext, value in sample.items():
+        if ext.split('.')[0] == name:
+            return value
+    raise KeyError(f'{name} is not in the sample with {list(sample.keys())}.')
+
+
+def shuffle_buffer(samples, buffer_size, rng):
+    """Shuffle a stream of samples with an in-memory buffer.
+
+    Args:
+        samples (iterable): Input samples.
+        buffer_size (int): Number of samples kept in the buffer. No shuffle
+            if it is smaller than 2.
+        rng (random.Random): Random number generator.
+
+    Yields:
+        Shuffled samples.
+    """
+    if buffer_size < 2:
+        yield from samples
+        return
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        idx = rng.randrange(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class TarShardStream():
+    """Stream of samples from tar shards for an iterable dataset.
+
+    The shards are shuffled with the same seed on all the processes and
+    split across the DDP ranks and the dataloader workers, so that each
+    worker reads whole shards sequentially. If there are fewer shards than
+    the ranks x workers, every worker reads all the shards and keeps every
+    (ranks x workers)-th sample instead.
+
+    Each rank yields exactly ``num_samples * ratio // ranks`` samples per
+    epoch (rounded down to whole batches), split across its workers in whole
+    batches (cycling their shards if necessary). So all the ranks run the
+    same number of iterations in DDP training, and the dataloader does not
+    drop the partial batches of the workers with ``drop_last``.
+
+    The epoch is kept in shared memory, so that :meth:`set_epoch` in the main
+    process also reaches the persistent dataloader workers. The workers read
+    it at the start of each epoch.
+
+    Args:
+        shards (list[str]): Shard paths.
+        num_samples (int): Total number of samples in the shards.
+        rank (int): Rank of the current process.
+        world_size (int): Number of processes.
+        shuffle (bool): Whether to shuffle the shards and the samples.
+            Default: True.
+        shuffle_buffer_size (int): Size of the in-memory shuffle buffer.
+            Default: 1000.
+        ratio (int): Enlarging ratio, see
+            :class:`basicsr.data.data_sampler.EnlargedSampler`. Default: 1.
+        seed (int): Random seed for shuffling. Default: 0.
+        batch_size (int): Batch size of the dataloader, set by
+            :meth:`set_batch_size`. Default: 1.
+    """
+
+    def __init__(self,
+                 shards,
+                 num_samples,
+                 rank,
+                 world_size,
+                 shuffle=True,
+                 shuffle_buffer_size=1000,
+                 ratio=1,
+                 seed=0,
+                 batch_size=1):
+        self.shards = shards
+        self.num_samples = num_samples
+        self.rank = rank
+        self.world_size = world_size
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.ratio = ratio
+        self.seed = seed
+        self.batch_size = batch_size
+        self._epoch = mp.RawValue('q', 0)
+
+    @property
+    def epoch(self):
+        return self._epoch.value
+
+    def set_epoch(self, epoch):
+        self._epoch.value = epoch
+
+    def set_batch_size(self, batch_size):
+        """Set the batch size of the dataloader, before the workers are started."""
+        self.batch_size = batch_size
+
+    def __len__(self):
+        """Number of samples yielded by each rank in an epoch."""
+        return self.num_samples * self.ratio // self.world_size // self.batch_size * self.batch_size
+
+    def _iter_shards(self, worker_id, num_workers, epoch):
+        num_units = self.world_size * num_workers
+        unit = self.rank * num_workers + worker_id
+        split_samples = len(self.shards) < num_units
+        if split_samples and unit == 0:
+            logger = get_root_logger()
+            logger.warning(f'Only {len(self.shards)} tar shards for {num_units} workers, '
+                           'each worker will read all the shards. Use more shards for better performance.')
+
+        repeat = 0
+        while True:
+            shards = list(self.shards)
+            if self.shuffle:
+                # the same shard order on all the processes
+                random.Random(hash((self.seed, epoch, repeat))).shuffle(shards)
+            if not split_samples:
+                shards = shards[unit::num_units]
+            count = 0
+            for shard in shards:
+                for sample in iter_tar_samples(shard):
+                    if not split_samples or count % num_units == unit:
+                        yield sample
+                    count += 1
+            if count == 0:  # avoid endless loops for empty shards
+                return
+            repeat += 1
+
+    def iter_samples(self, worker_id=0, num_workers=1):
+        """Iterate over the samples of one epoch for a dataloader worker.
+
+        Args:
+            worker_id (int): Worker id. Default: 0.
+            num_workers (int): Number of workers. Default: 1.
+
+        Yields:
+            tuple[str, dict]: Sample key and a dict of file bytes, see
+                :func:`iter_tar_samples`.
+        """
+        unit = self.rank * num_workers + worker_id
+        num_batches = len(self) // self.batch_size
+        num_worker_samples = (num_batches // num_workers + int(worker_id < num_batches % num_workers)) * self.batch_size
+        epoch = self.epoch
+        rng = random.Random(hash((self.seed, epoch, unit)))
+        samples = self._iter_shards(worker_id, num_workers, epoch)
+        if self.shuffle:
+            samples = shuffle_buffer(samples, self.shuffle_buffer_size, rng)
+        for _, sample in zip(range(num_worker_samples), samples):
+            yield sample
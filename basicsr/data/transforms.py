@@ -91,6 +91,57 @@ def paired_random_crop(img_gts, img_lqs, gt_patch_size, scale, gt_path=None):
     return img_gts, img_lqs
 
 
+def paired_random_crop_augment_pt(img_gts, img_lqs, gt_patch_size, scale, hflip=True, rotation=True):
+    """Batched paired random crop and augmentation of Tensors, e.g., on GPU.
+
+    Each sample in the batch gets its own crop location, flips and rotation,
+    with the same probabilities as :func:`paired_random_crop` followed by
+    :func:`augment`. The crop and the augmentation of gt (and of lq) are done
+    by one indexed gather.
+
+    Args:
+        img_gts (Tensor): GT images with shape (b, c, h, w).
+        img_lqs (Tensor): LQ images with shape (b, c, h // scale, w // scale).
+        gt_patch_size (int): GT patch size.
+        scale (int): Scale factor.
+        hflip (bool): Horizontal flip. Default: True.
+        rotation (bool): Ratotation. Default: True.
+
+    Returns:
+        Tensor: GT patches with shape (b, c, gt_patch_size, gt_patch_size).
+        Tensor: LQ patches with shape (b, c, gt_patch_size // scale, gt_patch_size // scale).
+    """
+    b, _, h_lq, w_lq = img_lqs.size()
+    h_gt, w_gt = img_gts.size()[-2:]
+    lq_patch_size = gt_patch_size // scale
+    if h_gt != h_lq * scale or w_gt != w_lq * scale:
+        raise ValueError(f'Scale mismatches. GT ({h_gt}, {w_gt}) is not {scale}x ',
+                         f'multiplication of LQ ({h_lq}, {w_lq}).')
+    if h_lq < lq_patch_size or w_lq < lq_patch_size:
+        raise ValueError(f'LQ ({h_lq}, {w_lq}) is smaller than patch size ({lq_patch_size}, {lq_patch_size}).')
+
+    device = img_lqs.device
+    top = torch.randint(0, h_lq - lq_patch_size + 1, (b, 1, 1), device=device)
+    left = torch.randint(0, w_lq - lq_patch_size + 1, (b, 1, 1), device=device)
+    hflips, vflips, rot90s = (torch.rand(3, b, 1, 1, device=device) < 0.5).unbind(0)
+    hflips &= hflip
+    vflips &= rotation
+    rot90s &= rotation
+
+    def _gather(imgs, top, left, patch_size):
+        c, h, w = imgs.size()[1:]
+        grid = torch.arange(patch_size, device=device)
+        y, x = grid.view(1, -1, 1).expand(b, -1, patch_size), grid.view(1, 1, -1).expand(b, patch_size, -1)
+        # source coordinates of the output pixels: transpose, vertical flip, horizontal flip (in reverse order)
+        y, x = torch.where(rot90s, x, y), torch.where(rot90s, y, x)
+        y = torch.where(vflips, patch_size - 1 - y, y)
+        x = torch.where(hflips, patch_size - 1 - x, x)
+        index = ((top + y) * w + left + x).view(b, 1, -1).expand(-1, c, -1)
+        return imgs.reshape(b, c, h * w).gather(2, index).view(b, c, patch_size, patch_size)
+
+    return _gather(img_gts, top * scale, left * scale, gt_patch_size), _gather(img_lqs, top, left, lq_patch_size)
+
+
 def augment(imgs, hflip=True, rotation=True, flows=None, return_status=False):
     """Augment: horizontal flips OR rotate (0, 90, 180, 270 degrees).
 
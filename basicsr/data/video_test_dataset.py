@@ -5,6 +5,7 @@ from torch.utils import data as data
 
 from basicsr.data.data_util import duf_downsample, generate_frame_indices, read_img_seq
 from basicsr.utils import get_root_logger, scandir
+from basicsr.utils.file_client import DecodedClipCache
 from basicsr.utils.registry import DATASET_REGISTRY
 
 
@@ -41,12 +42,19 @@ class VideoTestDataset(data.Dataset):
             in the dataroot will be used.
         num_frame (int): Window size for input frames.
         padding (str): Padding mode.
+        num_decode_threads (int): Number of threads for decoding frames. Default: 1.
+        decode_cache (dict, optional): Options of the decoded clip cache (e.g., dict(max_size=16 * 1024**3)), so that
+            the frames are decoded only once across repeated validations, see
+            :class:`basicsr.utils.file_client.DecodedClipCache`.
     """
 
     def __init__(self, opt):
         super(VideoTestDataset, self).__init__()
         self.opt = opt
         self.cache_data = opt['cache_data']
+        self.decode_opt = dict(
+            num_threads=opt.get('num_decode_threads', 1),
+            cache=DecodedClipCache(**opt['decode_cache']) if opt.get('decode_cache') else None)
         self.gt_root, self.lq_root = opt['dataroot_gt'], opt['dataroot_lq']
         self.data_info = {'lq_path': [], 'gt_path': [], 'folder': [], 'idx': [], 'border': []}
         # file client (io backend)
@@ -91,8 +99,8 @@ class VideoTestDataset(data.Dataset):
                 # cache data or save the frame list
                 if self.cache_data:
                     logger.info(f'Cache {subfolder_name} for VideoTestDataset...')
-                    self.imgs_lq[subfolder_name] = read_img_seq(img_paths_lq)
-                    self.imgs_gt[subfolder_name] = read_img_seq(img_paths_gt)
+                    self.imgs_lq[subfolder_name] = read_img_seq(img_paths_lq, **self.decode_opt)
+                    self.imgs_gt[subfolder_name] = read_img_seq(img_paths_gt, **self.decode_opt)
                 else:
                     self.imgs_lq[subfolder_name] = img_paths_lq
                     self.imgs_gt[subfolder_name] = img_paths_gt
@@ -112,9 +120,8 @@ class VideoTestDataset(data.Dataset):
             imgs_lq = self.imgs_lq[folder].index_select(0, torch.LongTensor(select_idx))
             img_gt = self.imgs_gt[folder][idx]
         else:
-            img_paths_lq = [self.imgs_lq[folder][i] for i in select_idx]
-            imgs_lq = read_img_seq(img_paths_lq)
-            img_gt = read_img_seq([self.imgs_gt[folder][idx]])
+            imgs_lq = read_img_seq(self.imgs_lq[folder], indices=select_idx, **self.decode_opt)
+            img_gt = read_img_seq(self.imgs_gt[folder], indices=[idx], **self.decode_opt)
             img_gt.squeeze_(0)
 
         return {
@@ -148,12 +155,17 @@ class VideoTestVimeo90KDataset(data.Dataset):
             in the dataroot will be used.
         num_frame (int): Window size for input frames.
         padding (str): Padding mode.
+        num_decode_threads (int): Number of threads for decoding frames. Default: 1.
+        decode_cache (dict, optional): Options of the decoded clip cache, see :class:`VideoTestDataset`.
     """
 
     def __init__(self, opt):
         super(VideoTestVimeo90KDataset, self).__init__()
         self.opt = opt
         self.cache_data = opt['cache_data']
+        self.decode_opt = dict(
+            num_threads=opt.get('num_decode_threads', 1),
+            cache=DecodedClipCache(**opt['decode_cache']) if opt.get('decode_cache') else None)
         if self.cache_data:
             raise NotImplementedError('cache_data in Vimeo90K-Test dataset is not implemented.')
         self.gt_root, self.lq_root = opt['dataroot_gt'], opt['dataroot_lq']
@@ -181,8 +193,8 @@ class VideoTestVimeo90KDataset(data.Dataset):
     def __getitem__(self, index):
         lq_path = self.data_info['lq_path'][index]
         gt_path = self.data_info['gt_path'][index]
-        imgs_lq = read_img_seq(lq_path)
-        img_gt = read_img_seq([gt_path])
+        imgs_lq = read_img_seq(lq_path, **self.decode_opt)
+        img_gt = read_img_seq([gt_path], **self.decode_opt)
         img_gt.squeeze_(0)
 
         return {
@@ -228,14 +240,18 @@ class VideoTestDUFDataset(VideoTestDataset):
             img_gt = self.imgs_gt[folder][idx]
         else:
             if self.opt['use_duf_downsampling']:
-                img_paths_lq = [self.imgs_gt[folder][i] for i in select_idx]
                 # read imgs_gt to generate low-resolution frames
-                imgs_lq = read_img_seq(img_paths_lq, require_mod_crop=True, scale=self.opt['scale'])
+                imgs_lq = read_img_seq(
+                    self.imgs_gt[folder],
+                    require_mod_crop=True,
+                    scale=self.opt['scale'],
+                    indices=select_idx,
+                    **self.decode_opt)
                 imgs_lq = duf_downsample(imgs_lq, kernel_size=13, scale=self.opt['scale'])
             else:
-                img_paths_lq = [self.imgs_lq[folder][i] for i in select_idx]
-                imgs_lq = read_img_seq(img_paths_lq)
-            img_gt = read_img_seq([self.imgs_gt[folder][idx]], require_mod_crop=True, scale=self.opt['scale'])
+                imgs_lq = read_img_seq(self.imgs_lq[folder], indices=select_idx, **self.decode_opt)
+            img_gt = read_img_seq(
+                self.imgs_gt[folder], require_mod_crop=True, scale=self.opt['scale'], indices=[idx], **self.decode_opt)
             img_gt.squeeze_(0)
 
         return {
@@ -47,7 +47,8 @@ class Vimeo90KDataset(data.Dataset):
         dataroot_gt (str): Data root path for gt.
         dataroot_lq (str): Data root path for lq.
         meta_info_file (str): Path for meta information file.
-        io_backend (dict): IO backend type and other kwarg.
+        io_backend (dict): IO backend type and other kwarg. Set `clip_cache` to cache the decoded septuplets,
+            see :class:`basicsr.utils.file_client.DecodedClipCache`.
         num_frame (int): Window size for input frames.
         gt_size (int): Cropped patched size for gt patches.
         random_reverse (bool): Random reverse input frames.
@@ -68,7 +69,7 @@ class Vimeo90KDataset(data.Dataset):
         self.file_client = None
         self.io_backend_opt = opt['io_backend']
         self.is_lmdb = False
-        if self.io_backend_opt['type'] == 'lmdb':
+        if self.io_backend_opt['type'] in ['lmdb', 'shard']:
             self.is_lmdb = True
             self.io_backend_opt['db_paths'] = [self.lq_root, self.gt_root]
             self.io_backend_opt['client_keys'] = ['lq', 'gt']
@@ -102,16 +103,13 @@ class Vimeo90KDataset(data.Dataset):
         img_bytes = self.file_client.get(img_gt_path, 'gt')
         img_gt = imfrombytes(img_bytes, float32=True)
 
-        # get the neighboring LQ frames
-        img_lqs = []
-        for neighbor in self.neighbor_list:
-            if self.is_lmdb:
-                img_lq_path = f'{clip}/{seq}/im{neighbor}'
-            else:
-                img_lq_path = self.lq_root / clip / seq / f'im{neighbor}.png'
-            img_bytes = self.file_client.get(img_lq_path, 'lq')
-            img_lq = imfrombytes(img_bytes, float32=True)
-            img_lqs.append(img_lq)
+        # get the neighboring LQ frames (in one read for lmdb)
+        if self.is_lmdb:
+            clip_lq_paths = [f'{clip}/{seq}/im{i}' for i in range(1, 8)]
+        else:
+            clip_lq_paths = [self.lq_root / clip / seq / f'im{i}.png' for i in range(1, 8)]
+        indices = [v - 1 for v in self.neighbor_list]
+        img_lqs = self.file_client.get_clip_imgs(clip_lq_paths, indices, 'lq', float32=True)
 
         # randomly crop
         img_gt, img_lqs = paired_random_crop(img_gt, img_lqs, gt_size, scale, img_gt_path)
@@ -155,25 +153,17 @@ class Vimeo90KRecurrentDataset(Vimeo90KDataset):
         key = self.keys[index]
         clip, seq = key.split('/')  # key example: 00001/0001
 
-        # get the neighboring LQ and  GT frames
-        img_lqs = []
-        img_gts = []
-        for neighbor in self.neighbor_list:
-            if self.is_lmdb:
-                img_lq_path = f'{clip}/{seq}/im{neighbor}'
-                img_gt_path = f'{clip}/{seq}/im{neighbor}'
-            else:
-                img_lq_path = self.lq_root / clip / seq / f'im{neighbor}.png'
-                img_gt_path = self.gt_root / clip / seq / f'im{neighbor}.png'
-            # LQ
-            img_bytes = self.file_client.get(img_lq_path, 'lq')
-            img_lq = imfrombytes(img_bytes, float32=True)
-            # GT
-            img_bytes = self.file_client.get(img_gt_path, 'gt')
-            img_gt = imfrombytes(img_bytes, float32=True)
-
-            img_lqs.append(img_lq)
-            img_gts.append(img_gt)
+        # get the neighboring LQ and GT frames (in one read for each lmdb)
+        if self.is_lmdb:
+            clip_lq_paths = [f'{clip}/{seq}/im{i}' for i in range(1, 8)]
+            clip_gt_paths = [f'{clip}/{seq}/im{i}' for i in range(1, 8)]
+        else:
+            clip_lq_paths = [self.lq_root / clip / seq / f'im{i}.png' for i in range(1, 8)]
+            clip_gt_paths = [self.gt_root / clip / seq / f'im{i}.png' for i in range(1, 8)]
+        indices = [v - 1 for v in self.neighbor_list]
+        img_lqs = self.file_client.get_clip_imgs(clip_lq_paths, indices, 'lq', float32=True)
+        img_gts = self.file_client.get_clip_imgs(clip_gt_paths, indices, 'gt', float32=True)
+        img_gt_path = clip_gt_paths[indices[-1]]
 
         # randomly crop
         img_gts, img_lqs = paired_random_crop(img_gts, img_lqs, gt_size, scale, img_gt_path)
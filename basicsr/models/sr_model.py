@@ -4,6 +4,7 @@ from os import path as osp
 from tqdm import tqdm
 
 from basicsr.archs import build_network
+from basicsr.data.transforms import paired_random_crop_augment_pt
 from basicsr.losses import build_loss
 from basicsr.metrics import calculate_metric
 from basicsr.utils import get_root_logger, imwrite, tensor2img
@@ -88,6 +89,16 @@ class SRModel(BaseModel):
         self.lq = data['lq'].to(self.device)
         if 'gt' in data:
             self.gt = data['gt'].to(self.device)
+        if 'gpu_augment' in data:
+            # training batches of datasets with gpu_augment are cropped and augmented here
+            train_opt = self.opt['datasets']['train']
+            self.gt, self.lq = paired_random_crop_augment_pt(
+                self.gt,
+                self.lq,
+                train_opt['gt_size'],
+                self.opt['scale'],
+                hflip=train_opt['use_hflip'],
+                rotation=train_opt['use_rot'])
 
     def optimize_parameters(self, current_iter):
         self.optimizer_g.zero_grad()
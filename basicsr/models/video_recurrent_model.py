@@ -1,3 +1,4 @@
+import inspect
 import torch
 from collections import Counter
 from os import path as osp
@@ -7,6 +8,7 @@ from tqdm import tqdm
 from basicsr.metrics import calculate_metric
 from basicsr.utils import get_root_logger, imwrite, tensor2img
 from basicsr.utils.dist_util import get_dist_info
+from basicsr.utils.flow_util import FlowCache
 from basicsr.utils.registry import MODEL_REGISTRY
 from .video_base_model import VideoBaseModel
 
@@ -19,6 +21,29 @@ class VideoRecurrentModel(VideoBaseModel):
         if self.is_train:
             self.fix_flow_iter = opt['train'].get('fix_flow')
 
+        # cache the optical flows of validation clips, only used when the flow network is not trainable
+        flow_cache_opt = opt['val'].get('flow_cache') if opt.get('val') else None
+        self.flow_cache = FlowCache(**flow_cache_opt) if flow_cache_opt else None
+        self.folder = None
+
+    def feed_data(self, data):
+        super(VideoRecurrentModel, self).feed_data(data)
+        # clip name, used as the key of the flow cache
+        self.folder = data.get('folder')
+
+    def is_flow_trainable(self):
+        if not self.is_train:
+            return False
+        return any(param.requires_grad for name, param in self.net_g.named_parameters() if 'spynet' in name)
+
+    def use_flow_cache(self):
+        if self.flow_cache is None or self.flow_cache.namespace is None or not isinstance(self.folder, str):
+            return False
+        # only the networks taking the flow_cache and frame_keys arguments support the flow cache
+        if 'flow_cache' not in inspect.signature(self.get_bare_model(self.net_g).forward).parameters:
+            return False
+        return not self.is_flow_trainable()
+
     def setup_optimizers(self):
         train_opt = self.opt['train']
         flow_lr_mul = train_opt.get('flow_lr_mul', 1)
@@ -87,6 +112,14 @@ class VideoRecurrentModel(VideoBaseModel):
             for _, tensor in self.metric_results.items():
                 tensor.zero_()
 
+        if self.flow_cache is not None:
+            # the cached flows are only valid for the same data and flow network
+            spynet_state = {
+                name: param
+                for name, param in self.get_bare_model(self.net_g).state_dict().items() if name.startswith('spynet.')
+            }
+            self.flow_cache.set_identity(dataset.opt.get('dataroot_lq'), spynet_state)
+
         metric_data = dict()
         num_folders = len(dataset)
         num_pad = (world_size - (num_folders % world_size)) % world_size
@@ -183,8 +216,15 @@ class VideoRecurrentModel(VideoBaseModel):
         if flip_seq:
             self.lq = torch.cat([self.lq, self.lq.flip(1)], dim=1)
 
+        net_kwargs = {}
+        if self.use_flow_cache():
+            frame_keys = [f'{self.folder}/{i:08d}' for i in range(n)]
+            if flip_seq:
+                frame_keys += frame_keys[::-1]
+            net_kwargs = dict(flow_cache=self.flow_cache, frame_keys=frame_keys)
+
         with torch.no_grad():
-            self.output = self.net_g(self.lq)
+            self.output = self.net_g(self.lq, **net_kwargs)
 
         if flip_seq:
             output_1 = self.output[:, :n, :, :, :]
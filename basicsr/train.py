@@ -4,6 +4,7 @@ import math
 import time
 import torch
 from os import path as osp
+from torch.utils.data import IterableDataset
 
 from basicsr.data import build_dataloader, build_dataset
 from basicsr.data.data_sampler import EnlargedSampler
@@ -33,7 +34,17 @@ def create_train_val_dataloader(opt, logger):
         if phase == 'train':
             dataset_enlarge_ratio = dataset_opt.get('dataset_enlarge_ratio', 1)
             train_set = build_dataset(dataset_opt)
-            train_sampler = EnlargedSampler(train_set, opt['world_size'], opt['rank'], dataset_enlarge_ratio)
+            if isinstance(train_set, IterableDataset):
+                # iterable datasets shuffle and split the data by themselves
+                train_sampler = None
+            else:
+                train_sampler = EnlargedSampler(
+                    train_set,
+                    opt['world_size'],
+                    opt['rank'],
+                    dataset_enlarge_ratio,
+                    block_size=dataset_opt.get('shuffle_block_size', 1),
+                    seed=opt['manual_seed'] or 0)
             train_loader = build_dataloader(
                 train_set,
                 dataset_opt,
@@ -42,8 +53,12 @@ def create_train_val_dataloader(opt, logger):
                 sampler=train_sampler,
                 seed=opt['manual_seed'])
 
-            num_iter_per_epoch = math.ceil(
-                len(train_set) * dataset_enlarge_ratio / (dataset_opt['batch_size_per_gpu'] * opt['world_size']))
+            if train_sampler is None:
+                # iterable datasets yield whole batches of the enlarged samples of this rank in each worker
+                num_iter_per_epoch = len(train_loader)
+            else:
+                num_iter_per_epoch = math.ceil(
+                    len(train_set) * dataset_enlarge_ratio / (dataset_opt['batch_size_per_gpu'] * opt['world_size']))
             total_iters = int(opt['train']['total_iter'])
             total_epochs = math.ceil(total_iters / (num_iter_per_epoch))
             logger.info('Training statistics:'
@@ -146,13 +161,28 @@ def train_pipeline(root_path):
     else:
         raise ValueError(f"Wrong prefetch_mode {prefetch_mode}. Supported ones are: None, 'cuda', 'cpu'.")
 
+    # resume from the middle of an epoch, without repeating the samples of the epoch
+    start_sample_in_epoch = 0
+    if resume_state and train_sampler is not None:
+        # the batch size of the dataloader, which differs from batch_size_per_gpu with DataParallel
+        batch_size = train_loader.batch_size
+        epoch, start_iter_in_epoch = divmod(current_iter, max(1, train_sampler.num_samples // batch_size))
+        if epoch in [start_epoch, start_epoch + 1]:
+            start_epoch = epoch
+            start_sample_in_epoch = start_iter_in_epoch * batch_size
+        else:
+            logger.warning(f'Iter {current_iter} does not match epoch {start_epoch}, restart the epoch.')
+
     # training
     logger.info(f'Start training from epoch: {start_epoch}, iter: {current_iter}')
     data_timer, iter_timer = AvgTimer(), AvgTimer()
     start_time = time.time()
 
     for epoch in range(start_epoch, total_epochs + 1):
-        train_sampler.set_epoch(epoch)
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch, start=start_sample_in_epoch if epoch == start_epoch else 0)
+        else:
+            train_loader.dataset.set_epoch(epoch)
         prefetcher.reset()
         train_data = prefetcher.next()
 
@@ -198,6 +228,7 @@ def train_pipeline(root_path):
         # end of iter
 
     # end of epoch
+    prefetcher.close()
 
     consumed_time = str(datetime.timedelta(seconds=int(time.time() - start_time)))
     logger.info(f'End of training. Time consumed: {consumed_time}')
@@ -4,7 +4,8 @@ from .file_client import FileClient
 from .img_process_util import USMSharp, usm_sharp
 from .img_util import crop_border, imfrombytes, img2tensor, imwrite, tensor2img
 from .logger import AvgTimer, MessageLogger, get_env_info, get_root_logger, init_tb_logger, init_wandb_logger
-from .misc import check_resume, get_time_str, make_exp_dirs, mkdir_and_rename, scandir, set_random_seed, sizeof_fmt
+from .misc import (atomic_open, check_resume, get_time_str, make_exp_dirs, mkdir_and_rename, scandir, set_random_seed,
+                   sizeof_fmt)
 from .options import yaml_load
 
 __all__ = [
@@ -37,6 +38,7 @@ __all__ = [
     'scandir',
     'check_resume',
     'sizeof_fmt',
+    'atomic_open',
     # diffjpeg
     'DiffJPEG',
     # img_process_util
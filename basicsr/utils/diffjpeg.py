@@ -33,11 +33,13 @@ def quality_to_factor(quality):
     """ Calculate factor corresponding to quality
 
     Args:
-        quality(float): Quality for jpeg compression.
+        quality(float | Tensor): Quality for jpeg compression.
 
     Returns:
-        float: Compression factor.
+        float | Tensor: Compression factor.
     """
+    if isinstance(quality, torch.Tensor):
+        return torch.where(quality < 50, 5000. / quality, 200. - quality * 2) / 100.
     if quality < 50:
         quality = 5000. / quality
     else:
@@ -450,6 +452,12 @@ class DiffJPEG(nn.Module):
     """This JPEG algorithm result is slightly different from cv2.
     DiffJPEG supports batch processing.
 
+    It fuses the steps of :class:`CompressJpeg` and :class:`DeCompressJpeg`:
+    the Y, Cb and Cr blocks are transformed together, the DCT and iDCT of
+    the 8x8 blocks are batched matrix multiplications, and quantization and
+    dequantization are folded into one step. The results are the same as
+    the ones of the separate modules.
+
     Args:
         differentiable(bool): If True, uses custom differentiable rounding function, if False, uses standard torch.round
     """
@@ -457,25 +465,41 @@ class DiffJPEG(nn.Module):
     def __init__(self, differentiable=True):
         super(DiffJPEG, self).__init__()
         if differentiable:
-            rounding = diff_round
+            self.rounding = diff_round
         else:
-            rounding = torch.round
-
-        self.compress = CompressJpeg(rounding=rounding)
-        self.decompress = DeCompressJpeg(rounding=rounding)
+            self.rounding = torch.round
+
+        rgb2ycbcr, ycbcr2rgb = RGB2YCbCrJpeg(), YCbCr2RGBJpeg()
+        self.register_buffer('rgb2ycbcr', rgb2ycbcr.matrix.detach().clone())
+        self.register_buffer('rgb2ycbcr_shift', rgb2ycbcr.shift.detach().clone())
+        self.register_buffer('ycbcr2rgb', ycbcr2rgb.matrix.detach().clone())
+        self.register_buffer('ycbcr2rgb_shift', ycbcr2rgb.shift.detach().clone())
+        # (64, 64) matrices mapping the flattened 8x8 blocks to the flattened coefficients, and back
+        dct, idct = DCT8x8(), iDCT8x8()
+        self.register_buffer('dct_matrix', (dct.tensor * dct.scale).detach().view(64, 64))
+        self.register_buffer('idct_matrix', (0.25 * idct.alpha[:, :, None, None] * idct.tensor).detach().view(64, 64))
+        self.register_buffer('y_table', y_table.detach().reshape(64).clone())
+        self.register_buffer('c_table', c_table.detach().reshape(64).clone())
+
+    @staticmethod
+    def _split_blocks(image):
+        """(b, c, h, w) -> (b, c*h*w/64, 64)"""
+        b, c, h, w = image.size()
+        return image.view(b, c, h // 8, 8, w // 8, 8).permute(0, 1, 2, 4, 3, 5).reshape(b, -1, 64)
+
+    @staticmethod
+    def _merge_blocks(blocks, c, h, w):
+        """(b, c*h*w/64, 64) -> (b, c, h, w)"""
+        b = blocks.size(0)
+        return blocks.view(b, c, h // 8, w // 8, 8, 8).permute(0, 1, 2, 4, 3, 5).reshape(b, c, h, w)
 
     def forward(self, x, quality):
         """
         Args:
             x (Tensor): Input image, bchw, rgb, [0, 1]
-            quality(float): Quality factor for jpeg compression scheme.
+            quality(float | Tensor): Quality factor for jpeg compression scheme, a float or a tensor with shape (b).
         """
-        factor = quality
-        if isinstance(factor, (int, float)):
-            factor = quality_to_factor(factor)
-        else:
-            for i in range(factor.size(0)):
-                factor[i] = quality_to_factor(factor[i])
+        factor = quality_to_factor(quality)
         h, w = x.size()[-2:]
         h_pad, w_pad = 0, 0
         # why should use 16
@@ -484,11 +508,34 @@ class DiffJPEG(nn.Module):
         if w % 16 != 0:
             w_pad = 16 - w % 16
         x = F.pad(x, (0, w_pad, 0, h_pad), mode='constant', value=0)
-
-        y, cb, cr = self.compress(x, factor=factor)
-        recovered = self.decompress(y, cb, cr, (h + h_pad), (w + w_pad), factor=factor)
-        recovered = recovered[:, :, 0:h, 0:w]
-        return recovered
+        img_h, img_w = h + h_pad, w + w_pad
+
+        # rgb to ycbcr, and chroma subsampling
+        image = torch.tensordot(x.permute(0, 2, 3, 1) * 255, self.rgb2ycbcr, dims=1) + self.rgb2ycbcr_shift
+        image = image.permute(0, 3, 1, 2)
+        cbcr = F.avg_pool2d(image[:, 1:], kernel_size=2, stride=(2, 2), count_include_pad=False)
+
+        # DCT, quantization, dequantization and iDCT of all the blocks
+        y_blocks, cbcr_blocks = self._split_blocks(image[:, 0:1]), self._split_blocks(cbcr)
+        num_y = y_blocks.size(1)
+        blocks = torch.cat([y_blocks, cbcr_blocks], dim=1)
+        table = torch.cat([self.y_table.expand(num_y, 64), self.c_table.expand(cbcr_blocks.size(1), 64)])
+        if isinstance(factor, torch.Tensor):
+            table = table * factor.view(-1, 1, 1)
+        else:
+            table = table * factor
+        coeffs = torch.matmul(blocks - 128, self.dct_matrix)
+        coeffs = self.rounding(coeffs / table) * table
+        blocks = torch.matmul(coeffs, self.idct_matrix) + 128
+
+        # chroma upsampling, and ycbcr to rgb
+        y = self._merge_blocks(blocks[:, 0:num_y], 1, img_h, img_w)
+        cbcr = self._merge_blocks(blocks[:, num_y:], 2, img_h // 2, img_w // 2)
+        cbcr = cbcr.repeat_interleave(2, dim=2).repeat_interleave(2, dim=3)
+        image = torch.cat([y, cbcr], dim=1).permute(0, 2, 3, 1)
+        image = torch.tensordot(image + self.ycbcr2rgb_shift, self.ycbcr2rgb, dims=1).permute(0, 3, 1, 2)
+        image = torch.clamp(image, 0, 255) / 255
+        return image[:, :, 0:h, 0:w]
 
 
 if __name__ == '__main__':
@@ -1,5 +1,24 @@
 # Modified from https://github.com/open-mmlab/mmcv/blob/master/mmcv/fileio/file_client.py  # noqa: E501
+import atexit
+import getpass
+import hashlib
+import mmap
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
 from abc import ABCMeta, abstractmethod
+from os import path as osp
+from torch.utils.data import get_worker_info
+
+from basicsr.utils.img_util import imfrombytes
+from basicsr.utils.misc import atomic_open
+
+try:
+    import fcntl
+except ImportError:  # Windows, the size counter of the decoded image cache is then approximate
+    fcntl = None
 
 
 class BaseStorageBackend(metaclass=ABCMeta):
@@ -85,13 +104,25 @@ class LmdbBackend(BaseStorageBackend):
             disable the OS filesystem readahead mechanism, which may improve
             random read performance when a database is larger than RAM.
             Default: False.
+        persistent_txn (bool, optional): If True, keep one long-lived read
+            transaction for each lmdb env and reuse it for all the reads,
+            instead of beginning a new transaction for each read. Only use it
+            for databases that are not modified during reading.
+            Default: False.
 
     Attributes:
         db_paths (list): Lmdb database path.
         _client (list): A list of several lmdb envs.
     """
 
-    def __init__(self, db_paths, client_keys='default', readonly=True, lock=False, readahead=False, **kwargs):
+    def __init__(self,
+                 db_paths,
+                 client_keys='default',
+                 readonly=True,
+                 lock=False,
+                 readahead=False,
+                 persistent_txn=False,
+                 **kwargs):
         try:
             import lmdb
         except ImportError:
@@ -110,6 +141,8 @@ class LmdbBackend(BaseStorageBackend):
         self._client = {}
         for client, path in zip(client_keys, self.db_paths):
             self._client[client] = lmdb.open(path, readonly=readonly, lock=lock, readahead=readahead, **kwargs)
+        self.persistent_txn = persistent_txn
+        self._txns = {}
 
     def get(self, filepath, client_key):
         """Get values according to the filepath from one lmdb named client_key.
@@ -118,17 +151,373 @@ class LmdbBackend(BaseStorageBackend):
             filepath (str | obj:`Path`): Here, filepath is the lmdb key.
             client_key (str): Used for distinguishing different lmdb envs.
         """
-        filepath = str(filepath)
+        return self.get_many([filepath], client_key)[0]
+
+    def get_many(self, filepaths, client_key):
+        """Get values of several filepaths from one lmdb named client_key in
+        a single read transaction.
+
+        Args:
+            filepaths (list[str | obj:`Path`]): Here, filepaths are the lmdb
+                keys.
+            client_key (str): Used for distinguishing different lmdb envs.
+
+        Returns:
+            list[bytes]: Values in the same order as filepaths.
+        """
         assert client_key in self._client, (f'client_key {client_key} is not in lmdb clients.')
-        client = self._client[client_key]
-        with client.begin(write=False) as txn:
-            value_buf = txn.get(filepath.encode('ascii'))
-        return value_buf
+        keys = [str(filepath).encode('ascii') for filepath in filepaths]
+        if self.persistent_txn:
+            if client_key not in self._txns:
+                # the transaction is created lazily, so that each dataloader worker has its own one
+                self._txns[client_key] = self._client[client_key].begin(write=False)
+            txn = self._txns[client_key]
+            return [txn.get(key) for key in keys]
+        with self._client[client_key].begin(write=False) as txn:
+            value_bufs = [txn.get(key) for key in keys]
+        return value_bufs
 
     def get_text(self, filepath):
         raise NotImplementedError
 
 
+class ShardBackend(BaseStorageBackend):
+    """Packed binary shard storage backend.
+
+    A shard database is a folder of append-only shard files, each of which
+    concatenates the encoded images, together with a compact index. See
+    :func:`basicsr.utils.lmdb_util.make_shard_from_imgs` for the layout.
+    Shard files are read through mmap, and ``get()`` returns a zero-copy
+    memoryview of the encoded image, which can be decoded by
+    :func:`basicsr.utils.imfrombytes` directly.
+
+    Args:
+        db_paths (str | list[str]): Shard database paths.
+        client_keys (str | list[str]): Shard client keys. Default: 'default'.
+
+    Attributes:
+        db_paths (list): Shard database paths.
+        _client (dict): Index and shard buffers for each client key.
+    """
+
+    def __init__(self, db_paths, client_keys='default'):
+        if isinstance(client_keys, str):
+            client_keys = [client_keys]
+
+        if isinstance(db_paths, list):
+            self.db_paths = [str(v) for v in db_paths]
+        elif isinstance(db_paths, str):
+            self.db_paths = [str(db_paths)]
+        assert len(client_keys) == len(self.db_paths), ('client_keys and db_paths should have the same length, '
+                                                        f'but received {len(client_keys)} and {len(self.db_paths)}.')
+
+        self._client = {}
+        for client, path in zip(client_keys, self.db_paths):
+            self._client[client] = self._open(path)
+
+    @staticmethod
+    def _open(path):
+        # the i-th row of the index (shard id, offset, length[, tile size]) corresponds to the i-th line of
+        # meta_info.txt, e.g., `0001_s001.png (480,480,3) 1`
+        index = np.load(osp.join(path, 'index.npy'))
+        keys, shapes = [], []
+        with open(osp.join(path, 'meta_info.txt')) as fin:
+            for line in fin:
+                name, shape = line.split(' ')[0:2]
+                keys.append(name.rsplit('.', 1)[0])
+                shapes.append(tuple(int(v) for v in shape.strip('()').split(',')))
+        assert len(keys) == index.shape[0], (f'meta_info.txt and index.npy in {path} have different lengths: '
+                                             f'{len(keys)} and {index.shape[0]}.')
+
+        shards = []
+        for shard_idx in range(int(index[:, 0].max()) + 1 if len(keys) > 0 else 0):
+            with open(osp.join(path, f'shard_{shard_idx:05d}.bin'), 'rb') as f:
+                shards.append(memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
+        entries = {key: tuple(int(v) for v in entry[0:3]) for key, entry in zip(keys, index)}
+        shapes = dict(zip(keys, shapes))
+        tile_size = int(index[0, 3]) if index.shape[1] > 3 and len(keys) > 0 else 0
+        return entries, shards, shapes, tile_size
+
+    def get(self, filepath, client_key):
+        """Get values according to the filepath from one shard database named client_key.
+
+        Args:
+            filepath (str | obj:`Path`): Here, filepath is the image key.
+            client_key (str): Used for distinguishing different shard databases.
+
+        Returns:
+            memoryview: Encoded image bytes (or encoded tiles for tiled
+                databases), backed by the mmap of the shard file.
+        """
+        filepath = str(filepath)
+        assert client_key in self._client, (f'client_key {client_key} is not in shard clients.')
+        entries, shards, _, _ = self._client[client_key]
+        shard_idx, offset, length = entries[filepath]
+        return shards[shard_idx][offset:offset + length]
+
+    def get_shape(self, filepath, client_key):
+        """Get the image shape (h, w, c) recorded in meta_info.txt, without decoding."""
+        return self._client[client_key][2][str(filepath)]
+
+    def is_tiled(self, client_key):
+        """Whether the images of client_key are stored as tiles."""
+        return self._client[client_key][3] > 0
+
+    def get_region(self, filepath, client_key, roi=None, flag='color'):
+        """Decode a region of an image, only decoding the tiles it covers.
+
+        Args:
+            filepath (str | obj:`Path`): Here, filepath is the image key.
+            client_key (str): Used for distinguishing different shard databases.
+            roi (tuple[int] | None): Region (top, left, height, width). None
+                for the whole image. Default: None.
+            flag (str): Color type, see :func:`basicsr.utils.imfrombytes`.
+                Default: 'color'.
+
+        Returns:
+            ndarray: Decoded region, uint8.
+        """
+        tile_size = self._client[client_key][3]
+        h, w = self.get_shape(filepath, client_key)[0:2]
+        top, left, height, width = (0, 0, h, w) if roi is None else roi
+        top, left = min(top, h), min(left, w)
+        bottom, right = min(top + height, h), min(left + width, w)
+        if tile_size == 0:  # whole images, decode and crop
+            return imfrombytes(self.get(filepath, client_key), flag=flag)[top:bottom, left:right, ...]
+        if bottom <= top or right <= left:  # empty region, decode the first tile for the channels and dtype
+            top, left, bottom, right = 0, 0, 1, 1
+            height = width = 0
+
+        buf = self.get(filepath, client_key)
+        num_tiles_x = (w + tile_size - 1) // tile_size
+        num_tiles = ((h + tile_size - 1) // tile_size) * num_tiles_x
+        header_size = (num_tiles + 1) * 8
+        offsets = np.frombuffer(buf[0:header_size], dtype=np.int64)
+        rows = []
+        for tile_y in range(top // tile_size, (bottom - 1) // tile_size + 1):
+            row = []
+            for tile_x in range(left // tile_size, (right - 1) // tile_size + 1):
+                tile_idx = tile_y * num_tiles_x + tile_x
+                start, end = header_size + int(offsets[tile_idx]), header_size + int(offsets[tile_idx + 1])
+                row.append(imfrombytes(buf[start:end], flag=flag))
+            rows.append(np.concatenate(row, axis=1))
+        region = np.concatenate(rows, axis=0)
+        # crop the region from the covered tiles
+        top_in, left_in = top - (top // tile_size) * tile_size, left - (left // tile_size) * tile_size
+        return region[top_in:top_in + min(bottom - top, height), left_in:left_in + min(right - left, width), ...]
+
+    def get_text(self, filepath):
+        raise NotImplementedError
+
+
+def _default_cache_dir(name):
+    """Cache folder in shared memory, shared by all the processes of the user on the node."""
+    shm_dir = '/dev/shm' if osp.isdir('/dev/shm') else tempfile.gettempdir()
+    try:
+        user = getpass.getuser()
+    except Exception:  # e.g., no user name for the uid in containers
+        user = str(os.getuid()) if hasattr(os, 'getuid') else 'default'
+    return osp.join(shm_dir, f'{name}_{user}')
+
+
+# cache folders removed at exit, see remove_decoded_caches_at_exit()
+_cache_dirs_to_remove = set()
+
+
+def _remove_cache_dirs():
+    for cache_dir in _cache_dirs_to_remove:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _remove_cache_dir_at_exit(cache_dir):
+    if not _cache_dirs_to_remove:
+        atexit.register(_remove_cache_dirs)
+    _cache_dirs_to_remove.add(cache_dir)
+
+
+def remove_decoded_caches_at_exit(io_backend_opt):
+    """Remove the decoded image and clip caches with `remove_at_exit` in
+    `io_backend_opt` when the current process exits.
+
+    The caches are usually created lazily in the dataloader workers, which do
+    not run the exit handlers, so it is called by the main process when the
+    datasets are built.
+
+    Args:
+        io_backend_opt (dict): Options of :class:`FileClient`.
+    """
+    for key, cache_cls in [('image_cache', DecodedImageCache), ('clip_cache', DecodedClipCache)]:
+        cache_opt = io_backend_opt.get(key)
+        if cache_opt and cache_opt.get('remove_at_exit', False):
+            _remove_cache_dir_at_exit(cache_opt.get('cache_dir') or _default_cache_dir(cache_cls.default_name))
+
+
+class DecodedImageCache():
+    """LRU cache of decoded uint8 images in shared memory.
+
+    Each decoded image is saved as a .npy file under `cache_dir`, which is in
+    /dev/shm (a RAM-backed file system) by default, and is read back with
+    mmap. So all the dataloader workers (and all the ranks and runs of the
+    user on the same node) share one copy of the cache, and the cached images
+    are never decoded again. Sharing the cache across runs is safe, as the
+    entries are keyed by the file paths together with their sizes and mtimes
+    (see :class:`FileClient`).
+
+    The access time of an image is recorded by its file mtime. The total size
+    of the entries is tracked in a shared counter file. When it exceeds
+    `max_size`, the folder is scanned and the least recently used images are
+    removed until the size is below 90% of `max_size`.
+
+    Args:
+        max_size (int | float): Maximum cache size in bytes.
+        cache_dir (str | None): Cache folder. If None, use
+            /dev/shm/basicsr_image_cache_{user}. Default: None.
+        remove_at_exit (bool): Remove the cache folder when the process
+            creating the cache exits. With dataloader workers, the folder is
+            removed when the main process exits, see
+            :func:`remove_decoded_caches_at_exit`. Default: False.
+    """
+
+    default_name = 'basicsr_image_cache'
+
+    def __init__(self, max_size, cache_dir=None, remove_at_exit=False):
+        self.cache_dir = _default_cache_dir(self.default_name) if cache_dir is None else cache_dir
+        self.max_size = int(max_size)
+        self.size_path = osp.join(self.cache_dir, 'size')
+        if remove_at_exit and get_worker_info() is None:  # dataloader workers do not run the exit handlers
+            _remove_cache_dir_at_exit(self.cache_dir)
+
+    def get_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return osp.join(self.cache_dir, name[:2], f'{name}.npy')
+
+    def get(self, key):
+        """Get a cached image.
+
+        Returns:
+            ndarray | None: Read-only image (memmap). None if it is not cached.
+        """
+        path = self.get_path(key)
+        try:
+            img = np.load(path, mmap_mode='r')
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, ValueError):
+            return None
+        return img
+
+    def put(self, key, img):
+        path = self.get_path(key)
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        with atomic_open(path) as f:
+            np.save(f, img)
+
+        if self._update_size(img.nbytes) > self.max_size:
+            self.evict()
+
+    def _update_size(self, nbytes, reset=False):
+        """Add nbytes to (or reset it with `reset`) the shared size counter, and return the new size."""
+        fd = os.open(self.size_path, os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)  # released by closing the file
+            size = nbytes if reset else int.from_bytes(os.read(fd, 8), 'little') + nbytes
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, size.to_bytes(8, 'little'))
+        finally:
+            os.close(fd)
+        return size
+
+    def evict(self):
+        """Remove the least recently used images if the cache is too large."""
+        entries = []
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by other processes
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_size = sum(v[1] for v in entries)
+        if total_size > self.max_size:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                if total_size <= 0.9 * self.max_size:
+                    break
+        self._update_size(total_size, reset=True)
+
+
+class DecodedClipCache(DecodedImageCache):
+    """LRU cache of decoded uint8 video clips in shared memory.
+
+    Like :class:`DecodedImageCache`, but each entry is a whole clip, saved as
+    one uint8 array with shape (t, h, w, c). The frames of a clip are decoded
+    once and shared by all the dataloader workers and ranks on the node,
+    and the clips are evicted as a whole.
+
+    A clip is decoded by only one process at a time: the others read their
+    frames directly until the clip is cached.
+
+    Args:
+        max_size (int | float): Maximum cache size in bytes.
+        cache_dir (str | None): Cache folder. If None, use
+            /dev/shm/basicsr_clip_cache_{user}. Default: None.
+        lock_timeout (float): Locks older than this (in seconds) are
+            considered stale, e.g., left by killed processes. Default: 600.
+        remove_at_exit (bool): Remove the cache folder at exit, see
+            :class:`DecodedImageCache`. Default: False.
+    """
+
+    default_name = 'basicsr_clip_cache'
+
+    def __init__(self, max_size, cache_dir=None, lock_timeout=600, remove_at_exit=False):
+        super(DecodedClipCache, self).__init__(max_size, cache_dir, remove_at_exit)
+        self.lock_timeout = lock_timeout
+
+    def try_lock(self, key):
+        """Try to lock a clip for decoding.
+
+        Returns:
+            bool: Whether the lock is acquired.
+        """
+        path = f'{self.get_path(key)}.lock'
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            try:
+                if time.time() - osp.getmtime(path) > self.lock_timeout:
+                    os.remove(path)  # stale lock, the clip is decoded at the next access
+            except FileNotFoundError:
+                pass
+            return False
+        return True
+
+    def unlock(self, key):
+        try:
+            os.remove(f'{self.get_path(key)}.lock')
+        except FileNotFoundError:
+            pass
+
+    def put(self, key, img):
+        if img.nbytes > self.max_size:  # never fits in the cache
+            return
+        super(DecodedClipCache, self).put(key, img)
+
+
+def _db_version(db_path):
+    """Version of an lmdb or shard database, from the sizes and mtimes of its files."""
+    stats = [entry.stat() for entry in os.scandir(db_path) if entry.is_file() and entry.name != 'lock.mdb']
+    return f'{sum(v.st_size for v in stats)}:{max((v.st_mtime_ns for v in stats), default=0)}'
+
+
 class FileClient(object):
     """A general file client to access files in different backend.
 
@@ -136,9 +525,18 @@ class FileClient(object):
     and return it as a binary file. it can also register other backend
     accessor with a given name and backend class.
 
-    Attributes:
+    Args:
         backend (str): The storage backend type. Options are "disk",
-            "memcached" and "lmdb".
+            "memcached", "lmdb" and "shard". Default: "disk".
+        image_cache (dict | None): Options of :class:`DecodedImageCache`.
+            If given, images read by ``get_img()`` are decoded only once and
+            cached. Default: None.
+        clip_cache (dict | None): Options of :class:`DecodedClipCache`.
+            If given, video clips read by ``get_clip_imgs()`` are decoded
+            only once and cached. Default: None.
+
+    Attributes:
+        backend (str): The storage backend type.
         client (:obj:`BaseStorageBackend`): The backend object.
     """
 
@@ -146,22 +544,190 @@ class FileClient(object):
         'disk': HardDiskBackend,
         'memcached': MemcachedBackend,
         'lmdb': LmdbBackend,
+        'shard': ShardBackend,
     }
 
-    def __init__(self, backend='disk', **kwargs):
+    def __init__(self, backend='disk', image_cache=None, clip_cache=None, **kwargs):
         if backend not in self._backends:
             raise ValueError(f'Backend {backend} is not supported. Currently supported ones'
                              f' are {list(self._backends.keys())}')
         self.backend = backend
         self.client = self._backends[backend](**kwargs)
 
+        self.image_cache = DecodedImageCache(**image_cache) if image_cache is not None else None
+        self.clip_cache = DecodedClipCache(**clip_cache) if clip_cache is not None else None
+        # keys in lmdb and shard databases are relative, so use the database paths and versions to distinguish them
+        # in the cache
+        self._cache_prefixes = {}
+        if (self.image_cache is not None or self.clip_cache is not None) and 'db_paths' in kwargs:
+            client_keys = kwargs.get('client_keys', 'default')
+            client_keys = [client_keys] if isinstance(client_keys, str) else client_keys
+            self._cache_prefixes = {
+                client_key: f'{backend}:{osp.abspath(db_path)}:{_db_version(db_path)}'
+                for client_key, db_path in zip(client_keys, self.client.db_paths)
+            }
+
+    def _cache_key(self, filepath, client_key):
+        """Key of a file in the decoded image caches, which changes when the file changes."""
+        if client_key in self._cache_prefixes:
+            return f'{self._cache_prefixes[client_key]}:{filepath}'
+        if self.backend != 'disk':
+            return f'{self.backend}:{filepath}'
+        filepath = osp.abspath(filepath)
+        stat = os.stat(filepath)
+        return f'disk:{filepath}:{stat.st_size}:{stat.st_mtime_ns}'
+
     def get(self, filepath, client_key='default'):
-        # client_key is used only for lmdb, where different fileclients have
-        # different lmdb environments.
-        if self.backend == 'lmdb':
+        # client_key is used only for lmdb and shard, where different
+        # fileclients have different databases.
+        if self.backend in ['lmdb', 'shard']:
             return self.client.get(filepath, client_key)
         else:
             return self.client.get(filepath)
 
+    def get_many(self, filepaths, client_key='default'):
+        """Get several files at once.
+
+        Backends with a ``get_many()`` api (e.g., lmdb) read them together,
+        e.g., in a single lmdb transaction.
+
+        Args:
+            filepaths (list[str | obj:`Path`]): File paths or database keys.
+            client_key (str): Client key for lmdb and shard. Default: 'default'.
+
+        Returns:
+            list: Values in the same order as filepaths.
+        """
+        if hasattr(self.client, 'get_many'):
+            return self.client.get_many(filepaths, client_key)
+        return [self.get(filepath, client_key) for filepath in filepaths]
+
+    def get_img_shape(self, filepath, client_key='default'):
+        """Get the image shape (h, w, c) without decoding the image.
+
+        Returns:
+            tuple[int] | None: Image shape. None if the backend does not support it.
+        """
+        if hasattr(self.client, 'get_shape'):
+            return self.client.get_shape(filepath, client_key)
+        return None
+
+    def supports_region(self, client_key='default'):
+        """Whether the backend can decode image regions without decoding the whole images."""
+        return hasattr(self.client, 'is_tiled') and self.client.is_tiled(client_key)
+
+    def get_img_region(self, filepath, roi, client_key='default', flag='color', float32=False):
+        """Read and decode an image region.
+
+        Only the covered tiles are decoded for tiled shard databases, see
+        :func:`basicsr.utils.lmdb_util.encode_img_tiles`. Other backends
+        decode the whole image and crop it.
+
+        Args:
+            filepath (str | obj:`Path`): File path or database key.
+            roi (tuple[int]): Region (top, left, height, width).
+            client_key (str): Client key for lmdb and shard. Default: 'default'.
+            flag (str): Color type, see :func:`basicsr.utils.imfrombytes`.
+                Default: 'color'.
+            float32 (bool): Whether to change to float32 and norm to [0, 1].
+                Default: False.
+
+        Returns:
+            ndarray: Loaded image region.
+        """
+        if self.supports_region(client_key):
+            img = self.client.get_region(filepath, client_key, roi, flag=flag)
+            return img.astype(np.float32) / 255. if float32 else img
+        top, left, height, width = roi
+        img = self.get_img(filepath, client_key, flag=flag)[top:top + height, left:left + width, ...]
+        return img.astype(np.float32) / 255. if float32 else img
+
+    def get_img(self, filepath, client_key='default', flag='color', float32=False):
+        """Read and decode an image, through the decoded image cache if enabled.
+
+        Args:
+            filepath (str | obj:`Path`): File path or database key.
+            client_key (str): Client key for lmdb and shard. Default: 'default'.
+            flag (str): Color type, see :func:`basicsr.utils.imfrombytes`.
+                Default: 'color'.
+            float32 (bool): Whether to change to float32 and norm to [0, 1].
+                Default: False.
+
+        Returns:
+            ndarray: Loaded image array.
+        """
+        return self.get_imgs([filepath], client_key, flag=flag, float32=float32)[0]
+
+    def get_imgs(self, filepaths, client_key='default', flag='color', float32=False):
+        """Read and decode several images, see ``get_img()``.
+
+        The images missing in the decoded image cache are read together by
+        ``get_many()``.
+
+        Returns:
+            list[ndarray]: Loaded image arrays.
+        """
+        if self.supports_region(client_key):  # tiled images are not cached, as decoding regions is cheap
+            imgs = [self.client.get_region(v, client_key, flag=flag) for v in filepaths]
+            return [img.astype(np.float32) / 255. for img in imgs] if float32 else imgs
+        if self.image_cache is None:
+            return [imfrombytes(v, flag=flag, float32=float32) for v in self.get_many(filepaths, client_key)]
+
+        keys = [f'{self._cache_key(v, client_key)}:{flag}' for v in filepaths]
+        imgs = [self.image_cache.get(key) for key in keys]
+        missing = [i for i, img in enumerate(imgs) if img is None]
+        if missing:
+            value_bufs = self.get_many([filepaths[i] for i in missing], client_key)
+            for i, value_buf in zip(missing, value_bufs):
+                imgs[i] = imfrombytes(value_buf, flag=flag, float32=False)
+                self.image_cache.put(keys[i], imgs[i])
+        for i, img in enumerate(imgs):
+            if float32:
+                imgs[i] = img.astype(np.float32) / 255.
+            elif i not in missing:
+                imgs[i] = np.array(img)  # the cached image is read-only
+        return imgs
+
+    def get_clip_imgs(self, filepaths, indices, client_key='default', flag='color', float32=False):
+        """Read and decode frames of a video clip, through the decoded clip cache if enabled.
+
+        With the clip cache, all the frames of the clip are decoded at the
+        first access and cached together, and the later accesses (e.g., with
+        other neighboring frames) only read the cached frames.
+
+        Args:
+            filepaths (list[str | obj:`Path`]): File paths or database keys of
+                all the frames in the clip.
+            indices (list[int]): Indices of the frames to read.
+            client_key (str): Client key for lmdb and shard. Default: 'default'.
+            flag (str): Color type, see :func:`basicsr.utils.imfrombytes`.
+                Default: 'color'.
+            float32 (bool): Whether to change to float32 and norm to [0, 1].
+                Default: False.
+
+        Returns:
+            list[ndarray]: Loaded frames in the order of indices.
+        """
+        if self.clip_cache is None:
+            return self.get_imgs([filepaths[i] for i in indices], client_key, flag=flag, float32=float32)
+
+        key = f'{self._cache_key(filepaths[0], client_key)}:{len(filepaths)}:{flag}'
+        frames = self.clip_cache.get(key)
+        if frames is None:
+            if not self.clip_cache.try_lock(key):  # decoded by another process now
+                return self.get_imgs([filepaths[i] for i in indices], client_key, flag=flag, float32=float32)
+            try:
+                frames = self.get_imgs(filepaths, client_key, flag=flag)
+                if len({img.shape for img in frames}) > 1:  # frames with different shapes are not cached
+                    imgs = [frames[i] for i in indices]
+                    return [img.astype(np.float32) / 255. for img in imgs] if float32 else imgs
+                frames = np.stack(frames)
+                self.clip_cache.put(key, frames)
+            finally:
+                self.clip_cache.unlock(key)
+        if float32:
+            return [frames[i].astype(np.float32) / 255. for i in indices]
+        return [np.array(frames[i]) for i in indices]
+
     def get_text(self, filepath):
         return self.client.get_text(filepath)
@@ -1,7 +1,12 @@
 # Modified from https://github.com/open-mmlab/mmcv/blob/master/mmcv/video/optflow.py  # noqa: E501
 import cv2
+import hashlib
 import numpy as np
 import os
+import torch
+from os import path as osp
+
+from basicsr.utils.misc import atomic_open
 
 
 def flowread(flow_path, quantize=False, concat_axis=0, *args, **kwargs):
@@ -168,3 +173,89 @@ def dequantize(arr, min_val, max_val, levels, dtype=np.float64):
     dequantized_arr = (arr + 0.5).astype(dtype) * (max_val - min_val) / levels + min_val
 
     return dequantized_arr
+
+
+class FlowCache():
+    """Disk cache of optical flows, stored as float16 ``.npy`` files.
+
+    The cache must be lossless up to the float16 rounding: quantizing the flows (e.g., with :func:`quantize_flow`)
+    clips large motions, so that the restored frames would depend on whether the flows are cached.
+
+    Flows are indexed by a pair of frame keys in the form of ``clip/frame``, and both frames should belong to the same
+    clip. The keys are placed under a namespace identifying the data and the flow network, which is set by
+    :meth:`set_identity`. The flow from ``000/00000001`` to ``000/00000000`` is saved to
+    ``cache_dir/namespace/000/00000001_00000000.npy``.
+
+    Args:
+        cache_dir (str): Cache folder.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.namespace = None
+
+    def set_identity(self, *items):
+        """Set the namespace of the cached flows from what the flows depend on.
+
+        Args:
+            items (str | dict[str, Tensor]): E.g., the LQ data root and the state dict of the flow network.
+        """
+        sha1 = hashlib.sha1()
+        for item in items:
+            if isinstance(item, dict):
+                for name, tensor in sorted(item.items()):
+                    sha1.update(name.encode('utf-8'))
+                    sha1.update(tensor.detach().float().cpu().numpy().tobytes())
+            else:
+                sha1.update(str(item).encode('utf-8'))
+            sha1.update(b'\0')
+        self.namespace = sha1.hexdigest()[:16]
+
+    def get_path(self, ref_key, supp_key):
+        assert self.namespace is not None, 'Call set_identity before using the flow cache.'
+        return osp.join(self.cache_dir, self.namespace, f'{ref_key}_{osp.basename(supp_key)}.npy')
+
+    def get(self, ref_key, supp_key):
+        """Read a cached flow.
+
+        Returns:
+            ndarray | None: Flow with shape (h, w, 2). None if it is not cached.
+        """
+        path = self.get_path(ref_key, supp_key)
+        if not osp.exists(path):
+            return None
+        return np.load(path)
+
+    def put(self, ref_key, supp_key, flow):
+        """Write a flow with shape (h, w, 2) into the cache."""
+        path = self.get_path(ref_key, supp_key)
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        with atomic_open(path) as f:
+            np.save(f, flow.astype(np.float16))
+
+    def compute(self, flow_fn, ref, supp, ref_keys, supp_keys):
+        """Compute flows from ``supp`` to ``ref``, reading from and writing to the cache.
+
+        Only the flows missing in the cache are computed by ``flow_fn``, in a single batch.
+
+        Args:
+            flow_fn (callable): Flow network, e.g., SpyNet, which takes (ref, supp) and returns flows with shape
+                (m, 2, h, w).
+            ref (Tensor): Reference frames with shape (m, c, h, w).
+            supp (Tensor): Supporting frames with shape (m, c, h, w).
+            ref_keys (list[str]): Keys of the reference frames.
+            supp_keys (list[str]): Keys of the supporting frames.
+
+        Returns:
+            Tensor: Flows with shape (m, 2, h, w).
+        """
+        flows = [self.get(ref_key, supp_key) for ref_key, supp_key in zip(ref_keys, supp_keys)]
+        missing = [i for i, flow in enumerate(flows) if flow is None]
+        if missing:
+            missing_flows = flow_fn(ref[missing], supp[missing]).permute(0, 2, 3, 1).float().cpu().numpy()
+            for i, flow in zip(missing, missing_flows):
+                self.put(ref_keys[i], supp_keys[i], flow)
+                # also use the float16 flow, so that the results do not depend on whether the flow is cached
+                flows[i] = flow.astype(np.float16)
+        flows = np.stack(flows).transpose(0, 3, 1, 2).astype(np.float32)
+        return torch.from_numpy(flows).to(ref)
@@ -4,12 +4,69 @@ import torch
 from torch.nn import functional as F
 
 
-def filter2D(img, kernel):
+# kernels with sizes >= FFT_MIN_KERNEL_SIZE are applied by FFT if they are not separable
+FFT_MIN_KERNEL_SIZE = 31
+
+
+def _separable_factors(kernel, check=True, eps=1e-5):
+    """Decompose kernels into outer products of column and row vectors.
+
+    Args:
+        kernel (Tensor): (b, k, k)
+        check (bool): Whether to check the separability, which synchronizes with the device. Default: True.
+        eps (float): Tolerance relative to the maximum absolute value of the kernels. Default: 1e-5.
+
+    Returns:
+        tuple[Tensor] | None: Column vectors (b, k) and row vectors (b, k). None if any kernel is not separable.
+    """
+    center = kernel.size(-1) // 2
+    col, row = kernel[:, :, center], kernel[:, center, :]
+    pivot = kernel[:, center, center]
+    # a separable kernel u * v^T equals K[:, c] * K[c, :] / K[c, c]
+    col = col / pivot.unsqueeze(1)
+    if not check:
+        return col, row
+    error = (kernel - col.unsqueeze(2) * row.unsqueeze(1)).abs().max()
+    if not bool((pivot.abs().min() > 0) & (error <= eps * kernel.abs().max())):
+        return None
+    return col, row
+
+
+def _filter2D_separable(img, col, row, c):
+    """Apply separable kernels to a padded image with a vertical and a horizontal 1D convolution."""
+    b, k = col.size()
+    if b == 1:
+        bc = img.size(0) * c
+        img = img.reshape(bc, 1, *img.size()[-2:])
+        img = F.conv2d(img, col.view(1, 1, k, 1))
+        return F.conv2d(img, row.view(1, 1, 1, k))
+    img = img.reshape(1, b * c, *img.size()[-2:])
+    img = F.conv2d(img, col.view(b, 1, k, 1).repeat(1, c, 1, 1).view(b * c, 1, k, 1), groups=b * c)
+    return F.conv2d(img, row.view(b, 1, 1, k).repeat(1, c, 1, 1).view(b * c, 1, 1, k), groups=b * c)
+
+
+def _filter2D_fft(img, kernel, h, w):
+    """Apply kernels to a padded image by FFT. The valid part of the circular convolution with the flipped
+    kernels equals the cross-correlation of F.conv2d."""
+    k = kernel.size(-1)
+    ph, pw = img.size()[-2:]
+    img_f = torch.fft.rfft2(img.float(), s=(ph, pw))
+    kernel_f = torch.fft.rfft2(kernel.flip(-2, -1).float().unsqueeze(1), s=(ph, pw))
+    out = torch.fft.irfft2(img_f * kernel_f, s=(ph, pw))
+    return out[:, :, k - 1:k - 1 + h, k - 1:k - 1 + w].to(img.dtype)
+
+
+def filter2D(img, kernel, separable=False):
     """PyTorch version of cv2.filter2D
 
+    Separable kernels (e.g., Gaussian kernels) are applied with two 1D convolutions. Large non-separable kernels
+    (size >= FFT_MIN_KERNEL_SIZE) are applied by FFT.
+
     Args:
         img (Tensor): (b, c, h, w)
         kernel (Tensor): (b, k, k)
+        separable (bool | None): Whether the kernels are separable. None for detecting it from the kernels, which
+            synchronizes with the device, so it is not used in the training loops. Default: False.
     """
     k = kernel.size(-1)
     b, c, h, w = img.size()
@@ -20,13 +77,19 @@ def filter2D(img, kernel):
 
     ph, pw = img.size()[-2:]
 
+    factors = None if separable is False else _separable_factors(kernel, check=separable is None)
+    if factors is not None:
+        return _filter2D_separable(img, *factors, c).view(b, c, h, w)
+    if k >= FFT_MIN_KERNEL_SIZE:
+        return _filter2D_fft(img, kernel, h, w)
+
     if kernel.size(0) == 1:
         # apply the same kernel to all batch images
-        img = img.view(b * c, 1, ph, pw)
+        img = img.reshape(b * c, 1, ph, pw)
         kernel = kernel.view(1, 1, k, k)
         return F.conv2d(img, kernel, padding=0).view(b, c, h, w)
     else:
-        img = img.view(1, b * c, ph, pw)
+        img = img.reshape(1, b * c, ph, pw)
         kernel = kernel.view(b, 1, k, k).repeat(1, c, 1, 1).view(b * c, 1, k, k)
         return F.conv2d(img, kernel, groups=b * c).view(b, c, h, w)
 
@@ -72,12 +135,13 @@ class USMSharp(torch.nn.Module):
         self.register_buffer('kernel', kernel)
 
     def forward(self, img, weight=0.5, threshold=10):
-        blur = filter2D(img, self.kernel)
+        # the Gaussian kernel is separable, so it is applied with two 1D convolutions
+        blur = filter2D(img, self.kernel, separable=True)
         residual = img - blur
 
         mask = torch.abs(residual) * 255 > threshold
         mask = mask.float()
-        soft_mask = filter2D(mask, self.kernel)
+        soft_mask = filter2D(mask, self.kernel, separable=True)
         sharp = img + weight * residual
         sharp = torch.clip(sharp, 0, 1)
         return soft_mask * sharp + (1 - soft_mask) * img
@@ -1,6 +1,11 @@
+import collections
 import cv2
 import lmdb
+import numpy as np
+import os
+import random
 import sys
+import tarfile
 from multiprocessing import Pool
 from os import path as osp
 from tqdm import tqdm
@@ -43,8 +48,9 @@ def make_lmdb_from_imgs(data_path,
 
     We use the image name without extension as the lmdb key.
 
-    If `multiprocessing_read` is True, it will read all the images to memory
-    using multiprocessing. Thus, your server needs to have enough memory.
+    If `multiprocessing_read` is True, a process pool reads and encodes the
+    images, and streams them in order to a single writer (:class:`LmdbMaker`).
+    At most a few images per process are kept in memory.
 
     Args:
         data_path (str): Data path for reading images.
@@ -54,91 +60,83 @@ def make_lmdb_from_imgs(data_path,
         batch (int): After processing batch images, lmdb commits.
             Default: 5000.
         compress_level (int): Compress level when encoding images. Default: 1.
-        multiprocessing_read (bool): Whether use multiprocessing to read all
-            the images to memory. Default: False.
+        multiprocessing_read (bool): Whether use multiprocessing to read and
+            encode the images. Default: False.
         n_thread (int): For multiprocessing.
-        map_size (int | None): Map size for lmdb env. If None, use the
-            estimated size from images. Default: None
+        map_size (int | None): Initial map size for lmdb env, which grows
+            when it is full. If None, use the estimated size from the first
+            image. Default: None
     """
 
     assert len(img_path_list) == len(keys), ('img_path_list and keys should have the same length, '
                                              f'but got {len(img_path_list)} and {len(keys)}')
     print(f'Create lmdb for {data_path}, save to {lmdb_path}...')
     print(f'Totoal images: {len(img_path_list)}')
-    if not lmdb_path.endswith('.lmdb'):
-        raise ValueError("lmdb_path must end with '.lmdb'.")
-    if osp.exists(lmdb_path):
-        print(f'Folder {lmdb_path} already exists. Exit.')
-        sys.exit(1)
-
-    if multiprocessing_read:
-        # read all the images to memory (multiprocessing)
-        dataset = {}  # use dict to keep the order for multiprocessing
-        shapes = {}
-        print(f'Read images with multiprocessing, #thread: {n_thread} ...')
-        pbar = tqdm(total=len(img_path_list), unit='image')
 
-        def callback(arg):
-            """get the image data and update pbar."""
-            key, dataset[key], shapes[key] = arg
-            pbar.update(1)
-            pbar.set_description(f'Read {key}')
-
-        pool = Pool(n_thread)
-        for path, key in zip(img_path_list, keys):
-            pool.apply_async(read_img_worker, args=(osp.join(data_path, path), key, compress_level), callback=callback)
-        pool.close()
-        pool.join()
-        pbar.close()
-        print(f'Finish reading {len(img_path_list)} images.')
-
-    # create lmdb environment
     if map_size is None:
         # obtain data size for one image
         img = cv2.imread(osp.join(data_path, img_path_list[0]), cv2.IMREAD_UNCHANGED)
         _, img_byte = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, compress_level])
         data_size_per_img = img_byte.nbytes
         print('Data size per image is: ', data_size_per_img)
-        data_size = data_size_per_img * len(img_path_list)
-        map_size = data_size * 10
-
-    env = lmdb.open(lmdb_path, map_size=map_size)
+        map_size = data_size_per_img * len(img_path_list) * 2
 
-    # write data to lmdb
-    pbar = tqdm(total=len(img_path_list), unit='chunk')
-    txn = env.begin(write=True)
-    txt_file = open(osp.join(lmdb_path, 'meta_info.txt'), 'w')
-    for idx, (path, key) in enumerate(zip(img_path_list, keys)):
+    maker = LmdbMaker(lmdb_path, map_size=map_size, batch=batch, compress_level=compress_level)
+    args = [(osp.join(data_path, path), key, compress_level) for path, key in zip(img_path_list, keys)]
+    pbar = tqdm(total=len(img_path_list), unit='image')
+    if multiprocessing_read:
+        print(f'Read images with multiprocessing, #thread: {n_thread} ...')
+        pool = Pool(n_thread)
+        results = bounded_imap(pool, read_img_worker, args, max_in_flight=n_thread * 4)
+    else:
+        pool = None
+        results = (read_img_worker(*arg) for arg in args)
+    for key, img_byte, img_shape in results:
         pbar.update(1)
         pbar.set_description(f'Write {key}')
-        key_byte = key.encode('ascii')
-        if multiprocessing_read:
-            img_byte = dataset[key]
-            h, w, c = shapes[key]
-        else:
-            _, img_byte, img_shape = read_img_worker(osp.join(data_path, path), key, compress_level)
-            h, w, c = img_shape
-
-        txn.put(key_byte, img_byte)
-        # write meta information
-        txt_file.write(f'{key}.png ({h},{w},{c}) {compress_level}\n')
-        if idx % batch == 0:
-            txn.commit()
-            txn = env.begin(write=True)
+        maker.put(img_byte, key, img_shape)
+    if pool is not None:
+        pool.close()
+        pool.join()
     pbar.close()
-    txn.commit()
-    env.close()
-    txt_file.close()
+    maker.close()
     print('\nFinish writing lmdb.')
 
 
-def read_img_worker(path, key, compress_level):
+def bounded_imap(pool, func, args, max_in_flight):
+    """Ordered ``pool.imap`` with a bounded number of tasks in flight.
+
+    Unlike ``Pool.imap``, the results waiting for a slow consumer (e.g., a
+    database writer) never pile up in memory.
+
+    Args:
+        pool (multiprocessing.Pool): Process pool.
+        func (callable): Function to apply, called as ``func(*arg)``.
+        args (iterable[tuple]): Arguments of the tasks.
+        max_in_flight (int): Maximum number of submitted tasks whose results
+            are not consumed yet.
+
+    Yields:
+        Results in the order of args.
+    """
+    in_flight = collections.deque()
+    for arg in args:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().get()
+        in_flight.append(pool.apply_async(func, arg))
+    while in_flight:
+        yield in_flight.popleft().get()
+
+
+def read_img_worker(path, key, compress_level, tile_size=0):
     """Read image worker.
 
     Args:
         path (str): Image path.
         key (str): Image key.
         compress_level (int): Compress level when encoding images.
+        tile_size (int): If positive, encode the image as tiles, see
+            :func:`encode_img_tiles`. Default: 0.
 
     Returns:
         str: Image key.
@@ -152,22 +150,61 @@ def read_img_worker(path, key, compress_level):
         c = 1
     else:
         h, w, c = img.shape
+    if tile_size > 0:
+        return (key, encode_img_tiles(img, tile_size, compress_level), (h, w, c))
     _, img_byte = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, compress_level])
     return (key, img_byte, (h, w, c))
 
 
+def encode_img_tiles(img, tile_size, compress_level=1):
+    """Encode an image as tiles, so that a region can be decoded without
+    decoding the whole image.
+
+    The image is split into tile_size x tile_size tiles in the row-major
+    order (tiles at the right and bottom borders may be smaller), and each
+    tile is encoded as png. The result starts with an int64 array of
+    (number of tiles + 1) offsets of the tiles relative to the end of the
+    array, followed by the encoded tiles.
+
+    Args:
+        img (ndarray): Image with shape (h, w) or (h, w, c).
+        tile_size (int): Tile size.
+        compress_level (int): Compress level when encoding tiles. Default: 1.
+
+    Returns:
+        bytes: Encoded tiles.
+    """
+    h, w = img.shape[0:2]
+    tiles = []
+    for top in range(0, h, tile_size):
+        for left in range(0, w, tile_size):
+            tile = img[top:top + tile_size, left:left + tile_size, ...]
+            _, tile_byte = cv2.imencode('.png', tile, [cv2.IMWRITE_PNG_COMPRESSION, compress_level])
+            tiles.append(tile_byte.tobytes())
+    offsets = np.cumsum([0] + [len(tile) for tile in tiles]).astype(np.int64)
+    return offsets.tobytes() + b''.join(tiles)
+
+
 class LmdbMaker():
     """LMDB Maker.
 
+    The images are committed every `batch` images (or `max_txn_size` bytes),
+    and the lines of meta_info.txt are written once their images are
+    committed, so an interrupted database is still consistent with its
+    meta_info.txt. When the map is full, the map size is doubled and the
+    uncommitted images are written again.
+
     Args:
         lmdb_path (str): Lmdb save path.
-        map_size (int): Map size for lmdb env. Default: 1024 ** 4, 1TB.
+        map_size (int): Initial map size for lmdb env. Default: 1024 ** 4, 1TB.
         batch (int): After processing batch images, lmdb commits.
             Default: 5000.
         compress_level (int): Compress level when encoding images. Default: 1.
+        max_txn_size (int): Also commit once the uncommitted images exceed
+            this size in bytes. Default: 1024 ** 3, 1GB.
     """
 
-    def __init__(self, lmdb_path, map_size=1024**4, batch=5000, compress_level=1):
+    def __init__(self, lmdb_path, map_size=1024**4, batch=5000, compress_level=1, max_txn_size=1024**3):
         if not lmdb_path.endswith('.lmdb'):
             raise ValueError("lmdb_path must end with '.lmdb'.")
         if osp.exists(lmdb_path):
@@ -177,23 +214,263 @@ class LmdbMaker():
         self.lmdb_path = lmdb_path
         self.batch = batch
         self.compress_level = compress_level
+        self.max_txn_size = max_txn_size
+        self.map_size = map_size
         self.env = lmdb.open(lmdb_path, map_size=map_size)
         self.txn = self.env.begin(write=True)
         self.txt_file = open(osp.join(lmdb_path, 'meta_info.txt'), 'w')
         self.counter = 0
+        # uncommitted (key, image, meta info line), written again if the map is full
+        self.pending = []
+        self.pending_size = 0
+
+    def _grow(self):
+        self.txn.abort()
+        self.map_size *= 2
+        print(f'Lmdb map is full, grow the map size to {self.map_size}.')
+        self.env.set_mapsize(self.map_size)
+        self.txn = self.env.begin(write=True)
+        for key_byte, img_byte, _ in self.pending:
+            self._put(key_byte, img_byte)
+
+    def _put(self, key_byte, img_byte):
+        while True:
+            try:
+                self.txn.put(key_byte, img_byte)
+                return
+            except lmdb.MapFullError:
+                self._grow()
+
+    def commit(self):
+        """Commit the pending images and write their meta information."""
+        while True:
+            try:
+                self.txn.commit()
+                break
+            except lmdb.MapFullError:
+                self._grow()
+        self.txt_file.writelines(line for _, _, line in self.pending)
+        self.txt_file.flush()
+        self.pending, self.pending_size = [], 0
+        self.txn = self.env.begin(write=True)
 
     def put(self, img_byte, key, img_shape):
         self.counter += 1
         key_byte = key.encode('ascii')
-        self.txn.put(key_byte, img_byte)
+        self._put(key_byte, img_byte)
         # write meta information
         h, w, c = img_shape
-        self.txt_file.write(f'{key}.png ({h},{w},{c}) {self.compress_level}\n')
-        if self.counter % self.batch == 0:
-            self.txn.commit()
-            self.txn = self.env.begin(write=True)
+        self.pending.append((key_byte, img_byte, f'{key}.png ({h},{w},{c}) {self.compress_level}\n'))
+        self.pending_size += len(img_byte)
+        if self.counter % self.batch == 0 or self.pending_size >= self.max_txn_size:
+            self.commit()
 
     def close(self):
-        self.txn.commit()
+        self.commit()
+        self.txn.abort()
         self.env.close()
         self.txt_file.close()
+
+
+def make_shard_from_imgs(data_path,
+                         shard_path,
+                         img_path_list,
+                         keys,
+                         compress_level=1,
+                         multiprocessing_read=False,
+                         n_thread=40,
+                         shard_size=1024**3,
+                         tile_size=0):
+    """Make packed binary shards from images.
+
+    Contents of a shard database. The file structure is:
+
+    ::
+
+        example.shard
+        ├── shard_00000.bin
+        ├── shard_00001.bin
+        ├── index.npy
+        ├── meta_info.txt
+
+    Each shard_xxxxx.bin concatenates the encoded images, and a new shard
+    file is started once the current one exceeds `shard_size` bytes.
+    The index.npy is an int64 array with shape (n, 3), whose i-th row records
+    the (shard id, byte offset, byte length) of the image in the i-th line of
+    meta_info.txt. The meta_info.txt has the same format as the one of lmdb,
+    see :func:`make_lmdb_from_imgs`.
+
+    If `tile_size` is positive, the images are stored as tiles (see
+    :func:`encode_img_tiles`), and index.npy has a fourth column recording
+    the tile size. Random crops then only decode the tiles they cover.
+
+    Shard databases are read by the ``shard`` io backend of
+    :class:`basicsr.utils.FileClient`, which maps the shard files to memory.
+
+    Args:
+        data_path (str): Data path for reading images.
+        shard_path (str): Shard database save path.
+        img_path_list (str): Image path list.
+        keys (str): Used for image keys.
+        compress_level (int): Compress level when encoding images. Default: 1.
+        multiprocessing_read (bool): Whether use multiprocessing to read
+            images. Images are written in order while being read, so they are
+            not kept in memory. Default: False.
+        n_thread (int): For multiprocessing.
+        shard_size (int): Maximum size of each shard file in bytes.
+            Default: 1024 ** 3, 1GB.
+        tile_size (int): Tile size. 0 for storing whole images. Default: 0.
+    """
+    assert len(img_path_list) == len(keys), ('img_path_list and keys should have the same length, '
+                                             f'but got {len(img_path_list)} and {len(keys)}')
+    print(f'Create shards for {data_path}, save to {shard_path}...')
+    print(f'Total images: {len(img_path_list)}')
+
+    maker = ShardMaker(shard_path, shard_size=shard_size, compress_level=compress_level, tile_size=tile_size)
+    args = [(osp.join(data_path, path), key, compress_level, tile_size) for path, key in zip(img_path_list, keys)]
+    pbar = tqdm(total=len(img_path_list), unit='image')
+    if multiprocessing_read:
+        print(f'Read images with multiprocessing, #thread: {n_thread} ...')
+        pool = Pool(n_thread)
+        results = bounded_imap(pool, read_img_worker, args, max_in_flight=n_thread * 4)
+    else:
+        pool = None
+        results = (read_img_worker(*arg) for arg in args)
+    for key, img_byte, img_shape in results:
+        pbar.update(1)
+        pbar.set_description(f'Write {key}')
+        maker.put(img_byte, key, img_shape)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    pbar.close()
+    maker.close()
+    print('\nFinish writing shards.')
+
+
+class ShardMaker():
+    """Shard Maker.
+
+    Images are appended to the shard files one by one. See
+    :func:`make_shard_from_imgs` for the layout of a shard database.
+
+    Args:
+        shard_path (str): Shard database save path.
+        shard_size (int): Maximum size of each shard file in bytes.
+            Default: 1024 ** 3, 1GB.
+        compress_level (int): Compress level when encoding images. Default: 1.
+        tile_size (int): Tile size of the images put into the maker, which
+            should be encoded by :func:`encode_img_tiles`. 0 for whole images.
+            Default: 0.
+    """
+
+    def __init__(self, shard_path, shard_size=1024**3, compress_level=1, tile_size=0):
+        if not shard_path.endswith('.shard'):
+            raise ValueError("shard_path must end with '.shard'.")
+        if osp.exists(shard_path):
+            print(f'Folder {shard_path} already exists. Exit.')
+            sys.exit(1)
+
+        os.makedirs(shard_path)
+        self.shard_path = shard_path
+        self.shard_size = shard_size
+        self.compress_level = compress_level
+        self.tile_size = tile_size
+        self.txt_file = open(osp.join(shard_path, 'meta_info.txt'), 'w')
+        self.index = []
+        self.shard_idx = -1
+        self.shard_file = None
+        self.offset = 0
+        self._next_shard()
+
+    def _next_shard(self):
+        if self.shard_file is not None:
+            self.shard_file.close()
+        self.shard_idx += 1
+        self.shard_file = open(osp.join(self.shard_path, f'shard_{self.shard_idx:05d}.bin'), 'wb')
+        self.offset = 0
+
+    def put(self, img_byte, key, img_shape):
+        img_byte = memoryview(img_byte).cast('B')
+        if self.offset > 0 and self.offset + img_byte.nbytes > self.shard_size:
+            self._next_shard()
+        self.shard_file.write(img_byte)
+        entry = (self.shard_idx, self.offset, img_byte.nbytes)
+        self.index.append(entry + (self.tile_size, ) if self.tile_size > 0 else entry)
+        self.offset += img_byte.nbytes
+        # write meta information
+        h, w, c = img_shape
+        self.txt_file.write(f'{key}.png ({h},{w},{c}) {self.compress_level}\n')
+
+    def close(self):
+        self.shard_file.close()
+        self.txt_file.close()
+        num_columns = 4 if self.tile_size > 0 else 3
+        np.save(osp.join(self.shard_path, 'index.npy'), np.array(self.index, dtype=np.int64).reshape(-1, num_columns))
+
+
+def make_tar_from_imgs(data_paths,
+                       tar_path,
+                       img_path_list,
+                       keys,
+                       client_keys='gt',
+                       samples_per_shard=1000,
+                       shuffle=True,
+                       seed=0):
+    """Make WebDataset-style tar shards from images.
+
+    Each sample stores the image of the same path from each of `data_paths`,
+    named `{key}.{client_key}{ext}`, e.g., `0001_s001.gt.png` and
+    `0001_s001.lq.png`. The image files are stored as they are, without
+    re-encoding. See :func:`basicsr.data.tar_util.tar_shards_from_folder`
+    for the layout of a tar shard folder.
+
+    Args:
+        data_paths (str | list[str]): Data paths for reading images.
+        tar_path (str): Folder to save tar shards.
+        img_path_list (str): Image path list, relative to each data path.
+        keys (str): Used for sample keys.
+        client_keys (str | list[str]): Names of the images from each data
+            path, e.g., ['lq', 'gt']. Default: 'gt'.
+        samples_per_shard (int): Number of samples in each shard.
+            Default: 1000.
+        shuffle (bool): Whether to shuffle the samples before writing, so
+            that neighboring samples (e.g., sub-images of the same image) are
+            spread over different shards. Default: True.
+        seed (int): Random seed for shuffling. Default: 0.
+    """
+    if isinstance(data_paths, str):
+        data_paths = [data_paths]
+    if isinstance(client_keys, str):
+        client_keys = [client_keys]
+    assert len(data_paths) == len(client_keys), ('data_paths and client_keys should have the same length, '
+                                                 f'but got {len(data_paths)} and {len(client_keys)}')
+    assert len(img_path_list) == len(keys), ('img_path_list and keys should have the same length, '
+                                             f'but got {len(img_path_list)} and {len(keys)}')
+    print(f'Create tar shards for {data_paths}, save to {tar_path}...')
+    print(f'Total samples: {len(img_path_list)}')
+    if osp.exists(tar_path):
+        print(f'Folder {tar_path} already exists. Exit.')
+        sys.exit(1)
+    os.makedirs(tar_path)
+
+    samples = list(zip(img_path_list, keys))
+    if shuffle:
+        random.Random(seed).shuffle(samples)
+
+    pbar = tqdm(total=len(samples), unit='image')
+    txt_file = open(osp.join(tar_path, 'meta_info.txt'), 'w')
+    for shard_idx, start in enumerate(range(0, len(samples), samples_per_shard)):
+        shard_name = f'shard_{shard_idx:05d}.tar'
+        with tarfile.open(osp.join(tar_path, shard_name), 'w') as tar:
+            for path, key in samples[start:start + samples_per_shard]:
+                pbar.update(1)
+                pbar.set_description(f'Write {key}')
+                ext = osp.splitext(path)[1]
+                for data_path, client_key in zip(data_paths, client_keys):
+                    tar.add(osp.join(data_path, path), arcname=f'{key}.{client_key}{ext}')
+                # write meta information
+                txt_file.write(f'{shard_name} {key}\n')
+    pbar.close()
+    txt_file.close()
+    print('\nFinish writing tar shards.')
@@ -1,8 +1,10 @@
 import numpy as np
 import os
 import random
+import threading
 import time
 import torch
+from contextlib import contextmanager
 from os import path as osp
 
 from .dist_util import master_only
@@ -34,6 +36,29 @@ def mkdir_and_rename(path):
     os.makedirs(path, exist_ok=True)
 
 
+@contextmanager
+def atomic_open(path, mode='wb'):
+    """Open a file for writing, which is written to a temporary file first and
+    moved to `path` when the writing succeeds.
+
+    The move is atomic on the same file system, so other processes (e.g.,
+    dataloader workers and other ranks) never read incomplete files.
+
+    Args:
+        path (str): File path.
+        mode (str): Mode to open the temporary file. Default: 'wb'.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if osp.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 @master_only
 def make_exp_dirs(opt):
     """Make dirs for experiments."""
@@ -5,20 +5,26 @@ import os
 import shutil
 import torch
 
-from basicsr.archs.basicvsr_arch import BasicVSR
+from basicsr.archs.basicvsr_arch import BasicVSR, iter_temporal_chunks
 from basicsr.data.data_util import read_img_seq
 from basicsr.utils.img_util import tensor2img
 
 
-def inference(imgs, imgnames, model, save_path):
+def inference(imgs_list, model, save_path, interval, overlap):
+    imgnames = [os.path.splitext(os.path.basename(img_path))[0] for img_path in imgs_list]
+
+    def read_frames(start, end):
+        return read_img_seq(imgs_list[start:end]).unsqueeze(0)
+
     with torch.no_grad():
-        outputs = model(imgs)
-    # save imgs
-    outputs = outputs.squeeze()
-    outputs = list(outputs)
-    for output, imgname in zip(outputs, imgnames):
-        output = tensor2img(output)
-        cv2.imwrite(os.path.join(save_path, f'{imgname}_BasicVSR.png'), output)
+        # read and process the sequence chunk by chunk to keep the memory constant in the number of frames
+        for start, outputs in iter_temporal_chunks(
+                model, read_frames, interval, overlap, carry_state=True, num_frames=len(imgs_list)):
+            # save imgs
+            outputs = list(outputs[0])
+            for output, imgname in zip(outputs, imgnames[start:start + len(outputs)]):
+                output = tensor2img(output)
+                cv2.imwrite(os.path.join(save_path, f'{imgname}_BasicVSR.png'), output)
 
 
 def main():
@@ -28,6 +34,7 @@ def main():
         '--input_path', type=str, default='datasets/REDS4/sharp_bicubic/000', help='input test image folder')
     parser.add_argument('--save_path', type=str, default='results/BasicVSR', help='save image path')
     parser.add_argument('--interval', type=int, default=15, help='interval size')
+    parser.add_argument('--overlap', type=int, default=2, help='number of overlapped frames between intervals')
     args = parser.parse_args()
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -52,17 +59,8 @@ def main():
 
     # load data and inference
     imgs_list = sorted(glob.glob(os.path.join(input_path, '*')))
-    num_imgs = len(imgs_list)
-    if len(imgs_list) <= args.interval:  # too many images may cause CUDA out of memory
-        imgs, imgnames = read_img_seq(imgs_list, return_imgname=True)
-        imgs = imgs.unsqueeze(0).to(device)
-        inference(imgs, imgnames, model, args.save_path)
-    else:
-        for idx in range(0, num_imgs, args.interval):
-            interval = min(args.interval, num_imgs - idx)
-            imgs, imgnames = read_img_seq(imgs_list[idx:idx + interval], return_imgname=True)
-            imgs = imgs.unsqueeze(0).to(device)
-            inference(imgs, imgnames, model, args.save_path)
+    # frames are read and moved to device chunk by chunk, a too large interval may cause CUDA out of memory
+    inference(imgs_list, model, args.save_path, args.interval, args.overlap)
 
     # delete ffmpeg output images
     if use_ffmpeg:
@@ -142,6 +142,13 @@ class Writer:
             print('You are generating video that is larger than 4K, which will be very slow due to IO speed.',
                   'We highly recommend to decrease the outscale(aka, -s).')
 
+        output_kwargs = {}
+        if args.fragmented:
+            # fragmented MP4: the moov box is written first and every fragment is appended once it is finished,
+            # so the file is playable (and can be streamed to clients) while it is still being generated
+            output_kwargs['movflags'] = 'frag_keyframe+empty_moov+default_base_moof'
+            output_kwargs['g'] = max(int(round(fps * args.fragment_duration)), 1)
+
         if audio is not None:
             self.stream_writer = (
                 ffmpeg.input('pipe:', format='rawvideo', pix_fmt='bgr24', s=f'{out_width}x{out_height}',
@@ -151,14 +158,15 @@ class Writer:
                                  pix_fmt='yuv420p',
                                  vcodec='libx264',
                                  loglevel='error',
-                                 acodec='copy').overwrite_output().run_async(
+                                 acodec='copy',
+                                 **output_kwargs).overwrite_output().run_async(
                                      pipe_stdin=True, pipe_stdout=True, cmd=args.ffmpeg_bin))
         else:
             self.stream_writer = (
                 ffmpeg.input('pipe:', format='rawvideo', pix_fmt='bgr24', s=f'{out_width}x{out_height}',
                              framerate=fps).output(
-                                 video_save_path, pix_fmt='yuv420p', vcodec='libx264',
-                                 loglevel='error').overwrite_output().run_async(
+                                 video_save_path, pix_fmt='yuv420p', vcodec='libx264', loglevel='error',
+                                 **output_kwargs).overwrite_output().run_async(
                                      pipe_stdin=True, pipe_stdout=True, cmd=args.ffmpeg_bin))
 
     def write_frame(self, frame):
@@ -315,6 +323,8 @@ def run(args):
         args.ffmpeg_bin, '-f', 'concat', '-safe', '0', '-i', f'{args.output}/{args.video_name}_vidlist.txt', '-c',
         'copy', f'{video_save_path}'
     ]
+    if args.fragmented:
+        cmd[-1:-1] = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
     print(' '.join(cmd))
     subprocess.call(cmd)
     shutil.rmtree(osp.join(args.output, f'{args.video_name}_out_tmp_videos'))
@@ -358,6 +368,15 @@ def main():
     parser.add_argument('--ffmpeg_bin', type=str, default='ffmpeg', help='The path to ffmpeg')
     parser.add_argument('--extract_frame_first', action='store_true')
     parser.add_argument('--num_process_per_gpu', type=int, default=1)
+    parser.add_argument(
+        '--fragmented',
+        action='store_true',
+        help='Write a fragmented MP4 that can be streamed while it is being generated')
+    parser.add_argument(
+        '--fragment_duration',
+        type=float,
+        default=2,
+        help='Duration (in seconds) of each fragment in --fragmented mode')
 
     parser.add_argument(
         '--alpha_upsampler',
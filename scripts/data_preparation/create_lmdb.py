@@ -2,10 +2,21 @@ import argparse
 from os import path as osp
 
 from basicsr.utils import scandir
-from basicsr.utils.lmdb_util import make_lmdb_from_imgs
+from basicsr.utils.lmdb_util import make_lmdb_from_imgs, make_shard_from_imgs, make_tar_from_imgs
 
 
-def create_lmdb_for_div2k():
+def make_db_from_imgs(backend, *args, tile_size=0, **kwargs):
+    """Make an lmdb or a shard database from images, according to backend.
+
+    tile_size is only used by shard databases.
+    """
+    if backend == 'shard':
+        make_shard_from_imgs(*args, tile_size=tile_size, **kwargs)
+    else:
+        make_lmdb_from_imgs(*args, **kwargs)
+
+
+def create_lmdb_for_div2k(backend='lmdb', tile_size=0):
     """Create lmdb files for DIV2K dataset.
 
     Usage:
@@ -18,30 +29,57 @@ def create_lmdb_for_div2k():
             * DIV2K_train_LR_bicubic/X4_sub
 
         Remember to modify opt configurations according to your settings.
+
+    Args:
+        backend (str): 'lmdb' or 'shard'. Default: 'lmdb'.
+        tile_size (int): Store the images as tiles in shard databases, so
+            that random crops only decode the tiles they cover. 0 for whole
+            images. Default: 0.
     """
     # HR images
     folder_path = 'datasets/DIV2K/DIV2K_train_HR_sub'
-    lmdb_path = 'datasets/DIV2K/DIV2K_train_HR_sub.lmdb'
+    lmdb_path = f'datasets/DIV2K/DIV2K_train_HR_sub.{backend}'
     img_path_list, keys = prepare_keys_div2k(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, tile_size=tile_size)
 
     # LRx2 images
     folder_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic/X2_sub'
-    lmdb_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic_X2_sub.lmdb'
+    lmdb_path = f'datasets/DIV2K/DIV2K_train_LR_bicubic_X2_sub.{backend}'
     img_path_list, keys = prepare_keys_div2k(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, tile_size=tile_size)
 
     # LRx3 images
     folder_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic/X3_sub'
-    lmdb_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic_X3_sub.lmdb'
+    lmdb_path = f'datasets/DIV2K/DIV2K_train_LR_bicubic_X3_sub.{backend}'
     img_path_list, keys = prepare_keys_div2k(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, tile_size=tile_size)
 
     # LRx4 images
     folder_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic/X4_sub'
-    lmdb_path = 'datasets/DIV2K/DIV2K_train_LR_bicubic_X4_sub.lmdb'
+    lmdb_path = f'datasets/DIV2K/DIV2K_train_LR_bicubic_X4_sub.{backend}'
     img_path_list, keys = prepare_keys_div2k(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, tile_size=tile_size)
+
+
+def create_tar_for_div2k():
+    """Create tar shards for DIV2K dataset.
+
+    Usage:
+        Before run this script, please run `extract_subimages.py`.
+        It creates a gt-only tar shard folder for DIV2K_train_HR_sub (e.g.,
+        for RealESRGANTarDataset), and paired tar shard folders for each
+        scale (e.g., for PairedImageTarDataset).
+
+        Remember to modify opt configurations according to your settings.
+    """
+    hr_folder_path = 'datasets/DIV2K/DIV2K_train_HR_sub'
+    img_path_list, keys = prepare_keys_div2k(hr_folder_path)
+    make_tar_from_imgs(hr_folder_path, 'datasets/DIV2K/DIV2K_train_HR_sub_tar', img_path_list, keys)
+
+    for scale in [2, 3, 4]:
+        folder_path = f'datasets/DIV2K/DIV2K_train_LR_bicubic/X{scale}_sub'
+        tar_path = f'datasets/DIV2K/DIV2K_train_X{scale}_sub_tar'
+        make_tar_from_imgs([folder_path, hr_folder_path], tar_path, img_path_list, keys, client_keys=['lq', 'gt'])
 
 
 def prepare_keys_div2k(folder_path):
@@ -61,7 +99,7 @@ def prepare_keys_div2k(folder_path):
     return img_path_list, keys
 
 
-def create_lmdb_for_reds():
+def create_lmdb_for_reds(backend='lmdb'):
     """Create lmdb files for REDS dataset.
 
     Usage:
@@ -72,18 +110,21 @@ def create_lmdb_for_reds():
             * train_sharp_bicubic
 
         Remember to modify opt configurations according to your settings.
+
+    Args:
+        backend (str): 'lmdb' or 'shard'. Default: 'lmdb'.
     """
     # train_sharp
     folder_path = 'datasets/REDS/train_sharp'
-    lmdb_path = 'datasets/REDS/train_sharp_with_val.lmdb'
+    lmdb_path = f'datasets/REDS/train_sharp_with_val.{backend}'
     img_path_list, keys = prepare_keys_reds(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
 
     # train_sharp_bicubic
     folder_path = 'datasets/REDS/train_sharp_bicubic'
-    lmdb_path = 'datasets/REDS/train_sharp_bicubic_with_val.lmdb'
+    lmdb_path = f'datasets/REDS/train_sharp_bicubic_with_val.{backend}'
     img_path_list, keys = prepare_keys_reds(folder_path)
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
 
 
 def prepare_keys_reds(folder_path):
@@ -103,25 +144,28 @@ def prepare_keys_reds(folder_path):
     return img_path_list, keys
 
 
-def create_lmdb_for_vimeo90k():
+def create_lmdb_for_vimeo90k(backend='lmdb'):
     """Create lmdb files for Vimeo90K dataset.
 
     Usage:
         Remember to modify opt configurations according to your settings.
+
+    Args:
+        backend (str): 'lmdb' or 'shard'. Default: 'lmdb'.
     """
     # GT
     folder_path = 'datasets/vimeo90k/vimeo_septuplet/sequences'
-    lmdb_path = 'datasets/vimeo90k/vimeo90k_train_GT_only4th.lmdb'
+    lmdb_path = f'datasets/vimeo90k/vimeo90k_train_GT_only4th.{backend}'
     train_list_path = 'datasets/vimeo90k/vimeo_septuplet/sep_trainlist.txt'
     img_path_list, keys = prepare_keys_vimeo90k(folder_path, train_list_path, 'gt')
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
 
     # LQ
     folder_path = 'datasets/vimeo90k/vimeo_septuplet_matlabLRx4/sequences'
-    lmdb_path = 'datasets/vimeo90k/vimeo90k_train_LR7frames.lmdb'
+    lmdb_path = f'datasets/vimeo90k/vimeo90k_train_LR7frames.{backend}'
     train_list_path = 'datasets/vimeo90k/vimeo_septuplet/sep_trainlist.txt'
     img_path_list, keys = prepare_keys_vimeo90k(folder_path, train_list_path, 'lq')
-    make_lmdb_from_imgs(folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
+    make_db_from_imgs(backend, folder_path, lmdb_path, img_path_list, keys, multiprocessing_read=True)
 
 
 def prepare_keys_vimeo90k(folder_path, train_list_path, mode):
@@ -162,13 +206,29 @@ if __name__ == '__main__':
         '--dataset',
         type=str,
         help=("Options: 'DIV2K', 'REDS', 'Vimeo90K' You may need to modify the corresponding configurations in codes."))
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default='lmdb',
+        choices=['lmdb', 'shard', 'tar'],
+        help=("Options: 'lmdb', 'shard', 'tar'. 'shard' packs the images into binary shards read through mmap. "
+              "'tar' writes WebDataset-style tar shards for iterable datasets, only for DIV2K."))
+    parser.add_argument(
+        '--tile_size',
+        type=int,
+        default=0,
+        help='Tile size of the images in shard databases, only for DIV2K. 0 for whole images.')
     args = parser.parse_args()
     dataset = args.dataset.lower()
-    if dataset == 'div2k':
-        create_lmdb_for_div2k()
+    if dataset == 'div2k' and args.backend == 'tar':
+        create_tar_for_div2k()
+    elif args.backend == 'tar':
+        raise ValueError('The tar backend only supports DIV2K.')
+    elif dataset == 'div2k':
+        create_lmdb_for_div2k(args.backend, args.tile_size)
     elif dataset == 'reds':
-        create_lmdb_for_reds()
+        create_lmdb_for_reds(args.backend)
     elif dataset == 'vimeo90k':
-        create_lmdb_for_vimeo90k()
+        create_lmdb_for_vimeo90k(args.backend)
     else:
         raise ValueError('Wrong dataset.')
@@ -0,0 +1,93 @@
+import asyncio
+import importlib.util
+import os
+import pytest
+import sys
+import time
+
+pytest.importorskip('fastapi')
+
+API_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'api', 'api_realesrgan.py')
+
+
+@pytest.fixture(scope='module')
+def api(tmp_path_factory):
+    # the api creates its log and temp folders in the working directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('api'))
+    try:
+        spec = importlib.util.spec_from_file_location('api_realesrgan', API_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def fake_video_cmd(script):
+    """A fake inference command, which runs a python script instead of the --fragmented inference."""
+
+    def build_video_cmd(*args, **kwargs):
+        assert kwargs.get('fragmented')
+        return [sys.executable, '-c', script], dict(os.environ)
+
+    return build_video_cmd
+
+
+def wait_removed(path, timeout=5):
+    start = time.time()
+    while os.path.exists(path) and time.time() - start < timeout:
+        time.sleep(0.05)
+    return not os.path.exists(path)
+
+
+def test_build_video_cmd_fragmented(api):
+    """Test function: build_video_cmd with fragmented."""
+
+    cmd, env = api.build_video_cmd('in.mp4', 'out', fragmented=True)
+    assert cmd[-1] == '--fragmented'
+    assert ',' not in env['CUDA_VISIBLE_DEVICES']
+    cmd, _ = api.build_video_cmd('in.mp4', 'out')
+    assert '--fragmented' not in cmd
+
+
+def test_stream_realesrgan_video(api, tmp_path, monkeypatch):
+    """Test function: stream_realesrgan_video with a fake --fragmented inference."""
+
+    input_path, output_dir = str(tmp_path / 'in.mp4'), str(tmp_path / 'out')
+    output_path = os.path.join(output_dir, 'in_out.mp4')
+
+    async def run(script, start_timeout=30.0, consume=True):
+        os.makedirs(output_dir, exist_ok=True)
+        open(input_path, 'wb').close()
+        monkeypatch.setattr(api, 'build_video_cmd', fake_video_cmd(script.replace('OUT', output_path)))
+        proc = await api.start_realesrgan_video_stream(input_path, output_dir, output_path, poll_interval=0.05)
+        video_stream = api.RealESRGANVideoStream(proc, input_path, output_dir, output_path, start_timeout)
+        if not consume:  # the client disconnects before the body starts
+            await asyncio.sleep(start_timeout + 0.5)
+            return proc
+        data = b''
+        async for chunk in api.stream_realesrgan_video(video_stream, chunk_size=4, poll_interval=0.05):
+            data += chunk
+        return data
+
+    # the fragments are streamed while they are written
+    script = 'import time\nf = open("OUT", "wb")\nfor i in range(3):\n    f.write(b"frag%d" % i)\n    f.flush()\n' \
+             '    time.sleep(0.1)\n'
+    assert asyncio.run(run(script)) == b'frag0frag1frag2'
+    assert wait_removed(output_dir) and wait_removed(input_path)
+
+    # failures before the first output are raised before the response starts
+    with pytest.raises(RuntimeError):
+        asyncio.run(run('import sys\nsys.exit(2)'))
+
+    # failures after the first output abort the stream
+    with pytest.raises(RuntimeError):
+        asyncio.run(run('import sys, time\nf = open("OUT", "wb")\nf.write(b"abc")\nf.flush()\ntime.sleep(0.2)\n'
+                        'sys.exit(3)'))
+    assert wait_removed(output_dir)
+
+    # the process is killed and the files are removed if the body never starts
+    proc = asyncio.run(run('import time\nopen("OUT", "wb").close()\ntime.sleep(60)', start_timeout=0.5, consume=False))
+    assert proc.returncode is not None
+    assert wait_removed(output_dir) and wait_removed(input_path)
@@ -1,6 +1,8 @@
 import torch
 
-from basicsr.archs.basicvsr_arch import BasicVSR, ConvResidualBlocks, IconVSR
+from basicsr.archs.basicvsr_arch import (BasicVSR, ConvResidualBlocks, IconVSR, iter_temporal_chunks,
+                                         temporal_chunk_forward)
+from basicsr.utils.flow_util import FlowCache
 
 
 def test_basicvsr():
@@ -13,6 +15,36 @@ def test_basicvsr():
     assert output.shape == (1, 2, 3, 256, 256)
 
 
+def test_temporal_chunk_forward():
+    """Test function: temporal_chunk_forward."""
+
+    net = BasicVSR(num_feat=12, num_block=2, spynet_path=None).cuda().eval()
+    img = torch.rand((1, 9, 3, 64, 64), dtype=torch.float32)
+    with torch.no_grad():
+        output = net(img.cuda()).cpu()
+        # the whole sequence in one chunk
+        output_chunk = temporal_chunk_forward(net, img, chunk_size=16)
+        assert torch.allclose(output_chunk, output)
+
+        for overlap in [0, 1, 2, 3]:
+            for carry_state in [False, True]:
+                output_chunk = temporal_chunk_forward(net, img, chunk_size=4, overlap=overlap, carry_state=carry_state)
+                assert output_chunk.shape == (1, 9, 3, 256, 256)
+
+        # without the backward branch, carrying the forward state is identical to the whole sequence
+        net.fusion.weight[:, :12] = 0
+        output = net(img.cuda()).cpu()
+        output_chunk = temporal_chunk_forward(net, img, chunk_size=4, overlap=2, carry_state=True)
+        assert torch.allclose(output_chunk, output, atol=1e-5)
+
+        # read the frames lazily with a function
+        output_lazy = [
+            out.cpu() for _, out in iter_temporal_chunks(
+                net, lambda start, end: img[:, start:end], 4, overlap=2, carry_state=True, num_frames=9)
+        ]
+        assert torch.allclose(torch.cat(output_lazy, dim=1), output_chunk)
+
+
 def test_convresidualblocks():
     """Test block: ConvResidualBlocks."""
 
@@ -39,3 +71,22 @@ def test_iconvsr():
     img = torch.rand((1, 8, 3, 64, 64), dtype=torch.float32).cuda()
     output = net(img)
     assert output.shape == (1, 8, 3, 256, 256)
+
+
+def test_iconvsr_flow_cache(tmp_path):
+    """Test arch: IconVSR with the flow cache."""
+
+    net = IconVSR(
+        num_feat=8, num_block=1, keyframe_stride=2, temporal_padding=2, spynet_path=None,
+        edvr_path=None).cuda().eval()
+    img = torch.rand((1, 6, 3, 64, 64), dtype=torch.float32).cuda()
+    flow_cache = FlowCache(str(tmp_path))
+    flow_cache.set_identity('lq_root', {k: v for k, v in net.state_dict().items() if k.startswith('spynet.')})
+    frame_keys = [f'000/{i:08d}' for i in range(6)]
+    with torch.no_grad():
+        output = net(img)
+        # the first run writes the flows, the second one reads them
+        output_write = net(img, flow_cache=flow_cache, frame_keys=frame_keys)
+        output_read = net(img, flow_cache=flow_cache, frame_keys=frame_keys)
+    assert torch.equal(output_write, output_read)
+    assert torch.allclose(output_read, output, atol=1e-3)
@@ -0,0 +1,91 @@
+import torch
+
+from basicsr.archs.swinir_arch import SwinIR, calculate_mask, get_attn_mask
+
+
+def test_swinir():
+    """Test arch: SwinIR."""
+
+    # model init and forward
+    net = SwinIR(
+        upscale=2, img_size=32, window_size=8, depths=[2, 2], embed_dim=12, num_heads=[2, 2], mlp_ratio=2,
+        upsampler='pixelshuffle').cuda()
+    img = torch.rand((1, 3, 32, 32), dtype=torch.float32).cuda()
+    output = net(img)
+    assert output.shape == (1, 3, 64, 64)
+
+    # ------------------ test input sizes different from img_size -------------------- #
+    net.eval()
+    with torch.no_grad():
+        output = net(img)
+        img = torch.rand((1, 3, 40, 48), dtype=torch.float32).cuda()
+        output = net(img)
+        assert output.shape == (1, 3, 80, 96)
+        # cached relative position bias
+        assert net.layers[0].residual_group.blocks[0].attn.cached_relative_position_bias is not None
+    net.train()
+    assert net.layers[0].residual_group.blocks[0].attn.cached_relative_position_bias is None
+
+
+def test_swinir_relative_position_bias_cache():
+    """Test arch: SwinIR, the cached relative position bias."""
+
+    net = SwinIR(
+        upscale=2, img_size=32, window_size=8, depths=[2], embed_dim=12, num_heads=[2], mlp_ratio=2,
+        upsampler='pixelshuffle').eval()
+    attn = net.layers[0].residual_group.blocks[0].attn
+    img = torch.rand((1, 3, 32, 32), dtype=torch.float32)
+    with torch.no_grad():
+        net(img)
+        bias = attn.cached_relative_position_bias
+        assert bias is not None
+        # eval() is called before each test image, the cache is kept
+        net.eval()
+        net(img)
+        net(img)
+        assert attn.cached_relative_position_bias is bias
+
+        # rebuilt when the table is modified in place
+        attn.relative_position_bias_table.add_(1)
+        net(img)
+        assert attn.cached_relative_position_bias is not bias
+        assert torch.allclose(attn.cached_relative_position_bias, bias + 1)
+
+        # reset when loading weights
+        net.load_state_dict(net.state_dict())
+        assert attn.cached_relative_position_bias is None
+
+
+def test_calculate_mask():
+    """Test function: calculate_mask and get_attn_mask."""
+
+    mask = calculate_mask((16, 24), window_size=8, shift_size=4)
+    assert mask.shape == (6, 64, 64)
+    assert set(mask.unique().tolist()) == {-100, 0}
+    # the first window is not affected by the cyclic shift
+    assert mask[0].abs().sum() == 0
+
+    # masks are shared by the blocks
+    assert get_attn_mask((16, 24), 8, 4, 'cpu') is get_attn_mask((16, 24), 8, 4, 'cpu')
+    assert torch.equal(get_attn_mask((16, 24), 8, 4, 'cpu'), mask)
+    assert get_attn_mask((16, 24), 8, 0, 'cpu') is None
+
+
+def test_swinir_fused_attn():
+    """Test arch: SwinIR with fused attention."""
+
+    opt = dict(
+        upscale=2, img_size=32, window_size=8, depths=[2, 2], embed_dim=12, num_heads=[2, 2], mlp_ratio=2,
+        upsampler='pixelshuffle')
+    net = SwinIR(**opt).cuda().eval()
+    net_fused = SwinIR(fused_attn=True, **opt).cuda().eval()
+    net_fused.load_state_dict(net.state_dict())
+    with torch.no_grad():
+        for size in [(32, 32), (40, 48)]:
+            img = torch.rand((2, 3, *size), dtype=torch.float32).cuda()
+            assert torch.allclose(net_fused(img), net(img), atol=1e-5)
+
+        # shifted windows run with the memory-efficient kernel, without the math fallback
+        with torch.backends.cuda.sdp_kernel(enable_flash=False, enable_math=False, enable_mem_efficient=True):
+            img = torch.rand((2, 3, 40, 48), dtype=torch.float32).cuda()
+            assert torch.allclose(net_fused(img), net(img), atol=1e-5)
@@ -0,0 +1,41 @@
+import pytest
+
+from basicsr.data.data_sampler import EnlargedSampler, FeistelPermutation
+
+
+def test_feistel_permutation():
+    """Test class: FeistelPermutation."""
+
+    for size in [1, 2, 7, 100, 1000]:
+        perm = FeistelPermutation(size, seed=3)
+        output = [perm(i) for i in range(size)]
+        assert sorted(output) == list(range(size))
+        assert [perm.inverse(x) for x in output] == list(range(size))
+
+
+@pytest.mark.parametrize('block_size', [1, 4])
+@pytest.mark.parametrize('num_replicas', [1, 2])
+def test_enlarged_sampler_resume(block_size, num_replicas):
+    """Test class: EnlargedSampler, resuming from the middle of an epoch."""
+
+    dataset = list(range(23))
+    for rank in range(num_replicas):
+        sampler = EnlargedSampler(dataset, num_replicas, rank, ratio=3, block_size=block_size, seed=5)
+        sampler.set_epoch(2)
+        indices = list(sampler)
+        assert len(indices) == len(sampler) == sampler.num_samples
+
+        for start in [0, 1, 10, sampler.num_samples - 1, sampler.num_samples]:
+            sampler.set_epoch(2, start=start)
+            # exactly the tail of the uninterrupted epoch
+            assert list(sampler) == indices[start:]
+            assert len(sampler) == sampler.num_samples - start
+
+    # the ranks cover the enlarged dataset, padded to be evenly divisible
+    indices = []
+    for rank in range(num_replicas):
+        sampler = EnlargedSampler(dataset, num_replicas, rank, ratio=3, block_size=block_size, seed=5)
+        sampler.set_epoch(2)
+        indices.extend(sampler)
+    assert len(indices) == sampler.total_size
+    assert set(indices) == set(dataset)
@@ -0,0 +1,100 @@
+import cv2
+import glob
+import numpy as np
+import os
+import pytest
+
+from basicsr.data import data_util
+from basicsr.data.data_util import IndexedPaths, paired_paths_from_folder, paths_from_folder, read_img_seq
+from basicsr.utils.file_client import DecodedClipCache
+
+
+def _write_imgs(folder, names, size):
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        cv2.imwrite(os.path.join(folder, name), np.zeros((size, size, 3), dtype=np.uint8))
+
+
+def _first_pixels(imgs):
+    return [round(v.item() * 255) for v in imgs[:, 0, 0, 0]]
+
+
+def test_paired_paths_index(tmp_path, monkeypatch):
+    """Test function: paired_paths_from_folder with index_dir."""
+
+    lq_folder, gt_folder, index_dir = str(tmp_path / 'lq'), str(tmp_path / 'gt'), str(tmp_path / 'index')
+    _write_imgs(lq_folder, ['a.png', 'b.png', 'c.png'], 4)
+    _write_imgs(gt_folder, ['a.png', 'b.png', 'c.png'], 8)
+
+    paths = paired_paths_from_folder([lq_folder, gt_folder], ['lq', 'gt'], '{}', index_dir)
+    assert isinstance(paths, IndexedPaths)
+    expected = paired_paths_from_folder([lq_folder, gt_folder], ['lq', 'gt'], '{}')
+    assert [(v['lq_path'], v['gt_path']) for v in paths] == [(v['lq_path'], v['gt_path']) for v in expected]
+    assert all(v['lq_shape'] == (4, 4, 3) for v in paths)
+    assert paths[-1] == paths[2]
+
+    # the index is reused without reading the images
+    def read_img_shape(img_path):
+        raise AssertionError('The index should be reused.')
+
+    monkeypatch.setattr(data_util, '_read_img_shape', read_img_shape)
+    assert len(paired_paths_from_folder([lq_folder, gt_folder], ['lq', 'gt'], '{}', index_dir)) == 3
+    monkeypatch.undo()
+
+    # rebuilt when the number of entries differs, even with the same folder mtime
+    stats = [os.stat(v) for v in (lq_folder, gt_folder)]
+    _write_imgs(lq_folder, ['d.png'], 4)
+    _write_imgs(gt_folder, ['d.png'], 8)
+    for folder, stat in zip((lq_folder, gt_folder), stats):
+        os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    paths = paired_paths_from_folder([lq_folder, gt_folder], ['lq', 'gt'], '{}', index_dir)
+    assert len(paths) == 4
+    assert os.path.join(os.path.abspath(gt_folder), 'd.png') in [v['gt_path'] for v in paths]
+
+    # rebuilt when the folder mtime differs
+    os.remove(os.path.join(lq_folder, 'a.png'))
+    with pytest.raises(AssertionError):
+        paired_paths_from_folder([lq_folder, gt_folder], ['lq', 'gt'], '{}', index_dir)
+
+
+def test_paths_index(tmp_path):
+    """Test function: paths_from_folder with index_dir."""
+
+    folder, index_dir = str(tmp_path / 'lq'), str(tmp_path / 'index')
+    _write_imgs(folder, ['c.png', 'a.png', 'b.png'], 4)
+    paths = paths_from_folder(folder, index_dir)
+    expected = sorted(paths_from_folder(os.path.abspath(folder)))
+    assert list(paths) == expected
+    assert paths_from_folder(folder, index_dir)[0:2] == expected[0:2]
+
+
+def test_read_img_seq(tmp_path, monkeypatch):
+    """Test function: read_img_seq with indices and the decoded clip cache."""
+
+    img_paths = []
+    for i in range(4):
+        img_paths.append(str(tmp_path / f'{i:08d}.png'))
+        cv2.imwrite(img_paths[-1], np.full((4, 4, 3), i * 50, dtype=np.uint8))
+
+    imgs, names = read_img_seq(img_paths, return_imgname=True, indices=[2, 0], num_threads=2)
+    assert imgs.shape == (2, 3, 4, 4)
+    assert names == ['00000002', '00000000']
+    assert _first_pixels(imgs) == [100, 0]
+
+    cache_dir = str(tmp_path / 'cache')
+    cache = DecodedClipCache(max_size=1024**2, cache_dir=cache_dir)
+    assert _first_pixels(read_img_seq(img_paths, indices=[3, 1], cache=cache)) == [150, 50]
+    assert len(glob.glob(os.path.join(cache_dir, '*', '*.npy'))) == 1
+
+    # the other indices are read from the cache, without decoding
+    def imread(*args, **kwargs):
+        raise AssertionError('The clip should be cached.')
+
+    monkeypatch.setattr(data_util.cv2, 'imread', imread)
+    assert _first_pixels(read_img_seq(img_paths, cache=cache)) == [0, 50, 100, 150]
+    monkeypatch.undo()
+
+    # modified images are decoded again
+    cv2.imwrite(img_paths[0], np.full((4, 4, 3), 200, dtype=np.uint8))
+    os.utime(img_paths[0], ns=(10**9, 10**9))
+    assert _first_pixels(read_img_seq(img_paths, indices=[0], cache=cache)) == [200]
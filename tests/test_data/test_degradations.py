@@ -0,0 +1,107 @@
+import numpy as np
+import random
+import torch
+
+from basicsr.data.degradations import (bivariate_generalized_Gaussian, bivariate_kernels_pt, bivariate_plateau,
+                                      circular_lowpass_kernel, circular_lowpass_kernel_pt, random_add_noise_pt,
+                                      random_degradations_pt)
+from basicsr.utils import DiffJPEG
+
+DEGRADATION_OPT = dict(
+    scale=4,
+    resize_prob=[0.2, 0.7, 0.1],
+    resize_range=[0.15, 1.5],
+    gaussian_noise_prob=0.5,
+    noise_range=[1, 30],
+    poisson_scale_range=[0.05, 3],
+    gray_noise_prob=0.4,
+    jpeg_range=[30, 95],
+    second_blur_prob=0.8,
+    resize_prob2=[0.3, 0.4, 0.3],
+    resize_range2=[0.3, 1.2],
+    gaussian_noise_prob2=0.5,
+    noise_range2=[1, 25],
+    poisson_scale_range2=[0.05, 2.5],
+    gray_noise_prob2=0.4,
+    jpeg_range2=[30, 95])
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def test_random_add_noise_pt():
+    """Test function: random_add_noise_pt, the noise type is chosen for each sample."""
+
+    # Poisson noise of black images is zero, so only the samples with Gaussian noise change
+    img = torch.zeros((64, 3, 8, 8), dtype=torch.float32)
+    torch.manual_seed(0)
+    gaussian = torch.rand(64) < 0.5
+    assert gaussian.any() and not gaussian.all()
+    torch.manual_seed(0)
+    out = random_add_noise_pt(img, gaussian_prob=0.5, sigma_range=(10, 20), clip=False)
+    assert torch.equal(out.flatten(1).abs().amax(1) > 0, gaussian)
+
+    out = random_add_noise_pt(img, gaussian_prob=1, sigma_range=(10, 20), clip=True, rounds=True)
+    assert out.min() >= 0 and (out.flatten(1).amax(1) > 0).all()
+    assert torch.equal(out, (out * 255).round() / 255)
+    assert random_add_noise_pt(img, gaussian_prob=0, clip=False).abs().max() == 0
+
+
+def test_random_degradations_pt():
+    """Test function: random_degradations_pt with groups."""
+
+    img = torch.rand((4, 3, 64, 64), dtype=torch.float32)
+    pulse = torch.zeros((4, 21, 21), dtype=torch.float32)
+    pulse[:, 10, 10] = 1
+    jpeger = DiffJPEG(differentiable=False)
+
+    _seed(0)
+    out = random_degradations_pt(img, pulse, pulse, pulse, DEGRADATION_OPT, jpeger, num_groups=2)
+    assert out.shape == (4, 3, 16, 16)
+    assert torch.equal(out, (out * 255).round() / 255)
+
+    # each group is degraded on its own, with the same random draws as the separate calls
+    _seed(0)
+    expected = torch.cat([
+        random_degradations_pt(img[0:2], pulse[0:2], pulse[0:2], pulse[0:2], DEGRADATION_OPT, jpeger),
+        random_degradations_pt(img[2:4], pulse[2:4], pulse[2:4], pulse[2:4], DEGRADATION_OPT, jpeger)
+    ])
+    assert torch.equal(out, expected)
+
+
+def test_bivariate_kernels_pt():
+    """Test function: bivariate_kernels_pt, compared with the numpy kernels."""
+
+    kernel_sizes = torch.tensor([7, 21, 13, 9])
+    sig_x = torch.tensor([0.6, 3.0, 2.2, 4.5], dtype=torch.float32)
+    sig_y = torch.tensor([0.6, 1.2, 4.1, 0.8], dtype=torch.float32)
+    theta = torch.tensor([0, 0.7, -2.1, 3.0], dtype=torch.float32)
+    beta = torch.tensor([1, 0.6, 5.0, 2.5], dtype=torch.float32)
+    plateau = torch.tensor([False, False, True, True])
+    kernels = bivariate_kernels_pt(kernel_sizes, sig_x, sig_y, theta, beta, plateau)
+    assert kernels.shape == (4, 21, 21)
+
+    for i in range(4):
+        func = bivariate_plateau if plateau[i] else bivariate_generalized_Gaussian
+        kernel = func(kernel_sizes[i].item(), sig_x[i].item(), sig_y[i].item(), theta[i].item(), beta[i].item(),
+                      isotropic=False)
+        pad_size = (21 - kernel_sizes[i].item()) // 2
+        kernel = np.pad(kernel, ((pad_size, pad_size), (pad_size, pad_size)))
+        np.testing.assert_allclose(kernels[i].numpy(), kernel, atol=1e-6)
+
+
+def test_circular_lowpass_kernel_pt():
+    """Test function: circular_lowpass_kernel_pt, compared with circular_lowpass_kernel."""
+
+    cutoff = torch.tensor([np.pi / 3, np.pi / 2, 2.5, np.pi], dtype=torch.float32)
+    kernel_sizes = torch.tensor([7, 21, 11, 15])
+    kernels = circular_lowpass_kernel_pt(cutoff, kernel_sizes)
+    assert kernels.shape == (4, 21, 21)
+
+    for i in range(4):
+        kernel = circular_lowpass_kernel(cutoff[i].item(), kernel_sizes[i].item(), pad_to=21)
+        # the numpy kernel is normalized before padding
+        np.testing.assert_allclose(kernels[i].numpy(), kernel, atol=1e-6)
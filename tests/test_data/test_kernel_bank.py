@@ -0,0 +1,130 @@
+import json
+import numpy as np
+import os
+import pytest
+import random
+import torch
+from collections import Counter
+
+from basicsr.data import kernel_bank
+from basicsr.data.kernel_bank import KernelBank, generate_kernel_bank
+from basicsr.data.realesrgan_dataset import RealESRGANProcessMixin
+
+KERNEL_OPT = dict(
+    blur_kernel_size=21,
+    kernel_list=['iso', 'aniso', 'generalized_iso', 'generalized_aniso', 'plateau_iso', 'plateau_aniso'],
+    kernel_prob=[0.45, 0.25, 0.12, 0.03, 0.12, 0.03],
+    blur_sigma=[0.2, 3],
+    betag_range=[0.5, 4],
+    betap_range=[1, 2],
+    blur_kernel_size2=21,
+    kernel_list2=['iso', 'aniso', 'generalized_iso', 'generalized_aniso', 'plateau_iso', 'plateau_aniso'],
+    kernel_prob2=[0.45, 0.25, 0.12, 0.03, 0.12, 0.03],
+    blur_sigma2=[0.2, 1.5],
+    betag_range2=[0.5, 4],
+    betap_range2=[1, 2],
+    kernel_bank=dict(num_kernels=8, seed=0))
+
+
+def _opt(bank_path, **kwargs):
+    opt = dict(KERNEL_OPT, **kwargs)
+    opt['kernel_bank'] = dict(opt['kernel_bank'], path=bank_path)
+    return opt
+
+
+def test_generate_kernel_bank(tmp_path):
+    """Test function: generate_kernel_bank."""
+
+    bank_path = str(tmp_path / 'test.kernel_bank')
+    generate_kernel_bank(bank_path, KERNEL_OPT, [7, 21], num_kernels=8)
+    with open(os.path.join(bank_path, 'meta_info.json')) as f:
+        meta_info = json.load(f)
+    assert meta_info['kernel_range'] == [7, 21] and meta_info['num_kernels'] == 8
+    assert meta_info['blur_sigma2'] == [0.2, 1.5]
+
+    for name in ['blur1', 'blur2', 'sinc', 'final_sinc']:
+        kernels = np.load(os.path.join(bank_path, f'{name}.npy'))
+        assert kernels.shape == (2, 8, 21, 21) and kernels.dtype == np.float32
+        np.testing.assert_allclose(kernels.sum(axis=(2, 3)), 1, atol=1e-5)
+        # the 7x7 kernels are zero-padded
+        padded = kernels[0].copy()
+        padded[:, 7:14, 7:14] = 0
+        assert not padded.any()
+
+    # the same seed generates the same bank, and the global random states are kept
+    same_path = str(tmp_path / 'same.kernel_bank')
+    state = random.getstate()
+    generate_kernel_bank(same_path, KERNEL_OPT, [7, 21], num_kernels=8)
+    assert random.getstate() == state
+    for name in ['blur1', 'blur2', 'sinc', 'final_sinc']:
+        assert np.array_equal(
+            np.load(os.path.join(bank_path, f'{name}.npy')), np.load(os.path.join(same_path, f'{name}.npy')))
+
+
+def test_kernel_bank_settings(tmp_path, monkeypatch):
+    """Test function: KernelBank generates the bank once, and rejects banks of other settings."""
+
+    bank_path = str(tmp_path / 'test.kernel_bank')
+    KernelBank(bank_path, _opt(bank_path), [7, 21])
+    assert os.path.exists(os.path.join(bank_path, 'meta_info.json'))
+
+    # an existing bank is reused
+    def generate(*args, **kwargs):
+        raise AssertionError('The kernel bank should be reused.')
+
+    monkeypatch.setattr(kernel_bank, 'generate_kernel_bank', generate)
+    KernelBank(bank_path, _opt(bank_path, blur_sigma=(0.2, 3)), [7, 21])
+
+    with pytest.raises(ValueError, match='blur_sigma2'):
+        KernelBank(bank_path, _opt(bank_path, blur_sigma2=[0.2, 3]), [7, 21])
+    with pytest.raises(ValueError, match='kernel sizes'):
+        KernelBank(bank_path, _opt(bank_path), [7, 9, 21])
+
+
+def test_kernel_bank_sample(tmp_path, monkeypatch):
+    """Test function: KernelBank samples the kernel sizes and types with the dataset probabilities."""
+
+    bank_path = str(tmp_path / 'test.kernel_bank')
+    bank = KernelBank(bank_path, _opt(bank_path), [7, 13, 21])
+    blur2 = np.load(os.path.join(bank_path, 'blur2.npy'))
+    kernel = bank.sample_kernel(2, sinc_prob=0)
+    assert kernel.shape == (21, 21) and kernel.dtype == torch.float32
+    assert any(np.array_equal(kernel.numpy(), v) for v in blur2.reshape(-1, 21, 21))
+
+    samples = []
+    sample = bank._sample
+
+    def record_sample(name, size_idx):
+        samples.append((name, size_idx))
+        return sample(name, size_idx)
+
+    monkeypatch.setattr(bank, '_sample', record_sample)
+    random.seed(0)
+    np.random.seed(0)
+    num_samples = 3000
+    for _ in range(num_samples):
+        bank.sample_kernel(1, sinc_prob=0.3)
+    names = Counter(name for name, _ in samples)
+    assert set(names) == {'sinc', 'blur1'}
+    assert abs(names['sinc'] / num_samples - 0.3) < 0.03
+    size_idxs = Counter(size_idx for _, size_idx in samples)
+    assert all(abs(size_idxs[i] / num_samples - 1 / 3) < 0.03 for i in range(3))
+
+    samples.clear()
+    bank.sample_final_sinc()
+    assert samples[0][0] == 'final_sinc'
+
+
+def test_kernel_bank_gpu_kernels(tmp_path):
+    """Test function: the kernel bank is not built with gpu_kernels."""
+
+    bank_path = str(tmp_path / 'test.kernel_bank')
+    opt = _opt(bank_path, sinc_prob=0.1, sinc_prob2=0.1, final_sinc_prob=0.8)
+    processor = RealESRGANProcessMixin()
+    processor.init_kernel_settings(dict(opt, gpu_kernels=True))
+    assert processor.kernel_bank is None
+    assert not os.path.exists(bank_path)
+
+    processor.init_kernel_settings(opt)
+    assert isinstance(processor.kernel_bank, KernelBank)
+    assert os.path.exists(os.path.join(bank_path, 'meta_info.json'))
@@ -0,0 +1,54 @@
+import io
+import tarfile
+
+from basicsr.data.tar_util import TarShardStream
+
+
+def make_shards(folder, num_samples, samples_per_shard):
+    shards = []
+    for start in range(0, num_samples, samples_per_shard):
+        shard = str(folder / f'shard_{len(shards):05d}.tar')
+        with tarfile.open(shard, 'w') as tar:
+            for i in range(start, min(start + samples_per_shard, num_samples)):
+                content = str(i).encode()
+                info = tarfile.TarInfo(f'{i:04d}.gt.txt')
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        shards.append(shard)
+    return shards
+
+
+def test_tar_shard_stream(tmp_path):
+    """Test class: TarShardStream."""
+
+    shards = make_shards(tmp_path, 23, 3)
+    for world_size in [1, 2]:
+        for num_workers in [1, 3]:
+            for rank in range(world_size):
+                stream = TarShardStream(shards, 23, rank, world_size, shuffle_buffer_size=4, ratio=2)
+                # each rank yields the same number of samples, split across its workers
+                assert len(stream) == 23 * 2 // world_size
+                orders = []
+                for epoch in range(2):
+                    stream.set_epoch(epoch)
+                    samples = [
+                        int(sample['gt.txt']) for worker_id in range(num_workers)
+                        for _, sample in stream.iter_samples(worker_id, num_workers)
+                    ]
+                    assert len(samples) == len(stream)
+                    orders.append(samples)
+                assert orders[0] != orders[1]
+
+
+def test_tar_shard_stream_batches(tmp_path):
+    """Test class: TarShardStream, each worker yields whole batches."""
+
+    shards = make_shards(tmp_path, 23, 3)
+    stream = TarShardStream(shards, 23, 0, 1, shuffle_buffer_size=4, ratio=2)
+    stream.set_batch_size(4)
+    assert len(stream) == 44
+    for num_workers in [1, 3, 4]:
+        counts = [len(list(stream.iter_samples(worker_id, num_workers))) for worker_id in range(num_workers)]
+        assert all(count % 4 == 0 for count in counts)
+        # the dataloader with drop_last yields len(stream) // batch_size batches
+        assert sum(counts) == len(stream)
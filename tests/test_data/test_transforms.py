@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+
+from basicsr.data import transforms
+from basicsr.data.transforms import augment, paired_random_crop, paired_random_crop_augment_pt
+
+
+def test_paired_random_crop_augment_pt(monkeypatch):
+    """Test function: paired_random_crop_augment_pt, compared with paired_random_crop and augment."""
+
+    b, scale, gt_patch_size = 64, 2, 8
+    img_gts = torch.rand((b, 3, 20, 24), dtype=torch.float32)
+    img_lqs = torch.rand((b, 3, 10, 12), dtype=torch.float32)
+    torch.manual_seed(0)
+    out_gts, out_lqs = paired_random_crop_augment_pt(img_gts, img_lqs, gt_patch_size, scale)
+    assert out_gts.shape == (b, 3, 8, 8) and out_lqs.shape == (b, 3, 4, 4)
+
+    # the same random draws as paired_random_crop_augment_pt
+    torch.manual_seed(0)
+    tops = torch.randint(0, 10 - 4 + 1, (b, 1, 1)).view(-1).tolist()
+    lefts = torch.randint(0, 12 - 4 + 1, (b, 1, 1)).view(-1).tolist()
+    flips = (torch.rand(3, b, 1, 1) < 0.5).view(3, b).t().tolist()
+    # every combination of hflip, vflip and rot90 is covered
+    assert len(set(map(tuple, flips))) == 8
+
+    for i in range(b):
+        randints = iter([tops[i], lefts[i]])
+        randoms = iter([0 if flip else 1 for flip in flips[i]])
+        monkeypatch.setattr(transforms.random, 'randint', lambda low, high: next(randints))
+        monkeypatch.setattr(transforms.random, 'random', lambda: next(randoms))
+        img_gt, img_lq = paired_random_crop(img_gts[i].permute(1, 2, 0).numpy(), img_lqs[i].permute(1, 2, 0).numpy(),
+                                            gt_patch_size, scale)
+        img_gt, img_lq = augment([np.ascontiguousarray(img_gt), np.ascontiguousarray(img_lq)])
+        assert np.array_equal(out_gts[i].permute(1, 2, 0).numpy(), img_gt)
+        assert np.array_equal(out_lqs[i].permute(1, 2, 0).numpy(), img_lq)
+        monkeypatch.undo()
+
+    # no flips and rotations when disabled
+    torch.manual_seed(0)
+    out_gts, _ = paired_random_crop_augment_pt(img_gts, img_lqs, gt_patch_size, scale, hflip=False, rotation=False)
+    for i in range(b):
+        top, left = tops[i] * scale, lefts[i] * scale
+        assert torch.equal(out_gts[i], img_gts[i, :, top:top + gt_patch_size, left:left + gt_patch_size])
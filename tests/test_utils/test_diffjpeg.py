@@ -0,0 +1,35 @@
+import torch
+from torch.nn import functional as F
+
+from basicsr.utils.diffjpeg import CompressJpeg, DeCompressJpeg, DiffJPEG, quality_to_factor
+
+
+def _diffjpeg_reference(x, quality, differentiable):
+    """JPEG compression with the separate CompressJpeg and DeCompressJpeg modules, one sample at a time."""
+    rounding = DiffJPEG(differentiable=differentiable).rounding
+    compress, decompress = CompressJpeg(rounding=rounding), DeCompressJpeg(rounding=rounding)
+    h, w = x.size()[-2:]
+    x = F.pad(x, (0, (16 - w % 16) % 16, 0, (16 - h % 16) % 16), mode='constant', value=0)
+    out = []
+    for i in range(x.size(0)):
+        factor = quality_to_factor(quality[i].item())
+        y, cb, cr = compress(x[i:i + 1], factor=factor)
+        out.append(decompress(y, cb, cr, x.size(-2), x.size(-1), factor=factor))
+    return torch.cat(out)[:, :, :h, :w]
+
+
+def test_diffjpeg():
+    """Test function: DiffJPEG, compared with CompressJpeg and DeCompressJpeg."""
+
+    torch.manual_seed(0)
+    x = torch.rand((4, 3, 40, 36), dtype=torch.float32)
+    quality = torch.tensor([30., 55., 80., 95.])
+    for differentiable in [False, True]:
+        jpeger = DiffJPEG(differentiable=differentiable)
+        out = jpeger(x, quality=quality)
+        expected = _diffjpeg_reference(x, quality, differentiable)
+        assert out.shape == x.shape
+        assert torch.allclose(out, expected, atol=1e-5)
+
+        # a float quality is the same as a tensor of equal qualities
+        assert torch.allclose(jpeger(x, quality=55), jpeger(x, quality=torch.full((4, ), 55.)), atol=1e-6)
@@ -0,0 +1,125 @@
+import cv2
+import glob
+import multiprocessing as mp
+import numpy as np
+import os
+
+from basicsr.utils.file_client import DecodedClipCache, DecodedImageCache, FileClient
+from basicsr.utils.lmdb_util import make_shard_from_imgs
+
+
+def test_decoded_image_cache(tmp_path):
+    """Test class: DecodedImageCache."""
+
+    cache = DecodedImageCache(max_size=10 * 1024, cache_dir=str(tmp_path))
+    assert cache.get('0') is None
+    for i in range(30):
+        cache.put(str(i), np.full((1024, ), i, dtype=np.uint8))
+        # distinct mtimes for the eviction order
+        os.utime(cache.get_path(str(i)), ns=(i * 10**9, i * 10**9))
+    # the oldest entries are evicted when the cache is full
+    num_entries = len(glob.glob(os.path.join(str(tmp_path), '*', '*.npy')))
+    assert 0 < num_entries < 10
+    assert cache.get('0') is None
+    assert cache.get('29')[0] == 29
+
+
+def test_decoded_image_cache_lru(tmp_path):
+    """Test class: DecodedImageCache, the recently read entries are kept."""
+
+    cache = DecodedImageCache(max_size=10 * 1024, cache_dir=str(tmp_path))
+    for i in range(9):
+        cache.put(str(i), np.full((1024, ), i, dtype=np.uint8))
+        os.utime(cache.get_path(str(i)), ns=(i * 10**9, i * 10**9))
+    # reading the oldest entry marks it as recently used
+    assert cache.get('0')[0] == 0
+    for i in range(9, 12):
+        cache.put(str(i), np.full((1024, ), i, dtype=np.uint8))
+    assert cache.get('0')[0] == 0
+    assert cache.get('1') is None
+
+
+def test_file_client_image_cache(tmp_path):
+    """Test class: FileClient with the decoded image cache."""
+
+    img_path = str(tmp_path / 'img.png')
+    cv2.imwrite(img_path, np.full((4, 4, 3), 1, dtype=np.uint8))
+    file_client = FileClient('disk', image_cache=dict(max_size=1024**2, cache_dir=str(tmp_path / 'cache')))
+    assert file_client.get_img(img_path)[0, 0, 0] == 1
+    assert file_client.get_img(img_path)[0, 0, 0] == 1
+    # modified files are decoded again
+    cv2.imwrite(img_path, np.full((4, 4, 3), 2, dtype=np.uint8))
+    os.utime(img_path, ns=(10**9, 10**9))
+    assert file_client.get_img(img_path)[0, 0, 0] == 2
+
+
+def _read_clip(cache_dir, img_paths, indices, lock_key, queue):
+    file_client = FileClient('disk', clip_cache=dict(max_size=1024**2, cache_dir=cache_dir))
+    queue.put((file_client.clip_cache.try_lock(lock_key), file_client.get_clip_imgs(img_paths, indices)))
+
+
+def test_decoded_clip_cache_processes(tmp_path):
+    """Test class: DecodedClipCache, shared by two processes."""
+
+    img_paths = []
+    for i in range(5):
+        img_paths.append(str(tmp_path / f'{i:08d}.png'))
+        cv2.imwrite(img_paths[-1], np.full((4, 4, 3), i, dtype=np.uint8))
+    cache_dir = str(tmp_path / 'cache')
+    cache = DecodedClipCache(max_size=1024**2, cache_dir=cache_dir)
+    # the lock is exclusive across processes
+    assert cache.try_lock('clip')
+
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=_read_clip, args=(cache_dir, img_paths, indices, 'clip', queue))
+        for indices in ([0, 1, 2], [4, 3])
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+    cache.unlock('clip')
+    assert cache.try_lock('clip')
+    cache.unlock('clip')
+
+    assert [locked for locked, _ in results] == [False, False]
+    frames = sorted([img[0, 0, 0] for img in imgs] for _, imgs in results)
+    assert frames == [[0, 1, 2], [4, 3]]
+    # the clip is decoded and cached only once
+    assert len(glob.glob(os.path.join(cache_dir, '*', '*.npy'))) == 1
+    assert not glob.glob(os.path.join(cache_dir, '*', '*.lock'))
+
+
+def test_file_client_img_region(tmp_path):
+    """Test method: FileClient.get_img_region, compared with the regions of the full decodes."""
+
+    data_path = str(tmp_path / 'imgs')
+    os.makedirs(data_path)
+    rng = np.random.RandomState(0)
+    keys = ['0000', '0001']
+    for key, size in zip(keys, [(50, 70), (33, 16)]):
+        cv2.imwrite(os.path.join(data_path, f'{key}.png'), rng.randint(0, 256, (*size, 3), dtype=np.uint8))
+    shard_path = str(tmp_path / 'imgs.shard')
+    make_shard_from_imgs(data_path, shard_path, [f'{key}.png' for key in keys], keys, tile_size=16)
+
+    shard_client = FileClient('shard', db_paths=shard_path, client_keys='gt')
+    disk_client = FileClient('disk')
+    assert shard_client.supports_region('gt') and not disk_client.supports_region()
+    for key in keys:
+        img_path = os.path.join(data_path, f'{key}.png')
+        img = cv2.imread(img_path)
+        h, w = img.shape[0:2]
+        assert np.array_equal(shard_client.get_img(key, 'gt'), img)
+        for _ in range(20):
+            height, width = rng.randint(1, h + 1), rng.randint(1, w + 1)
+            top, left = rng.randint(0, h - height + 1), rng.randint(0, w - width + 1)
+            roi = (top, left, height, width)
+            expected = img[top:top + height, left:left + width]
+            assert np.array_equal(shard_client.get_img_region(key, roi, 'gt'), expected)
+            assert np.array_equal(shard_client.client.get_region(key, 'gt', roi), expected)
+            assert np.array_equal(disk_client.get_img_region(img_path, roi), expected)
+            region = shard_client.get_img_region(key, roi, 'gt', float32=True)
+            assert region.dtype == np.float32 and np.allclose(region * 255, expected)
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from torch.nn import functional as F
+
+from basicsr.utils.img_process_util import FFT_MIN_KERNEL_SIZE, filter2D
+
+
+def direct_filter2D(img, kernel):
+    """Reference: reflect padding and a direct convolution for each image."""
+    k = kernel.size(-1)
+    img = F.pad(img, (k // 2, k // 2, k // 2, k // 2), mode='reflect')
+    kernel = kernel.expand(img.size(0), k, k)
+    return torch.cat([F.conv2d(x.unsqueeze(1), w.view(1, 1, k, k)).transpose(0, 1) for x, w in zip(img, kernel)])
+
+
+def gaussian_kernels(b, k):
+    kernels = []
+    for sigma in np.linspace(0.5, 4, b):
+        kernel = cv2.getGaussianKernel(k, sigma)
+        kernels.append(torch.from_numpy(np.dot(kernel, kernel.transpose())).float())
+    return torch.stack(kernels)
+
+
+@pytest.mark.parametrize('b', [1, 3])
+def test_filter2D_separable(b):
+    """Test function: filter2D with separable kernels."""
+
+    img = torch.rand((3, 3, 40, 48), dtype=torch.float32)
+    kernel = gaussian_kernels(b, 21)
+    output = direct_filter2D(img, kernel)
+    for separable in [None, True]:
+        assert torch.allclose(filter2D(img, kernel, separable=separable), output, atol=1e-5)
+    assert torch.allclose(filter2D(img, kernel, separable=False), output, atol=1e-5)
+
+
+@pytest.mark.parametrize('b', [1, 3])
+def test_filter2D_fft(b):
+    """Test function: filter2D with large non-separable kernels."""
+
+    img = torch.rand((3, 3, 40, 48), dtype=torch.float32)
+    k = FFT_MIN_KERNEL_SIZE
+    kernel = torch.rand((b, k, k), dtype=torch.float32)
+    kernel /= kernel.sum(dim=(1, 2), keepdim=True)
+    output = direct_filter2D(img, kernel)
+    for separable in [None, False]:
+        assert torch.allclose(filter2D(img, kernel, separable=separable), output, atol=1e-5)
+
+    # small non-separable kernels use the direct convolution
+    kernel = kernel[:, :21, :21]
+    assert torch.allclose(filter2D(img, kernel), direct_filter2D(img, kernel), atol=1e-5)
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+from basicsr.utils import FileClient, imfrombytes
+from basicsr.utils.lmdb_util import LmdbMaker, bounded_imap, make_lmdb_from_imgs, make_shard_from_imgs, read_img_worker
+
+
+def make_imgs(folder, num_imgs, size=(24, 40)):
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.RandomState(0)
+    img_path_list, keys = [], []
+    for i in range(num_imgs):
+        img_path_list.append(f'{i:04d}.png')
+        keys.append(f'{i:04d}')
+        cv2.imwrite(os.path.join(folder, img_path_list[-1]), rng.randint(0, 256, (*size, 3), dtype=np.uint8))
+    return img_path_list, keys
+
+
+def test_make_shard_from_imgs(tmp_path):
+    """Test function: make_shard_from_imgs, read back by FileClient('shard')."""
+
+    data_path = str(tmp_path / 'imgs')
+    img_path_list, keys = make_imgs(data_path, 10)
+    for multiprocessing_read in [False, True]:
+        shard_path = str(tmp_path / f'imgs_{multiprocessing_read}.shard')
+        # small shard files, so that the images span several shards
+        make_shard_from_imgs(
+            data_path, shard_path, img_path_list, keys, multiprocessing_read=multiprocessing_read, n_thread=2,
+            shard_size=4096)
+        assert len([v for v in os.listdir(shard_path) if v.endswith('.bin')]) > 1
+
+        file_client = FileClient('shard', db_paths=shard_path, client_keys='gt')
+        for img_path, key in zip(img_path_list, keys):
+            img = cv2.imread(os.path.join(data_path, img_path), cv2.IMREAD_UNCHANGED)
+            assert np.array_equal(imfrombytes(file_client.get(key, 'gt'), float32=False), img)
+            assert np.array_equal(file_client.get_img(key, 'gt'), img)
+            assert tuple(file_client.get_img_shape(key, 'gt')) == img.shape
+
+
+def _read_meta_info(lmdb_path):
+    with open(os.path.join(lmdb_path, 'meta_info.txt')) as fin:
+        return [line.split(' ')[0] for line in fin]
+
+
+def test_lmdb_maker(tmp_path):
+    """Test class: LmdbMaker, growing the map size and writing meta_info.txt once committed."""
+
+    data_path = str(tmp_path / 'imgs')
+    img_path_list, keys = make_imgs(data_path, 30)
+    lmdb_path = str(tmp_path / 'imgs.lmdb')
+    maker = LmdbMaker(lmdb_path, map_size=20000, batch=4)
+    for i, (img_path, key) in enumerate(zip(img_path_list, keys)):
+        _, img_byte, img_shape = read_img_worker(os.path.join(data_path, img_path), key, 1)
+        maker.put(img_byte, key, img_shape)
+        # only the lines of the committed images are written
+        assert _read_meta_info(lmdb_path) == img_path_list[:(i + 1) // 4 * 4]
+    maker.close()
+    assert maker.map_size > 20000
+    assert _read_meta_info(lmdb_path) == img_path_list
+
+    # the images written again after growing the map are all in the database
+    file_client = FileClient('lmdb', db_paths=lmdb_path, client_keys='gt')
+    for img_path, key in zip(img_path_list, keys):
+        img = cv2.imread(os.path.join(data_path, img_path), cv2.IMREAD_UNCHANGED)
+        assert np.array_equal(imfrombytes(file_client.get(key, 'gt'), float32=False), img)
+
+
+def test_make_lmdb_from_imgs(tmp_path):
+    """Test function: make_lmdb_from_imgs with a small map size."""
+
+    data_path = str(tmp_path / 'imgs')
+    img_path_list, keys = make_imgs(data_path, 30)
+    for multiprocessing_read in [False, True]:
+        lmdb_path = str(tmp_path / f'imgs_{multiprocessing_read}.lmdb')
+        make_lmdb_from_imgs(
+            data_path,
+            lmdb_path,
+            img_path_list,
+            keys,
+            batch=7,
+            multiprocessing_read=multiprocessing_read,
+            n_thread=2,
+            map_size=20000)
+        assert _read_meta_info(lmdb_path) == img_path_list
+        file_client = FileClient('lmdb', db_paths=lmdb_path, client_keys='gt')
+        for img_path, key in zip(img_path_list, keys):
+            img = cv2.imread(os.path.join(data_path, img_path), cv2.IMREAD_UNCHANGED)
+            assert np.array_equal(imfrombytes(file_client.get(key, 'gt'), float32=False), img)
+
+
+def test_bounded_imap():
+    """Test function: bounded_imap keeps the order and bounds the tasks in flight."""
+
+    submitted = []
+
+    def task(i):
+        submitted.append(i)
+        time.sleep(0.01 * (i % 3))
+        return i * 2
+
+    with ThreadPool(4) as pool:
+        for i, result in enumerate(bounded_imap(pool, task, [(i, ) for i in range(20)], max_in_flight=3)):
+            assert result == i * 2
+            # the i-th result is consumed, and at most 3 tasks are submitted after it
+            assert len(submitted) <= i + 3
@@ -0,0 +1,19 @@
+import pytest
+
+from basicsr.utils import atomic_open
+
+
+def test_atomic_open(tmp_path):
+    """Test function: atomic_open."""
+
+    path = str(tmp_path / 'a.txt')
+    with atomic_open(path, 'w') as f:
+        f.write('a')
+    # the file is kept if the writing fails
+    with pytest.raises(RuntimeError):
+        with atomic_open(path, 'w') as f:
+            f.write('b')
+            raise RuntimeError
+    with open(path) as f:
+        assert f.read() == 'a'
+    assert [v.name for v in tmp_path.iterdir()] == ['a.txt']